@@ -0,0 +1,89 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bereinigen import clean_countries, lineage_steps, print_drops, print_fallback, ready_output_path
+from einlesen import DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_BYTES, STAGES, extract_countries, raw_output_path
+from laender import resolve_countries
+from protokoll import record_steps
+from speicher import DEFAULT_FORMAT, FORMATS
+
+# --- Pfade dynamisch erstellen ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_root = os.path.join(script_dir, '..', 'data')
+results_dir = os.path.join(script_dir, '..', 'results')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datenaufbereitung für ein oder mehrere Länder")
+    parser.add_argument('--countries', nargs='+',
+                        help="Länderordner unter data/ (z. B. Germany France) oder 'all'; "
+                             "Standard: Deutschland, Frankreich, Estland")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Anzahl paralleler Prozesse (1 = sequenziell)")
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024),
+                        help="Größere Dateien werden in Abschnitte dieser Größe (MB) aufgeteilt")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Anzahl Zeilen, die gesammelt und dann in die Ausgabe geschrieben werden")
+    parser.add_argument('--format', choices=list(FORMATS), default=DEFAULT_FORMAT,
+                        help="Speicherformat der Ausgaben (csv nur noch als Export)")
+    parser.add_argument('--voll', action='store_true',
+                        help="Alle Eingabedateien neu lesen, statt nur neue oder geänderte (Manifest ignorieren)")
+    parser.add_argument('--bereinigung', action='store_true',
+                        help="Im selben Lauf direkt die Bereinigung (Schritt 02) ausführen")
+    parser.add_argument('--filter-im-stream', action='store_true',
+                        help="Filter der Bereinigung schon beim Lesen anwenden und direkt den analysebereiten "
+                             "Datensatz schreiben (ohne Rohdaten-Datei; ersetzt Schritt 02)")
+    args = parser.parse_args()
+    stage = 'ready' if args.filter_im_stream else 'raw'
+    run_cleaning = args.bereinigung and stage == 'raw'
+
+    countries = resolve_countries(args.countries, data_root)
+    print(f"--- Starte Datenaufbereitung für {', '.join(countries)} ---")
+
+    output_path = ready_output_path if stage == 'ready' else raw_output_path
+    jobs = [(country_name, os.path.join(data_root, country_name),
+             output_path(results_dir, country_name, args.format)) for country_name in countries]
+    clean_jobs = [(country_name, raw_output_path(results_dir, country_name, args.format),
+                   ready_output_path(results_dir, country_name, args.format)) for country_name in countries]
+
+    # --- Hauptverarbeitung ---
+    # Alle Länder teilen sich einen Prozess-Pool; die extrahierten Zeilen werden
+    # blockweise in Partitionen je Eingabedatei geschrieben. Unveränderte Dateien
+    # (laut Manifest) werden nicht erneut gelesen.
+    start_time = time.time()
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            counts = extract_countries(jobs, chunk_bytes=args.chunk_mb * 1024 * 1024,
+                                       batch_size=args.batch_size, pool=pool, full=args.voll, stage=stage)
+            if run_cleaning:
+                print()
+                clean_countries(clean_jobs, pool=pool)
+    else:
+        counts = extract_countries(jobs, workers=1, chunk_bytes=args.chunk_mb * 1024 * 1024,
+                                   batch_size=args.batch_size, full=args.voll, stage=stage)
+        if run_cleaning:
+            print()
+            clean_countries(clean_jobs, workers=1)
+
+    end_time = time.time()
+    if stage == 'ready':
+        # Filterschritte im Protokoll der Stichprobenreduktion vermerken (wie in 02)
+        for country_name in countries:
+            record_steps(results_dir, 'bereinigung',
+                         lineage_steps(country_name, counts[country_name]['rows_in'], counts[country_name]))
+    for country_name, output_file in [(job[0], job[2]) for job in jobs]:
+        print(f"\n--- Verarbeitung für {country_name} abgeschlossen! ---")
+        if stage == 'ready':
+            # Entfernte Zeilen je Filter, wie in der Ausgabe von 02
+            print(f"{counts[country_name]['rows_in']} Zeilen gelesen.")
+            print_drops(counts[country_name])
+            print_fallback(counts[country_name].get('date_fallback', 0))
+        print(f"Der finale Datensatz hat {counts[country_name]['rows_out']} Zeilen und {len(STAGES[stage][1])} Spalten.")
+        print(f"Gespeichert unter: {output_file}")
+    print(f"\nDauer: {end_time - start_time:.2f} Sekunden.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import os
+import time
+
+from bereinigen import clean_countries, ready_output_path
+from laender import resolve_countries
+from speicher import DEFAULT_FORMAT, FORMATS, find_dataset
+
+# --- Pfade dynamisch erstellen ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_root = os.path.join(script_dir, '..', 'data')
+# Eingabedateien sind die Ergebnisse aus dem ersten Skript
+results_dir = os.path.join(script_dir, '..', 'results')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Datenbereinigung für ein oder mehrere Länder")
+    parser.add_argument('--countries', nargs='+',
+                        help="Länder (z. B. Germany France) oder 'all'; Standard: Deutschland, Frankreich, Estland")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Anzahl parallel bereinigter Länder (1 = sequenziell)")
+    parser.add_argument('--format', choices=list(FORMATS), default=DEFAULT_FORMAT,
+                        help="Speicherformat der analysebereiten Datensätze (csv nur noch als Export)")
+    args = parser.parse_args()
+
+    countries = resolve_countries(args.countries, data_root)
+    # Eingabe ist die jeweils zuletzt geschriebene Rohdatei (Parquet, Feather oder CSV)
+    jobs = [(country_name, find_dataset(results_dir, f'{country_name.lower()}_all_tenders_raw'),
+             ready_output_path(results_dir, country_name, args.format)) for country_name in countries]
+
+    start_time = time.time()
+    clean_countries(jobs, workers=min(args.workers, len(jobs)))
+    print(f"Dauer: {time.time() - start_time:.2f} Sekunden.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,51 @@
+import argparse
+
 import pandas as pd
 import numpy as np
 import os
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
-from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
 import patsy
+import time
 import warnings
 from statsmodels.tools.sm_exceptions import HessianInversionWarning, ConvergenceWarning
 
+from kovarianz import DEFAULT_COV_TYPES, cluster_groups, cov_description, cov_label
+from laender import add_country_argument, country_term, resolve_countries
+from merkmale import DEFAULT_BATCH_SIZE, FEATURE_SCHEMA, MODEL_COLUMNS, cache_paths, load_features
+from modellablage import save_model
+from protokoll import filter_steps, record_steps
+from startwerte import START_NAME, family_params, load_start_cache, record_fit, start_values
+from speicher import apply_schema, drop_unused_categories, iter_batches
+from verteilung import KLLSketch, RunningMoments, histogram_quantile, merge_histograms
+from zaehlmodelle import (ZeroInflatedNegativeBinomialP, diagnostics, fit_glm_sparse, fit_zinb_sparse, robust_glm_cov,
+                          sparse_dmatrices, statsmodels_cov)
+
+parser = argparse.ArgumentParser(description="ZINB & GLM Analyse inkl. deskriptiver Statistik")
+add_country_argument(parser)
+parser.add_argument('--blockweise', action='store_true',
+                    help="Modellierungsdatensatz und Tabelle 3 blockweise berechnen (begrenzter Speicherbedarf)")
+parser.add_argument('--blockgroesse', type=int, default=DEFAULT_BATCH_SIZE, help="Zeilen je Block")
+parser.add_argument('--float32', action='store_true',
+                    help="Abgeleitete Merkmale als float32 laden (halber Speicher, Abweichungen in den letzten Stellen)")
+parser.add_argument('--duenn', action='store_true',
+                    help="Designmatrizen dünn besetzt (scipy.sparse) aufbauen statt dicht (für große Stichproben)")
+parser.add_argument('--cluster', nargs='+', metavar='SPALTEN',
+                    help="Cluster-robuste Standardfehler für ZINB und GLM: eine Angabe für Einweg-, zwei für "
+                         "Zweiweg-Cluster; mehrere Spalten mit ':' verbinden (z. B. country:year)")
+parser.add_argument('--kovarianz-pruefen', action='store_true',
+                    help="Robuste Kovarianz des dichten Wegs zusätzlich mit statsmodels berechnen und die Abweichung "
+                         "ausgeben (bildet die volle N x K-Matrix der Scores)")
+parser.add_argument('--kaltstart', action='store_true',
+                    help="Ab den Standard-Startwerten schätzen statt aus dem Startwert-Cache (misst die Referenz neu)")
+args = parser.parse_args()
+if args.cluster and len(args.cluster) > 2:
+    parser.error("--cluster: höchstens zwei Angaben (Zweiweg-Cluster)")
+for spec in args.cluster or []:
+    unknown = [column for column in spec.split(':') if column not in MODEL_COLUMNS]
+    if unknown:
+        parser.error(f"--cluster: unbekannte Spalte(n) {', '.join(unknown)} (verfügbar: {', '.join(MODEL_COLUMNS)})")
+
 # Warnungen unterdrücken
 warnings.simplefilter('ignore', category=HessianInversionWarning)
 warnings.simplefilter('ignore', category=ConvergenceWarning)
@@ -19,75 +57,32 @@ print("--- Starte ZINB & GLM Analyse (inkl. Deskriptiver Statistik für BA) ---"
 # Pfade setzen
 script_dir = os.path.dirname(os.path.abspath(__file__))
 base_path = os.path.join(script_dir, '..', 'results')
+countries = resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
 
 # ---------------------------------------------------------
 # 1. DATEN LADEN & URSPRUNGS-ZÄHLUNG
 # ---------------------------------------------------------
 print("Lade Daten...")
 try:
-    # Hinweis: Passe die Dateinamen ggf. an, falls sie bei dir anders heißen
-    df_de = pd.read_csv(os.path.join(base_path, 'germany_analysis_ready.csv'), low_memory=False)
-    df_fr = pd.read_csv(os.path.join(base_path, 'france_analysis_ready.csv'), low_memory=False)
-    df_ee = pd.read_csv(os.path.join(base_path, 'estonia_analysis_ready.csv'), low_memory=False)
+    # Der Modellierungsdatensatz (Bereinigung & Feature Engineering) kommt aus dem
+    # gemeinsamen Cache (merkmale.py) und wird nur bei geänderten Eingaben neu erstellt.
+    # Nur die benötigten Spalten laden; blockweise nur die der Modelle, Tabelle 3 kommt dann direkt aus dem Cache.
+    reg_df, features_meta = load_features(
+        base_path, countries, chunked=args.blockweise, batch_size=args.blockgroesse, float32=args.float32,
+        columns=MODEL_COLUMNS + ([] if args.blockweise else ['duration_days_capped', 'tender_value']))
 except FileNotFoundError:
     print("KRITISCHER FEHLER: Dateien nicht gefunden. Bitte Pfade prüfen.")
     exit()
 
-# Urspungsgrößen speichern
-n_de_raw = len(df_de)
-n_fr_raw = len(df_fr)
-n_ee_raw = len(df_ee)
-
-# Länder-Label setzen
-df_de['country'] = 'Germany'
-df_fr['country'] = 'France'
-df_ee['country'] = 'Estonia'
-
-# Zusammenfügen
-df_final = pd.concat([df_de, df_fr, df_ee], ignore_index=True)
-
-# Arbeitskopie
-reg_df = df_final.copy()
+# Urspungsgrößen (vor der Bereinigung) aus den Metadaten
+n_raw_by_country = features_meta['rows_in']
+n_total_raw = sum(n_raw_by_country[country] for country in countries)
 
 # ---------------------------------------------------------
 # 2. FEATURE ENGINEERING & BEREINIGUNG
 # ---------------------------------------------------------
-
-# A. Technische Bereinigung (Extremwerte Bids)
-reg_df = reg_df[reg_df['total_bids'] < 100]
-
-# B. Duration
-reg_df['duration_days'] = pd.to_numeric(reg_df['duration_days'], errors='coerce')
-reg_df = reg_df[reg_df['duration_days'] > 0]
-p99_dur = reg_df['duration_days'].quantile(0.99)
-# Wir nutzen für die Statistik die gecappten Werte, um Ausreißer nicht zu stark zu gewichten,
-# aber für das Verständnis sind "echte Tage" wichtig.
-reg_df['duration_days_capped'] = reg_df['duration_days'].clip(upper=p99_dur)
-
-# Z-Standardisierung für Regression
-reg_df['z_duration'] = (
-    reg_df['duration_days_capped'] - reg_df['duration_days_capped'].mean()
-) / reg_df['duration_days_capped'].std()
-
-# C. Tender Value
-reg_df['tender_value'] = pd.to_numeric(reg_df['tender_value'], errors='coerce')
-reg_df = reg_df[reg_df['tender_value'] > 0]
-reg_df['log_tender_value'] = np.log(reg_df['tender_value'])
-reg_df['z_value'] = (
-    reg_df['log_tender_value'] - reg_df['log_tender_value'].mean()
-) / reg_df['log_tender_value'].std()
-
-# D. H2 Variable (KMU Anteil)
-# Logik: Wenn Bids > 0, berechne Anteil. Wenn Bids = 0, ist Anteil NaN (nicht 0!)
-reg_df['sme_share'] = np.where(
-    reg_df['total_bids'] > 0,
-    reg_df['sme_bids'] / reg_df['total_bids'],
-    np.nan
-)
-reg_df['sme_share'] = reg_df['sme_share'].clip(0, 1)
-
-# E. Konstante für Regression
-reg_df['const'] = 1
+# Siehe merkmale.build_features: total_bids < 100, duration_days > 0 (gecappt beim p99),
+# tender_value > 0, z-standardisierte Dauer und log. Auftragswert, sme_share und const.
 
 # ---------------------------------------------------------
 # 3. FINALER STICHPROBEN-FILTER (LISTWISE DELETION)
@@ -97,7 +92,7 @@ model_vars = ['total_bids', 'z_duration', 'country', 'z_value',
               'procurement_method', 'procurement_category', 'year', 'const']
 
 # Finaler Datensatz
-df_model = reg_df.dropna(subset=model_vars).copy()
+df_model = drop_unused_categories(reg_df.dropna(subset=model_vars).copy())
 
 # Zählung pro Land im finalen Datensatz
 counts_final = df_model['country'].value_counts()
@@ -111,13 +106,14 @@ print("="*60)
 print(f"{'Land':<15} | {'Rohdaten':<10} | {'Final (Modell)':<15} | {'Verlust (%)':<10}")
 print("-" * 60)
 
-for country, n_raw in [('Germany', n_de_raw), ('France', n_fr_raw), ('Estonia', n_ee_raw)]:
+for country in countries:
+    n_raw = n_raw_by_country[country]
     n_final = counts_final.get(country, 0)
     loss_pct = ((n_raw - n_final) / n_raw) * 100
     print(f"{country:<15} | {n_raw:<10} | {n_final:<15} | {loss_pct:.1f}%")
 
 print("-" * 60)
-print(f"{'GESAMT':<15} | {n_de_raw+n_fr_raw+n_ee_raw:<10} | {len(df_model):<15} | {((len(df_final)-len(df_model))/len(df_final))*100:.1f}%")
+print(f"{'GESAMT':<15} | {n_total_raw:<10} | {len(df_model):<15} | {((n_total_raw-len(df_model))/n_total_raw)*100:.1f}%")
 print("="*60 + "\n")
 
 # ---------------------------------------------------------
@@ -131,14 +127,92 @@ print("="*60)
 def zero_share_pct(x):
     return (x == 0).mean() * 100
 
+
+def iter_model_batches(columns):
+    """Liest die Zeilen von df_model (vollständige Modellvariablen) blockweise aus dem Cache."""
+    data_path = cache_paths(base_path, features_meta['key'])[0]
+    for batch in iter_batches(data_path, batch_size=args.blockgroesse, columns=sorted(set(model_vars + columns))):
+        batch = apply_schema(batch, FEATURE_SCHEMA).dropna(subset=model_vars)
+        yield batch[columns]
+
+
+def exact_medians(sketches):
+    """
+    Exakte Mediane von tender_value je Land in einem weiteren Durchlauf: Aus der Skizze wird ein
+    Intervall um den Median bestimmt, dann werden die Werte darunter gezählt und nur die Werte im
+    Intervall gesammelt. Liegt der Median nicht im Intervall, werden alle Werte des Landes gesammelt.
+    """
+    bounds = {}
+    for country, sketch in sketches.items():
+        margin = 2 * sketch.rank_error
+        bounds[country] = (-np.inf, np.inf) if sketch.exact else (sketch.quantile(max(0.5 - margin, 0)),
+                                                                  sketch.quantile(min(0.5 + margin, 1)))
+    medians = {}
+    while bounds:
+        below = dict.fromkeys(bounds, 0)
+        inside = {country: [] for country in bounds}
+        for batch in iter_model_batches(['country', 'tender_value']):
+            for country, group in batch.groupby('country', observed=True):
+                if country not in bounds:
+                    continue
+                values = group['tender_value'].dropna().to_numpy(dtype='float64')
+                low, high = bounds[country]
+                below[country] += int((values < low).sum())
+                inside[country].append(values[(values >= low) & (values <= high)])
+
+        for country in list(bounds):
+            values = np.sort(np.concatenate(inside[country]))
+            # Positionen wie pandas.Series.median (Mittel der beiden mittleren Werte bei gerader Anzahl)
+            n = sketches[country].n
+            lower, upper = (n - 1) // 2 - below[country], n // 2 - below[country]
+            if 0 <= lower and upper < len(values):
+                medians[country] = (values[lower] + values[upper]) / 2
+                del bounds[country]
+            else:
+                bounds[country] = (-np.inf, np.inf)
+    return medians
+
+
+def desc_stats_chunked():
+    """
+    Tabelle 3 blockweise: Mittelwerte und SD über zusammengeführte Momente, Nullanteil über Zähler,
+    Median der Dauer exakt aus dem Histogramm, Median des Auftragswerts exakt über exact_medians.
+    """
+    moments, histograms, zeros, sketches = {}, {}, {}, {}
+    for batch in iter_model_batches(['country', 'duration_days_capped', 'total_bids', 'sme_share', 'tender_value']):
+        for country, group in batch.groupby('country', observed=True):
+            country_moments = moments.setdefault(country, {col: RunningMoments() for col in
+                                                           ['duration_days_capped', 'total_bids', 'sme_share']})
+            for col, running in country_moments.items():
+                running.update(group[col].to_numpy(dtype='float64'))
+            counts = group['duration_days_capped'].value_counts()
+            histograms[country] = merge_histograms([histograms.get(country, {}), counts.to_dict()])
+            zeros[country] = zeros.get(country, 0) + int((group['total_bids'] == 0).sum())
+            sketches.setdefault(country, KLLSketch()).update(group['tender_value'].dropna())
+
+    medians = exact_medians(sketches)
+    rows = {}
+    for country in sorted(moments):
+        duration, bids, sme = (moments[country][col] for col in ['duration_days_capped', 'total_bids', 'sme_share'])
+        rows[country] = [duration.mean, duration.std, histogram_quantile(histograms[country], 0.5),
+                         bids.mean, bids.std, zeros[country] / bids.count * 100,
+                         sme.mean, sme.std, medians[country]]
+    stats = pd.DataFrame.from_dict(rows, orient='index')
+    stats.index = pd.CategoricalIndex(stats.index, categories=df_model['country'].cat.categories, name='country')
+    return stats
+
+
 # Aggregation der Statistiken nach Land
 # Wir nutzen duration_days_capped für die Statistik, da dies robuster ist
-desc_stats = df_model.groupby('country').agg({
-    'duration_days_capped': ['mean', 'std', 'median'],
-    'total_bids': ['mean', 'std', zero_share_pct],
-    'sme_share': ['mean', 'std'], # Ignoriert automatisch NaNs (also Fälle mit 0 Geboten)
-    'tender_value': ['median']
-})
+if args.blockweise:
+    desc_stats = desc_stats_chunked()
+else:
+    desc_stats = df_model.groupby('country', observed=True).agg({
+        'duration_days_capped': ['mean', 'std', 'median'],
+        'total_bids': ['mean', 'std', zero_share_pct],
+        'sme_share': ['mean', 'std'], # Ignoriert automatisch NaNs (also Fälle mit 0 Geboten)
+        'tender_value': ['median']
+    })
 
 # Umbenennen für Lesbarkeit
 desc_stats.columns = [
@@ -149,7 +223,7 @@ desc_stats.columns = [
 ]
 
 # Transponieren für bessere Lesbarkeit im Terminal
-print(desc_stats.round(2).T)
+print(desc_stats.astype('float64').round(2).T)
 print("-" * 60)
 print("HINWEIS: Übertrage diese Werte in deine LaTeX Tabelle 3.")
 print("="*60 + "\n")
@@ -161,30 +235,77 @@ print("="*60 + "\n")
 
 # MODELL 1: ZINB (H1 & H3 - Wettbewerb)
 print("MODELL 1: ZINB (total_bids)")
-# Referenzkategorie Estland, Interaktionen für DE und FR
+# Referenzkategorie laut Länderregister (Estland), Interaktionen für die übrigen Länder
 count_formula = (
-    "total_bids ~ z_duration * C(country, Treatment('Estonia')) + "
+    f"total_bids ~ z_duration * {country_term(countries)} + "
     "z_value + C(procurement_method) + C(procurement_category) + C(year)"
 )
-y_count, X_count = patsy.dmatrices(count_formula, data=df_model, return_type='dataframe')
 X_infl = df_model[['const']]
 
-zinb_model_instance = ZeroInflatedNegativeBinomialP(
-    endog=y_count, exog=X_count, exog_infl=X_infl, inflation='logit'
-)
+# Standardfehler: ohne --cluster modellbasiert (ZINB) bzw. HC0 (GLM), sonst geclustert; robuste Varianten
+# in beiden Wegen blockweise (kovarianz.py), statsmodels nur zur Kontrolle (--kovarianz-pruefen)
+if args.cluster:
+    count_cov = {'cov_type': 'cluster', 'cov_kwds': {'groups': cluster_groups(df_model, args.cluster)}}
+    print(f"Standardfehler: {cov_description('cluster', count_cov['cov_kwds']['groups'])} nach "
+          f"{' und '.join(args.cluster)}")
+else:
+    count_cov = {'cov_type': DEFAULT_COV_TYPES['zinb'], 'cov_kwds': None}
+
+
+def check_cov(result, cov):
+    """Vergleicht die blockweise Kovarianz eines dichten Modells mit der von statsmodels (--kovarianz-pruefen)."""
+    if not args.kovarianz_pruefen or args.duenn or cov['cov_type'] == 'nonrobust':
+        return
+    # Kovarianzen statt Standardfehler vergleichen (Zweiweg-Cluster kann negative Varianzen liefern)
+    cov_sm = statsmodels_cov(result, cov['cov_type'], cov['cov_kwds'])
+    deviation = np.abs(np.asarray(result.cov_params()) - cov_sm).max() / np.abs(cov_sm).max()
+    print(f"Kontrolle statsmodels ({cov['cov_type']}): max. Abweichung der Kovarianz {deviation:.1e} (relativ)")
+
+
+# Startwerte aus dem Startwert-Cache (startwerte.py): zuletzt konvergierte Koeffizienten je Spaltenname
+start_cache = load_start_cache(base_path)
+zinb_seed = None if args.kaltstart else family_params(start_cache, 'zinb')
+glm_seed = None if args.kaltstart else family_params(start_cache, 'glm')
 
 try:
     print("Berechne ZINB (kann kurz dauern)...")
-    res_nm = zinb_model_instance.fit(maxiter=10000, method='nm', disp=0)
-    zinb_result = zinb_model_instance.fit(maxiter=10000, method='bfgs', start_params=res_nm.params, disp=0)
+    start_time = time.time()
+    if args.duenn:
+        # Dummy-Blöcke dünn besetzt, kein dichtes N x K-Design
+        y_count, X_count, count_design = sparse_dmatrices(count_formula, df_model)
+        zinb_start = start_values(zinb_seed, ['inflate_const'] + count_design.column_names + ['alpha'])
+        zinb_result = fit_zinb_sparse(y_count, X_count, X_infl.to_numpy(dtype='float64'), count_design,
+                                      start_params=zinb_start, start_name=START_NAME, **count_cov)
+    else:
+        y_count, X_count = patsy.dmatrices(count_formula, data=df_model, return_type='dataframe')
+        zinb_model_instance = ZeroInflatedNegativeBinomialP(
+            endog=y_count, exog=X_count, exog_infl=X_infl, inflation='logit'
+        )
+        # Newton-Verfahren mit analytischer Hesse-Matrix; ohne Cache Startwerte aus Poisson/NB2 (statt NM + BFGS)
+        zinb_start = start_values(zinb_seed, zinb_model_instance.exog_names)
+        zinb_result = zinb_model_instance.fit_newton(start_params=zinb_start, start_name=START_NAME, **count_cov)
+    zinb_seconds = time.time() - start_time
     print(zinb_result.summary())
+    print(diagnostics(zinb_result))
+    check_cov(zinb_result, count_cov)
+    print(record_fit(base_path, 'zinb', 'zinb', zinb_result, zinb_seconds, cold=zinb_start is None))
+    # Modellartefakt für 06 und weitere Verbraucher (Vorhersage ohne erneute Schätzung)
+    # Eigenes Artefakt je Kovarianz: 04 und 06 laden nur das mit den Standard-Standardfehlern
+    saved = save_model(base_path, 'zinb', count_formula, zinb_result, df_model, features_meta, infl_columns=['const'],
+                       cov=cov_label(count_cov['cov_type'], args.cluster))
+    print(f"Modellartefakt gespeichert: modelle/zinb_{saved.key}.json")
 except Exception as e:
     print(f"Fehler ZINB: {e}")
 
 # MODELL 2: GLM (H2 & H3 - KMU Anteil)
 print("\nMODELL 2: Fractional Logit (sme_share)")
 # Filtern auf erfolgreiche Ausschreibungen (Gebote > 0)
-df_model_h2 = df_model.dropna(subset=['sme_share']).copy()
+df_model_h2 = drop_unused_categories(df_model.dropna(subset=['sme_share']).copy())
+
+# Stichproben von H1 und H2 im Protokoll der Stichprobenreduktion vermerken
+record_steps(base_path, 'analyse',
+             filter_steps('Modellvariablen vollständig (H1)', reg_df, df_model)
+             + filter_steps('sme_share vorhanden (H2)', df_model, df_model_h2))
 
 # Epsilon-Korrektur für Fractional Logit (0/1 Ränder)
 epsilon = 1e-6
@@ -193,17 +314,35 @@ df_model_h2['sme_share_safe'] = df_model_h2['sme_share'].clip(epsilon, 1-epsilon
 print(f"Stichprobe GLM (nur Ausschreibungen mit Geboten): {len(df_model_h2)}")
 
 glm_formula = (
-    "sme_share_safe ~ z_duration * C(country, Treatment('Estonia')) + "
+    f"sme_share_safe ~ z_duration * {country_term(countries)} + "
     "z_value + C(procurement_method) + C(procurement_category) + C(year)"
 )
+glm_cov = ({'cov_type': 'cluster', 'cov_kwds': {'groups': cluster_groups(df_model_h2, args.cluster)}} if args.cluster
+           else {'cov_type': DEFAULT_COV_TYPES['glm'], 'cov_kwds': None})
 
 try:
-    glm_model = smf.glm(
-        formula=glm_formula,
-        data=df_model_h2,
-        family=sm.families.Binomial(link=sm.families.links.logit())
-    ).fit(cov_type='HC0')
+    start_time = time.time()
+    if args.duenn:
+        y_glm, X_glm, glm_design = sparse_dmatrices(glm_formula, df_model_h2)
+        glm_start = start_values(glm_seed, glm_design.column_names)
+        glm_model = fit_glm_sparse(y_glm, X_glm, glm_design, start_params=glm_start, start_name=START_NAME,
+                                   **glm_cov)
+    else:
+        glm_instance = smf.glm(
+            formula=glm_formula,
+            data=df_model_h2,
+            family=sm.families.Binomial(link=sm.families.links.logit())
+        )
+        glm_start = start_values(glm_seed, glm_instance.exog_names)
+        # IRLS mit modellbasierter Kovarianz, die robuste danach blockweise
+        glm_model = robust_glm_cov(glm_instance.fit(start_params=glm_start), **glm_cov)
+    glm_seconds = time.time() - start_time
     print(glm_model.summary())
+    check_cov(glm_model, glm_cov)
+    print(record_fit(base_path, 'glm', 'glm', glm_model, glm_seconds, cold=glm_start is None))
+    saved = save_model(base_path, 'glm', glm_formula, glm_model, df_model_h2, features_meta,
+                       cov=cov_label(glm_cov['cov_type'], args.cluster))
+    print(f"Modellartefakt gespeichert: modelle/glm_{saved.key}.json")
 except Exception as e:
     print(f"Fehler GLM: {e}")
 
@@ -1,13 +1,38 @@
+import argparse
+
 import pandas as pd
-import numpy as np
 import os
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
-import patsy
+import time
 import warnings
 from statsmodels.tools.sm_exceptions import HessianInversionWarning, ConvergenceWarning
 
+from bootstrap import DEFAULT_SEED, bootstrap_intervals, run_bootstrap
+from kovarianz import DEFAULT_COV_TYPES
+from laender import add_country_argument, resolve_countries
+from merkmale import MODEL_COLUMNS, load_features
+from modellablage import load_model, save_model
+from protokoll import filter_steps, record_steps
+from startwerte import family_params, load_start_cache, record_fit, record_fits, savings
+from robustheit import (MAIN_SPECS, all_specs, comparison_table, fit_model, prepare_sample, resolve_formula,
+                        run_specs, summarize)
+
+parser = argparse.ArgumentParser(description="Robustheits-Checks (ZINB & GLM)")
+add_country_argument(parser)
+parser.add_argument('--float32', action='store_true',
+                    help="Abgeleitete Merkmale als float32 laden (halber Speicher, Abweichungen in den letzten Stellen)")
+parser.add_argument('--duenn', action='store_true',
+                    help="Designmatrizen dünn besetzt (scipy.sparse) aufbauen statt dicht (für große Stichproben)")
+parser.add_argument('--spezifikationen', nargs='+',
+                    help="Nur diese Spezifikationen schätzen (z. B. R1 R2 L für alle Länder); Standard: alle")
+parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                    help="Anzahl paralleler Prozesse (1 = sequenziell)")
+parser.add_argument('--kaltstart', action='store_true',
+                    help="Ab den Standard-Startwerten schätzen statt aus dem Startwert-Cache (misst die Referenz neu)")
+parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                    help="Bootstrap-Intervalle der Hauptmodelle aus N Replikationen (Schichten Land × Jahr); 0 = aus")
+parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed des Bootstraps")
+args = parser.parse_args()
+
 # Warnungen unterdrücken
 warnings.simplefilter('ignore', category=HessianInversionWarning)
 warnings.simplefilter('ignore', category=ConvergenceWarning)
@@ -18,82 +43,45 @@ print("--- Starte Robustheits-Checks (ZINB & GLM) ---")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 base_path = os.path.join(script_dir, '..', 'results')
+countries = resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
+columns = MODEL_COLUMNS + ['award_criteria']
 
 # 1. DATEN LADEN & VORBEREITEN (Identisch zur Hauptanalyse)
 print("Lade Daten...")
 try:
-    df_de = pd.read_csv(os.path.join(base_path, 'germany_analysis_ready.csv'), low_memory=False)
-    df_fr = pd.read_csv(os.path.join(base_path, 'france_analysis_ready.csv'), low_memory=False)
-    df_ee = pd.read_csv(os.path.join(base_path, 'estonia_analysis_ready.csv'), low_memory=False)
+    # Standard-Bereinigung & Feature Engineering aus dem gemeinsamen Cache (merkmale.py)
+    reg_df, features_meta = load_features(base_path, countries, columns=columns, float32=args.float32)
 except FileNotFoundError:
     print("Fehler: Daten nicht gefunden.")
     exit()
 
-df_de['country'] = 'Germany'
-df_fr['country'] = 'France'
-df_ee['country'] = 'Estonia'
-df_final = pd.concat([df_de, df_fr, df_ee], ignore_index=True)
-reg_df = df_final.copy()
-
-# Standard-Bereinigung
-reg_df = reg_df[reg_df['total_bids'] < 100]
-reg_df['duration_days'] = pd.to_numeric(reg_df['duration_days'], errors='coerce')
-reg_df = reg_df[reg_df['duration_days'] > 0]
-p99 = reg_df['duration_days'].quantile(0.99)
-reg_df['duration_days_capped'] = reg_df['duration_days'].clip(upper=p99)
-reg_df['z_duration'] = (reg_df['duration_days_capped'] - reg_df['duration_days_capped'].mean()) / reg_df[
-    'duration_days_capped'].std()
-
-reg_df['tender_value'] = pd.to_numeric(reg_df['tender_value'], errors='coerce')
-reg_df = reg_df[reg_df['tender_value'] > 0]
-reg_df['log_tender_value'] = np.log(reg_df['tender_value'])
-reg_df['z_value'] = (reg_df['log_tender_value'] - reg_df['log_tender_value'].mean()) / reg_df['log_tender_value'].std()
-reg_df['const'] = 1
-
-# -------------------------------------------------------------------
-# ROBUSTHEITS-CHECK 1: Zusätzliche Kontrolle 'award_criteria'
-# Wir prüfen, ob das Ergebnis stabil bleibt, wenn wir das Vergabekriterium (Preis vs. Qualität) aufnehmen.
-# -------------------------------------------------------------------
-print("\n" + "=" * 60)
-print("ROBUSTHEIT 1: ZINB mit 'award_criteria'")
-print("=" * 60)
-
-# Wir nehmen nur Daten, wo award_criteria vorhanden ist
-vars_r1 = ['total_bids', 'z_duration', 'country', 'z_value', 'procurement_method',
-           'procurement_category', 'year', 'const', 'award_criteria']
-df_r1 = reg_df.dropna(subset=vars_r1).copy()
-
-# Formel erweitert um C(award_criteria)
-formula_r1 = (
-    "total_bids ~ z_duration * C(country, Treatment('Estonia')) + "
-    "z_value + C(procurement_method) + C(procurement_category) + C(year) + C(award_criteria)"
-)
-
-try:
-    y_r1, X_r1 = patsy.dmatrices(formula_r1, data=df_r1, return_type='dataframe')
-    X_infl_r1 = df_r1[['const']]
-
-    # 1. Schritt: Startwerte finden
-    model_temp = ZeroInflatedNegativeBinomialP(endog=y_r1, exog=X_r1, exog_infl=X_infl_r1, inflation='logit')
-    res_temp = model_temp.fit(maxiter=5000, method='nm', disp=0)
-
-    # 2. Schritt: Finales Fitting
-    res_r1 = model_temp.fit(maxiter=5000, method='bfgs', start_params=res_temp.params, disp=0)
-
-    # Zeige nur die relevanten Variablen (Dauer & Interaktionen)
-    print(res_r1.summary().tables[1])
-    print("\n-> Wenn z_duration und Interaktionen ähnlich wie im Hauptmodell sind: ROBUST!")
-
-except Exception as e:
-    print(f"Fehler bei Robustheit 1: {e}")
-
-# -------------------------------------------------------------------
-# ROBUSTHEITS-CHECK 2: Nur 'Services' (Dienstleistungen)
-# Wir prüfen, ob die Effekte in der größten Kategorie auch alleine gelten.
-# -------------------------------------------------------------------
-print("\n" + "=" * 60)
-print("ROBUSTHEIT 2: ZINB nur für 'Services'")
-print("=" * 60)
+# 2. HAUPTMODELLE
+# Aus den Modellartefakten von 03 (modellablage.py); fehlt eines, wird das Hauptmodell hier geschätzt und abgelegt.
+# Startwerte aller Schätzungen aus dem Startwert-Cache (startwerte.py), mit --kaltstart die Standard-Startwerte.
+main_summaries = []
+main_models = []
+start_cache = load_start_cache(base_path)
+for spec in MAIN_SPECS:
+    data = prepare_sample(spec, reg_df, countries)
+    formula = resolve_formula(spec, countries)
+    infl_columns = ['const'] if spec['family'] == 'zinb' else []
+    start_time = time.time()
+    # Artefakt mit den Standard-Standardfehlern (nicht das einer Schätzung mit --cluster)
+    cov = DEFAULT_COV_TYPES[spec['family']]
+    result = load_model(base_path, spec['family'], formula, data, infl_columns=infl_columns, cov=cov)
+    if result is None:
+        print(f"{spec['title']}: kein passendes Modellartefakt, schätze neu...")
+        seed_params = None if args.kaltstart else family_params(start_cache, spec['family'])
+        fit = fit_model(spec, data, countries, seed_params=seed_params, sparse=args.duenn)
+        print(record_fit(base_path, spec['family'], spec['family'], fit, time.time() - start_time,
+                         fit.mle_retvals['cold']))
+        result = save_model(base_path, spec['family'], formula, fit, data, features_meta, infl_columns=infl_columns,
+                            cov=cov)
+    main_models.append((spec, data, result))
+    main_summaries.append(summarize(spec, result, time.time() - start_time))
+
+# 3. STICHPROBEN DER SPEZIFIKATIONEN
+specs = all_specs(countries, args.spezifikationen)
 
 # --- NEU: Zählen der Kategorien ---
 print("Verteilung der Kategorien im Gesamtdatensatz (reg_df):")
@@ -103,31 +91,90 @@ stats_df = pd.concat([cat_counts, cat_pct], axis=1, keys=['Anzahl', 'Prozent'])
 print(stats_df.round(1))
 print("-" * 30)
 
-# Filterung auf Services
-df_r2 = reg_df[reg_df['procurement_category'] == 'services'].copy()
-print(f"Analysiere Services (n = {len(df_r2)})...")
-
-# Bereinigen (ohne procurement_category in der Formel, da konstant)
-vars_r2 = ['total_bids', 'z_duration', 'country', 'z_value', 'procurement_method', 'year', 'const']
-df_r2 = df_r2.dropna(subset=vars_r2)
-
-formula_r2 = (
-    "total_bids ~ z_duration * C(country, Treatment('Estonia')) + "
-    "z_value + C(procurement_method) + C(year)"
-)
-
-try:
-    y_r2, X_r2 = patsy.dmatrices(formula_r2, data=df_r2, return_type='dataframe')
-    X_infl_r2 = df_r2[['const']]
-
-    # Modell berechnen
-    model_temp2 = ZeroInflatedNegativeBinomialP(endog=y_r2, exog=X_r2, exog_infl=X_infl_r2, inflation='logit')
-    res_temp2 = model_temp2.fit(maxiter=5000, method='nm', disp=0)  # Startwerte
-    res_r2 = model_temp2.fit(maxiter=5000, method='bfgs', start_params=res_temp2.params, disp=0)  # Final
-
-    print(res_r2.summary().tables[1])
-
-except Exception as e:
-    print(f"Fehler bei Robustheit 2: {e}")
+# Varianten des Modellierungsdatensatzes (ohne p99-Cap, andere Gebotsgrenzen) je Parametersatz einmal laden;
+# sie werden nicht im Protokoll der Stufe 'merkmale' vermerkt
+feature_sets = {(): reg_df}
+samples, steps = [], []
+for spec in specs:
+    variant = tuple(sorted(spec.get('features', {}).items()))
+    if variant not in feature_sets:
+        feature_sets[variant] = load_features(base_path, countries, params=dict(variant), columns=columns,
+                                              float32=args.float32, record=False)[0]
+    samples.append(prepare_sample(spec, feature_sets[variant], countries))
+    steps += filter_steps(spec['step'], feature_sets[variant], samples[-1])
+
+# Stichproben der Robustheits-Checks im Protokoll der Stichprobenreduktion vermerken
+record_steps(base_path, 'robustheit', steps)
+
+# 4. SCHÄTZUNG (parallel, Startwerte aus dem Startwert-Cache der jeweiligen Familie)
+print(f"Schätze {len(specs)} Spezifikationen mit bis zu {args.workers} Prozessen...")
+start_cache = load_start_cache(base_path)
+summaries = run_specs([(spec, sample, countries,
+                        None if args.kaltstart else family_params(start_cache, spec['family']), args.duenn)
+                       for spec, sample in zip(specs, samples)], args.workers)
+
+# Konvergierte Koeffizienten in den Startwert-Cache übernehmen, Ersparnis gegenüber dem Kaltstart
+fits = {}
+for spec, summary in zip(specs, summaries):
+    if 'error' not in summary:
+        fits.setdefault(spec['family'], []).append(summary)
+for family, family_fits in fits.items():
+    record_fits(base_path, family, family_fits)
+start_cache = load_start_cache(base_path)
+saved = [savings(start_cache, fit) for family_fits in fits.values() for fit in family_fits]
+saved = [value for value in saved if value is not None]
+cold = sum(fit['cold'] and fit['converged'] for family_fits in fits.values() for fit in family_fits)
+if cold:
+    print(f"Kaltstart: Schritte und Laufzeit von {cold} Spezifikationen als Referenz im Startwert-Cache gespeichert")
+if saved:
+    print(f"Startwerte aus dem Cache: {sum(steps for steps, _ in saved)} Newton-Schritte und "
+          f"{sum(seconds for _, seconds in saved):.2f} Sekunden gespart gegenüber dem Kaltstart "
+          f"({len(saved)} von {len(summaries)} Spezifikationen mit Referenz, sonst --kaltstart)")
+
+for spec, sample, summary in zip(specs, samples, summaries):
+    if not spec.get('details'):
+        continue
+    print("\n" + "=" * 60)
+    print(f"ROBUSTHEIT {spec['name'][1:]}: {spec['title']}")
+    print("=" * 60)
+    print(f"Stichprobe: n = {len(sample)}")
+    if 'error' in summary:
+        print(f"Fehler bei Robustheit {spec['name'][1:]}: {summary['error']}")
+        continue
+    # Zeige nur die relevanten Variablen (Dauer & Interaktionen)
+    print(summary['table'])
+    print(summary['diagnostics'])
+    if spec.get('note'):
+        print(spec['note'])
 
-print("\n--- Robustheits-Checks beendet ---")
\ No newline at end of file
+# 5. VERGLEICHSTABELLE
+print("\n" + "=" * 60)
+print("VERGLEICH: z_duration und Interaktionen über alle Spezifikationen")
+print("=" * 60)
+table, values = comparison_table(MAIN_SPECS + specs, main_summaries + summaries)
+with pd.option_context('display.max_columns', None, 'display.width', 250, 'display.max_colwidth', 60):
+    print(table)
+print("Signifikanz: * p < 0.05, ** p < 0.01, *** p < 0.001; Standardfehler in Klammern (GLM: HC0)")
+values.to_csv(os.path.join(base_path, 'robustheit_vergleich.csv'), index=False)
+print("Werte gespeichert in: results/robustheit_vergleich.csv")
+
+# 6. BOOTSTRAP DER HAUPTMODELLE (optional)
+# Replikationen werden laufend unter results/bootstrap/ abgelegt; ein erneuter Aufruf setzt dort fort.
+if args.bootstrap > 0:
+    print("\n" + "=" * 60)
+    print(f"BOOTSTRAP: {args.bootstrap} Replikationen je Hauptmodell (Schichten Land × Jahr, Seed {args.seed})")
+    print("=" * 60)
+    intervals = []
+    for spec, data, result in main_models:
+        records = run_bootstrap(base_path, spec, data, countries, result, args.bootstrap, seed=args.seed,
+                                workers=args.workers, sparse=args.duenn)
+        table, n_used = bootstrap_intervals(records, result)
+        table = table[[term.startswith('z_duration') for term in table.index]]
+        print(f"\n{spec['name']} {spec['title']}: {n_used} von {len(records)} Replikationen konvergiert")
+        with pd.option_context('display.max_columns', None, 'display.width', 250, 'display.max_colwidth', 60):
+            print(table.round(4))
+        intervals.append(table.rename_axis('term').reset_index().assign(spec=spec['name'], replikationen=n_used))
+    pd.concat(intervals).to_csv(os.path.join(base_path, 'bootstrap_intervalle.csv'), index=False)
+    print("95%-Perzentil-Intervalle gespeichert in: results/bootstrap_intervalle.csv")
+
+print("\n--- Robustheits-Checks beendet ---")
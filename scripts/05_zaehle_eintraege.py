@@ -1,6 +1,18 @@
+import argparse
+
 import pandas as pd
 import os
 
+from laender import add_country_argument, display_name, resolve_countries
+from protokoll import STAGE_ORDER, load_lineage, stage_steps
+from speicher import RAW_SCHEMA, READY_SCHEMA, build_sidecar, dataset_stats, find_dataset, read_sidecar, stats_equal
+
+parser = argparse.ArgumentParser(description="Zählt die Einträge vor und nach der Bereinigung")
+add_country_argument(parser)
+parser.add_argument('--verify', action='store_true',
+                    help="Kennzahlen aus den Daten neu berechnen und mit den gespeicherten vergleichen")
+args = parser.parse_args()
+
 # --- KORREKTUR START ---
 # Finde den absoluten Pfad des Verzeichnisses, in dem das Skript liegt (also .../scripts/)
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,22 +23,54 @@ base_path = os.path.join(script_dir, '..', 'results')
 # --- KORREKTUR ENDE ---
 
 
-# Eine Liste der Länder und ihrer zugehörigen Dateinamen
+# Eine Liste der Länder (Anzeigename aus dem Länderregister) und ihrer zugehörigen Datensätze (Parquet, Feather oder CSV)
 countries = {
-    'Deutschland': {
-        'raw': 'germany_all_tenders_raw.csv',
-        'ready': 'germany_analysis_ready.csv'
-    },
-    'Frankreich': {
-        'raw': 'france_all_tenders_raw.csv',
-        'ready': 'france_analysis_ready.csv'
-    },
-    'Estland': {
-        'raw': 'estonia_all_tenders_raw.csv',
-        'ready': 'estonia_analysis_ready.csv'
+    display_name(country_name): {
+        'country': country_name,
+        'raw': f'{country_name.lower()}_all_tenders_raw',
+        'ready': f'{country_name.lower()}_analysis_ready'
     }
+    for country_name in resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
 }
 
+
+def load_stats(path, schema):
+    """
+    Kennzahlen eines Datensatzes aus seiner Kennzahlen-Datei (.stats.json), ohne die Daten zu lesen.
+    Mit --verify werden sie aus den Daten neu berechnet und mit den gespeicherten verglichen.
+    """
+    if not args.verify:
+        return dataset_stats(path, schema)
+    stored = read_sidecar(path)
+    rebuilt = build_sidecar(path, schema)
+    if stored is None:
+        print(f"Kennzahlen für {os.path.basename(path)} fehlten oder waren veraltet und wurden neu erstellt.")
+    elif stats_equal(stored, rebuilt):
+        print(f"Kennzahlen für {os.path.basename(path)} bestätigt.")
+    else:
+        print(f"WARNUNG: Kennzahlen für {os.path.basename(path)} weichen von den Daten ab und wurden ersetzt.")
+    return rebuilt
+
+
+def reduction_table(lineage):
+    """
+    Tabelle der Stichprobenreduktion aus dem Protokoll: je Schritt (in Pipeline-Reihenfolge)
+    die verbleibenden Zeilen je Land, beginnend mit den Rohdaten.
+    """
+    rows = {}
+    for stage in STAGE_ORDER:
+        for country, files in countries.items():
+            steps = stage_steps(lineage, stage, files['country'])
+            if stage == 'bereinigung' and steps:
+                rows.setdefault('Rohdaten', {})[country] = steps[0]['rows_in']
+            for step in steps:
+                rows.setdefault(f"{stage}: {step['step']}", {})[country] = step['rows_out']
+    return pd.DataFrame.from_dict(rows, orient='index').reindex(columns=list(countries.keys()))
+
+
+# Protokoll der Stichprobenreduktion (von 01/02, merkmale.py und 03/04/06 geschrieben)
+lineage = load_lineage(base_path)
+
 # Dictionaries, um die Ergebnisse zu speichern
 raw_counts = {}
 ready_counts = {}
@@ -38,24 +82,29 @@ print("--- Beginne mit der Analyse der Dateien ---\n")
 # Schleife durch die Länder, um jede Datei zu verarbeiten
 for country, files in countries.items():
     try:
-        # Pfad zur Rohdatendatek erstellen
-        raw_path = os.path.join(base_path, files['raw'])
-        # CSV einlesen und Zeilen zählen
-        raw_df = pd.read_csv(raw_path, low_memory=False)  # low_memory=False hinzugefügt, um DtypeWarning zu vermeiden
-        raw_counts[country] = len(raw_df)
+        cleaning_steps = stage_steps(lineage, 'bereinigung', files['country'])
+        if cleaning_steps and not args.verify:
+            # Zeilen vor der Bereinigung aus dem Protokoll
+            raw_counts[country] = cleaning_steps[0]['rows_in']
+        else:
+            # Pfad zur Rohdatendatei erstellen
+            raw_path = find_dataset(base_path, files['raw'])
+            # Zeilen zählen (aus der Kennzahlen-Datei, ohne die Daten zu lesen)
+            raw_counts[country] = load_stats(raw_path, RAW_SCHEMA)['rows']
 
         # Pfad zur bereinigten Datei erstellen
-        ready_path = os.path.join(base_path, files['ready'])
-        # CSV einlesen und Zeilen zählen
-        ready_df = pd.read_csv(ready_path, low_memory=False)
-        ready_counts[country] = len(ready_df)
+        ready_path = find_dataset(base_path, files['ready'])
+        ready_stats = load_stats(ready_path, READY_SCHEMA)
+        ready_counts[country] = ready_stats['rows']
+        if cleaning_steps and cleaning_steps[-1]['rows_out'] != ready_stats['rows']:
+            print(f"WARNUNG: Protokoll ({cleaning_steps[-1]['rows_out']} Zeilen) und {files['ready']} "
+                  f"({ready_stats['rows']} Zeilen) stimmen nicht überein. Bitte 02 erneut ausführen.")
 
         # --- NEU: Zähle Nullen für H1-Diagnose ---
         # Überprüfe, ob die Spalte 'total_bids' existiert
-        if 'total_bids' in ready_df.columns:
-            # Zähle, wie oft total_bids == 0 ist
-            zeros = (ready_df['total_bids'] == 0).sum()
-            zero_bid_counts[country] = zeros
+        if 'zero_bids' in ready_stats:
+            # Anzahl total_bids == 0 (beim Schreiben gezählt)
+            zero_bid_counts[country] = ready_stats['zero_bids']
         else:
             print(f"WARNUNG: Spalte 'total_bids' nicht in {files['ready']} gefunden.")
             zero_bid_counts[country] = 0
@@ -78,16 +127,16 @@ if raw_counts and ready_counts:
 
     # Ergebnisse formatiert ausgeben
     print("--- Ergebnisse der Rohdaten (Vor der Bereinigung) ---")
-    print(f"Deutschland (roh): {raw_counts.get('Deutschland', 0):,}")
-    print(f"Frankreich (roh):  {raw_counts.get('Frankreich', 0):,}")
-    print(f"Estland (roh):     {raw_counts.get('Estland', 0):,}")
+    width = max(len(f"{country} (roh):") for country in countries)
+    for country in countries:
+        print(f"{country + ' (roh):':<{width}} {raw_counts.get(country, 0):,}")
     print("----------------------------------------------------")
     print(f"Gesamteinträge (roh):      {total_raw:,}\n")
 
     print("--- Ergebnisse der bereinigten Daten (Nach der Bereinigung) ---")
-    print(f"Deutschland (bereinigt): {ready_counts.get('Deutschland', 0):,}")
-    print(f"Frankreich (bereinigt):  {ready_counts.get('Frankreich', 0):,}")
-    print(f"Estland (bereinigt):     {ready_counts.get('Estland', 0):,}")
+    width = max(len(f"{country} (bereinigt):") for country in countries)
+    for country in countries:
+        print(f"{country + ' (bereinigt):':<{width}} {ready_counts.get(country, 0):,}")
     print("----------------------------------------------------")
     print(f"Gesamteinträge (bereinigt):  {total_ready:,}\n")
 
@@ -99,7 +148,7 @@ if raw_counts and ready_counts:
         df_zeros_summary = pd.DataFrame({
             'Gesamt (bereinigt)': ready_counts,
             'davon Null-Gebote': zero_bid_counts
-        }).reindex(countries.keys())  # Stellt sicher, dass die Reihenfolge DE, FR, EE ist
+        }).reindex(countries.keys())  # Stellt sicher, dass die Reihenfolge der Länderauswahl (z. B. DE, FR, EE) gilt
 
         df_zeros_summary['Anteil Nullen (%)'] = (df_zeros_summary['davon Null-Gebote'] / df_zeros_summary[
             'Gesamt (bereinigt)']) * 100
@@ -124,14 +173,19 @@ if raw_counts and ready_counts:
             print(
                 "Eine Negative Binomialregression (NBR) ist wahrscheinlich ausreichend, aber ZINB bleibt eine Option.")
 
+    # --- Stichprobenreduktion je Filterschritt (aus dem Protokoll) ---
+    if lineage:
+        print("\n--- Stichprobenreduktion je Schritt (verbleibende Einträge) ---")
+        print(reduction_table(lineage).to_markdown(floatfmt=",.0f"))
+
     # Den Zielsatz mit den neu berechneten Werten erstellen
     print("\n--- Korrigierter Satz für deine Bachelorarbeit (Kapitel 4.1.3) ---")
+    raw_by_country = ', '.join(f"{country}: {raw_counts.get(country, 0):,.0f}" for country in countries)
+    ready_by_country = ', '.join(f"{country}: {ready_counts.get(country, 0):,.0f}" for country in countries)
     final_sentence = (
         f"Durch die Implementierung dieser Schritte wurde eine Reduktion der Datenmenge von {total_raw:,.0f} "
-        f"Einträgen (Deutschland: {raw_counts.get('Deutschland', 0):,.0f}, Frankreich: {raw_counts.get('Frankreich', 0):,.0f}, "
-        f"Estland: {raw_counts.get('Estland', 0):,.0f}) auf {total_ready:,.0f} Einträgen "
-        f"(Deutschland: {ready_counts.get('Deutschland', 0):,.0f}, Frankreich: {ready_counts.get('Frankreich', 0):,.0f}, "
-        f"Estland: {ready_counts.get('Estland', 0):,.0f}) durchgeführt, um eine "
+        f"Einträgen ({raw_by_country}) auf {total_ready:,.0f} Einträgen "
+        f"({ready_by_country}) durchgeführt, um eine "
         "konsistente und signifikante Stichprobe zu erhalten."
     )
     print(final_sentence)
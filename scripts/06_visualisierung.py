@@ -1,3 +1,5 @@
+import argparse
+
 import pandas as pd
 import numpy as np
 import os
@@ -5,10 +7,32 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
-from statsmodels.discrete.count_model import ZeroInflatedNegativeBinomialP
 import patsy
+import time
 import warnings
 
+from kovarianz import DEFAULT_COV_TYPES
+from laender import add_country_argument, country_term, plot_colors, resolve_countries
+from merkmale import MODEL_COLUMNS, load_features
+from modellablage import load_model, save_model
+from effekte import average_marginal_effect, prediction_grid
+from protokoll import filter_steps, record_steps
+from speicher import drop_unused_categories
+from startwerte import START_NAME, family_params, load_start_cache, record_fit, start_values
+from zaehlmodelle import (ZeroInflatedNegativeBinomialP, fit_glm_sparse, fit_zinb_sparse, robust_glm_cov,
+                          sparse_dmatrices)
+
+parser = argparse.ArgumentParser(description="Visualisierungen (Prediction Plots)")
+add_country_argument(parser)
+parser.add_argument('--float32', action='store_true',
+                    help="Abgeleitete Merkmale als float32 laden (halber Speicher, Abweichungen in den letzten Stellen)")
+parser.add_argument('--duenn', action='store_true',
+                    help="Designmatrizen dünn besetzt (scipy.sparse) aufbauen statt dicht (für große Stichproben)")
+parser.add_argument('--vorhersage', choices=['modi', 'stichprobe'], default='modi',
+                    help="Vorhersagekurven an den Modi der Faktoren (modi) oder gemittelt über die Stichprobe "
+                         "des Modells (stichprobe)")
+args = parser.parse_args()
+
 # Warnungen unterdrücken
 warnings.simplefilter('ignore')
 
@@ -17,41 +41,19 @@ print("--- Erstelle Visualisierungen (Prediction Plots) - FINAL FIX ---")
 # 1. DATEN LADEN
 script_dir = os.path.dirname(os.path.abspath(__file__))
 base_path = os.path.join(script_dir, '..', 'results')
+countries = resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
 
 try:
-    df_de = pd.read_csv(os.path.join(base_path, 'germany_analysis_ready.csv'), low_memory=False)
-    df_fr = pd.read_csv(os.path.join(base_path, 'france_analysis_ready.csv'), low_memory=False)
-    df_ee = pd.read_csv(os.path.join(base_path, 'estonia_analysis_ready.csv'), low_memory=False)
+    # Bereinigung & Standardisierung aus dem gemeinsamen Cache (merkmale.py)
+    reg_df, features_meta = load_features(base_path, countries, columns=MODEL_COLUMNS + ['duration_days_capped'],
+                                          float32=args.float32)
 except:
     print("Fehler beim Laden. Prüfe Pfade.")
     exit()
 
-df_de['country'] = 'Germany'
-df_fr['country'] = 'France'
-df_ee['country'] = 'Estonia'
-df_final = pd.concat([df_de, df_fr, df_ee], ignore_index=True)
-reg_df = df_final.copy()
-
-# Bereinigung
-reg_df = reg_df[reg_df['total_bids'] < 100]
-reg_df['duration_days'] = pd.to_numeric(reg_df['duration_days'], errors='coerce')
-reg_df = reg_df[reg_df['duration_days'] > 0]
-p99 = reg_df['duration_days'].quantile(0.99)
-reg_df['duration_days_capped'] = reg_df['duration_days'].clip(upper=p99)
-
-# Standardisierung
-duration_mean = reg_df['duration_days_capped'].mean()
-duration_std = reg_df['duration_days_capped'].std()
-reg_df['z_duration'] = (reg_df['duration_days_capped'] - duration_mean) / duration_std
-
-reg_df['tender_value'] = pd.to_numeric(reg_df['tender_value'], errors='coerce')
-reg_df = reg_df[reg_df['tender_value'] > 0]
-reg_df['log_tender_value'] = np.log(reg_df['tender_value'])
-reg_df['z_value'] = (reg_df['log_tender_value'] - reg_df['log_tender_value'].mean()) / reg_df['log_tender_value'].std()
-
-reg_df['sme_share'] = np.where(reg_df['total_bids'] > 0, reg_df['sme_bids'] / reg_df['total_bids'], np.nan)
-reg_df['sme_share'] = reg_df['sme_share'].clip(0, 1)
-reg_df['const'] = 1
+# Normierungskonstanten für die Rückrechnung z -> Tage
+duration_mean = features_meta['constants']['duration_mean']
+duration_std = features_meta['constants']['duration_std']
 
 # Output Ordner
 output_dir = os.path.join(script_dir, '..', 'plots')
@@ -59,14 +61,16 @@ if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
 sns.set_theme(style="whitegrid")
-colors = {'Estonia': '#1f77b4', 'France': '#ff7f0e', 'Germany': '#2ca02c'}
+# Plotfarben und Reihenfolge (alphabetisch) aus dem Länderregister
+colors = plot_colors(countries)
+country_order = sorted(countries)
 
 # =============================================================================
 # PLOT 1: BOXPLOT DAUER
 # =============================================================================
 print("Erstelle Plot 1: Boxplot Dauer...")
 plt.figure(figsize=(10, 6))
-sns.boxplot(x='country', y='duration_days_capped', data=reg_df, palette=colors, order=['Estonia', 'France', 'Germany'])
+sns.boxplot(x='country', y='duration_days_capped', data=reg_df, palette=colors, order=country_order)
 plt.title('Verteilung der Verfahrensdauer nach Ländern', fontsize=14)
 plt.ylabel('Dauer (Tage)', fontsize=12)
 plt.xlabel('Land', fontsize=12)
@@ -81,73 +85,115 @@ print("Berechne Modelle für Vorhersage (bitte warten)...")
 # ZINB
 zinb_vars = ['total_bids', 'z_duration', 'country', 'z_value', 'procurement_method', 'procurement_category', 'year',
              'const']
-df_z1 = reg_df.dropna(subset=zinb_vars)
-formula_zinb = "total_bids ~ z_duration * C(country, Treatment('Estonia')) + z_value + C(procurement_method) + C(procurement_category) + C(year)"
-
-# WICHTIG: Wir speichern X_z, um später das "Design" wiederzuverwenden!
-y_z, X_z = patsy.dmatrices(formula_zinb, df_z1, return_type='dataframe')
-
-# Modell fitten (für Plot reicht NM oder BFGS ohne SEs)
-try:
-    model_zinb = ZeroInflatedNegativeBinomialP(endog=y_z, exog=X_z, exog_infl=df_z1[['const']], inflation='logit').fit(
-        maxiter=1000, method='bfgs', disp=0)
-except:
-    model_zinb = ZeroInflatedNegativeBinomialP(endog=y_z, exog=X_z, exog_infl=df_z1[['const']], inflation='logit').fit(
-        maxiter=2000, method='nm', disp=0)
+df_z1 = drop_unused_categories(reg_df.dropna(subset=zinb_vars).copy())
+formula_zinb = f"total_bids ~ z_duration * {country_term(countries)} + z_value + C(procurement_method) + C(procurement_category) + C(year)"
+
+# Modell aus dem Artefakt von 03 laden (modellablage.py); nur wenn keines zur Stichprobe passt, neu schätzen.
+# Das Artefakt enthält den Bauplan (design_info) des Trainings für die Vorhersage.
+model_zinb = load_model(base_path, 'zinb', formula_zinb, df_z1, infl_columns=['const'], cov=DEFAULT_COV_TYPES['zinb'])
+if model_zinb is None:
+    print("  ZINB: kein passendes Modellartefakt, schätze neu...")
+    # Newton-Verfahren mit analytischer Hesse-Matrix (zaehlmodelle.py), Startwerte aus dem Startwert-Cache
+    start_cache = load_start_cache(base_path)
+    start_time = time.time()
+    if args.duenn:
+        y_z, X_z, design_z = sparse_dmatrices(formula_zinb, df_z1)
+        start_z = start_values(family_params(start_cache, 'zinb'), ['inflate_const'] + design_z.column_names + ['alpha'])
+        fit_z = fit_zinb_sparse(y_z, X_z, df_z1[['const']].to_numpy(dtype='float64'), design_z,
+                                start_params=start_z, start_name=START_NAME)
+    else:
+        y_z, X_z = patsy.dmatrices(formula_zinb, df_z1, return_type='dataframe')
+        zinb_instance = ZeroInflatedNegativeBinomialP(endog=y_z, exog=X_z, exog_infl=df_z1[['const']], inflation='logit')
+        start_z = start_values(family_params(start_cache, 'zinb'), zinb_instance.exog_names)
+        fit_z = zinb_instance.fit_newton(start_params=start_z, start_name=START_NAME)
+    print("  " + record_fit(base_path, 'zinb', 'zinb', fit_z, time.time() - start_time, cold=start_z is None))
+    model_zinb = save_model(base_path, 'zinb', formula_zinb, fit_z, df_z1, features_meta, infl_columns=['const'],
+                            cov=DEFAULT_COV_TYPES['zinb'])
+else:
+    print(f"  ZINB: Modellartefakt zinb_{model_zinb.key} geladen")
 
 # GLM
-df_glm = reg_df.dropna(subset=['sme_share'] + zinb_vars).copy()
+df_glm = drop_unused_categories(reg_df.dropna(subset=['sme_share'] + zinb_vars).copy())
+# Stichproben der Vorhersagemodelle im Protokoll der Stichprobenreduktion vermerken
+record_steps(base_path, 'visualisierung',
+             filter_steps('Modellvariablen vollständig (ZINB)', reg_df, df_z1)
+             + filter_steps('sme_share vorhanden (GLM)', reg_df, df_glm))
 df_glm['sme_share_safe'] = df_glm['sme_share'].clip(1e-6, 1 - 1e-6)
-formula_glm = "sme_share_safe ~ z_duration * C(country, Treatment('Estonia')) + z_value + C(procurement_method) + C(procurement_category) + C(year)"
-# Auch hier GLM fitten
-model_glm = smf.glm(formula=formula_glm, data=df_glm, family=sm.families.Binomial(link=sm.families.links.logit())).fit()
+formula_glm = f"sme_share_safe ~ z_duration * {country_term(countries)} + z_value + C(procurement_method) + C(procurement_category) + C(year)"
+# Auch hier zuerst das Artefakt von 03 (HC0 wie dort, damit das Artefakt unabhängig vom Ersteller gleich ist)
+model_glm = load_model(base_path, 'glm', formula_glm, df_glm, cov=DEFAULT_COV_TYPES['glm'])
+if model_glm is None:
+    print("  GLM: kein passendes Modellartefakt, schätze neu...")
+    start_cache = load_start_cache(base_path)
+    start_time = time.time()
+    if args.duenn:
+        y_g, X_g, design_g = sparse_dmatrices(formula_glm, df_glm)
+        start_g = start_values(family_params(start_cache, 'glm'), design_g.column_names)
+        fit_g = fit_glm_sparse(y_g, X_g, design_g, cov_type=DEFAULT_COV_TYPES['glm'], start_params=start_g, start_name=START_NAME)
+    else:
+        glm_instance = smf.glm(formula=formula_glm, data=df_glm,
+                               family=sm.families.Binomial(link=sm.families.links.logit()))
+        start_g = start_values(family_params(start_cache, 'glm'), glm_instance.exog_names)
+        fit_g = robust_glm_cov(glm_instance.fit(start_params=start_g), DEFAULT_COV_TYPES['glm'])
+    print("  " + record_fit(base_path, 'glm', 'glm', fit_g, time.time() - start_time, cold=start_g is None))
+    model_glm = save_model(base_path, 'glm', formula_glm, fit_g, df_glm, features_meta, cov=DEFAULT_COV_TYPES['glm'])
+else:
+    print(f"  GLM: Modellartefakt glm_{model_glm.key} geladen")
+
+
+# VORHERSAGEGITTER
+# Erwartungswerte mit 95%-Konfidenzband (Delta-Methode) für 100 Werte der Dauer je Land, alle Gitterpunkte
+# eines Landes in einer Matrixrechnung (effekte.py). --vorhersage modi: an den Modi der Faktoren und dem
+# Mittel von z_value; stichprobe: gemittelt über die Stichprobe des Modells mit dem jeweiligen Land.
+z_range = np.linspace(reg_df['z_duration'].min(), reg_df['z_duration'].max(), 100)
+days_range = (z_range * duration_std) + duration_mean
+
+
+def mode_profile(df_orig):
+    # Wir nutzen Modus (häufigster Wert) für kategoriale Variablen
+    return pd.DataFrame({
+        'z_duration': [0.0],
+        'z_value': [df_orig['z_value'].mean()],
+        'const': [1],
+        'year': [df_orig['year'].mode()[0]],
+        'procurement_method': [df_orig['procurement_method'].mode()[0]],
+        'procurement_category': [df_orig['procurement_category'].mode()[0]]
+    })
 
 
-# SYNTHETISCHE DATEN ERSTELLEN
-def create_pred_data(df_orig):
-    z_range = np.linspace(df_orig['z_duration'].min(), df_orig['z_duration'].max(), 100)
-    days_range = (z_range * duration_std) + duration_mean
+def prediction_curves(model, df_sample):
+    profile = mode_profile(reg_df) if args.vorhersage == 'modi' else df_sample
+    curves = []
+    for country in country_order:
+        curve = prediction_grid(model, profile.assign(country=country), z_range)
+        curves.append(curve.assign(days=days_range, country=country))
+    return pd.concat(curves, ignore_index=True)
 
-    pred_list = []
-    # Wir nutzen Modus (häufigster Wert) für kategoriale Variablen
-    mode_year = df_orig['year'].mode()[0]
-    mode_method = df_orig['procurement_method'].mode()[0]
-    mode_cat = df_orig['procurement_category'].mode()[0]
-    mean_val = df_orig['z_value'].mean()
-
-    for country in ['Estonia', 'France', 'Germany']:
-        temp = pd.DataFrame({
-            'z_duration': z_range,
-            'days': days_range,
-            'country': country,
-            'z_value': mean_val,
-            'const': 1,
-            'year': mode_year,
-            'procurement_method': mode_method,
-            'procurement_category': mode_cat
-        })
-        pred_list.append(temp)
-    return pd.concat(pred_list, ignore_index=True)
-
-
-df_pred = create_pred_data(reg_df)
+
+def draw_curves(curves):
+    """Vorhersage je Land als Linie mit 95%-Konfidenzband."""
+    for country in country_order:
+        curve = curves[curves['country'] == country]
+        plt.fill_between(curve['days'], curve['pred_unten'], curve['pred_oben'], color=colors[country], alpha=0.2,
+                         linewidth=0)
+        plt.plot(curve['days'], curve['pred'], color=colors[country], linewidth=2.5, label=country)
+
+
+profile_label = 'an den Modi' if args.vorhersage == 'modi' else 'gemittelt über die Stichprobe'
 
 # =============================================================================
 # PLOT 2: WETTBEWERB (ZINB) - MIT KORREKTUR
 # =============================================================================
 print("Erstelle Plot 2: Wettbewerbsintensität...")
 
-# FIX: Wir nutzen build_design_matrices mit dem Bauplan (design_info) aus dem Training (X_z)
-# Das stellt sicher, dass ALLE Spalten (auch die für andere Jahre) da sind, selbst wenn df_pred nur ein Jahr enthält.
-X_pred_z = patsy.build_design_matrices([X_z.design_info], df_pred, return_type='dataframe')[0]
-
+# FIX: Das Design entsteht mit dem Bauplan (design_info) aus dem Training
+# Das stellt sicher, dass ALLE Spalten (auch die für andere Jahre) da sind, selbst wenn das Profil nur ein Jahr enthält.
 # Vorhersage
-predicted_counts = model_zinb.predict(exog=X_pred_z, exog_infl=df_pred[['const']], which='mean')
-df_pred['pred_bids'] = predicted_counts
+curves_zinb = prediction_curves(model_zinb, df_z1)
 
 plt.figure(figsize=(10, 6))
-sns.lineplot(data=df_pred, x='days', y='pred_bids', hue='country', palette=colors, linewidth=2.5)
-plt.title('Vorhersage: Anzahl Gebote vs. Verfahrensdauer', fontsize=14)
+draw_curves(curves_zinb)
+plt.title(f'Vorhersage: Anzahl Gebote vs. Verfahrensdauer ({profile_label}, 95%-KI)', fontsize=14)
 plt.xlabel('Geplante Verfahrensdauer (Tage)', fontsize=12)
 plt.ylabel('Vorhergesagte Anzahl Gebote', fontsize=12)
 plt.legend(title='Land')
@@ -161,14 +207,12 @@ plt.close()
 # =============================================================================
 print("Erstelle Plot 3: KMU-Anteil...")
 
-# GLM predict via formula api ist intelligenter und braucht den Fix meist nicht,
-# aber falls doch, macht statsmodels das intern.
-pred_probs = model_glm.predict(df_pred)
-df_pred['pred_sme'] = pred_probs
+# Auch hier entsteht das Design mit dem Bauplan aus dem Training
+curves_glm = prediction_curves(model_glm, df_glm)
 
 plt.figure(figsize=(10, 6))
-sns.lineplot(data=df_pred, x='days', y='pred_sme', hue='country', palette=colors, linewidth=2.5)
-plt.title('Vorhersage: KMU-Anteil vs. Verfahrensdauer', fontsize=14)
+draw_curves(curves_glm)
+plt.title(f'Vorhersage: KMU-Anteil vs. Verfahrensdauer ({profile_label}, 95%-KI)', fontsize=14)
 plt.xlabel('Geplante Verfahrensdauer (Tage)', fontsize=12)
 plt.ylabel('Vorhergesagter KMU-Anteil (0-1)', fontsize=12)
 plt.legend(title='Land')
@@ -177,4 +221,17 @@ plt.tight_layout()
 plt.savefig(os.path.join(output_dir, '03_interaction_kmu_H2_H3b.png'), dpi=300)
 plt.close()
 
-print(f"Fertig! Grafiken gespeichert in: {output_dir}")
\ No newline at end of file
+# =============================================================================
+# DURCHSCHNITTLICHE MARGINALE EFFEKTE DER DAUER
+# =============================================================================
+# AME von z_duration je Land an den beobachteten Werten (Delta-Methode); je 100 Tage über die Standardabweichung
+print("Durchschnittliche marginale Effekte der Dauer (je Land, 95%-KI):")
+ame = pd.concat([average_marginal_effect(model_zinb, df_z1, by='country').assign(modell='ZINB (Gebote)'),
+                 average_marginal_effect(model_glm, df_glm, by='country').assign(modell='GLM (KMU-Anteil)')])
+ame = ame[['modell', 'me', 'me_se', 'me_unten', 'me_oben']].reset_index()
+ame['me_100_tage'] = ame['me'] * 100 / duration_std
+with pd.option_context('display.width', 200):
+    print(ame.round(4).to_string(index=False))
+ame.to_csv(os.path.join(base_path, 'marginaleffekte.csv'), index=False)
+
+print(f"Fertig! Grafiken gespeichert in: {output_dir}")
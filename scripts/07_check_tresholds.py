@@ -1,43 +1,78 @@
+import argparse
+
 import pandas as pd
 import os
 import numpy as np
 
+from laender import add_country_argument, resolve_countries
+from speicher import find_dataset, load_countries
+from verteilung import VALUE_THRESHOLDS, ValueSummary, load_sketches
+
+parser = argparse.ArgumentParser(description="Prüfung der Auftragswerte (Schwellenwerte)")
+add_country_argument(parser)
+parser.add_argument('--exakt', action='store_true',
+                    help="Werte aus den Datensätzen laden statt aus den Verteilungsskizzen (exakter Median)")
+parser.add_argument('--jahre', nargs='+', type=int, help="Nur diese Jahre auswerten")
+args = parser.parse_args()
+
 print("--- Prüfung der Auftragswerte (Schwellenwerte) ---")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 base_path = os.path.join(script_dir, '..', 'results')
+countries = resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
+
+
+def summary_from_sketches():
+    """Zusammengeführte Zähler und Quantilskizze aller Länder; None, wenn eine Skizze fehlt oder veraltet ist."""
+    summary = ValueSummary()
+    for country_name in countries:
+        data_file = find_dataset(base_path, f'{country_name.lower()}_analysis_ready')
+        sketches = load_sketches(base_path, country_name, data_file)
+        if sketches is None:
+            return None
+        summary.merge(sketches.value_summary(years=args.jahre))
+    return summary
 
-# Daten laden
+
+def summary_from_data():
+    """Lädt nur die Spalte 'tender_value' (und 'year') aller Länder parallel und füllt die Zähler exakt."""
+    frames = load_countries(base_path, countries, columns=['tender_value', 'year'])
+    df_final = pd.concat(list(frames.values()), ignore_index=True)
+    if args.jahre:
+        df_final = df_final[df_final['year'].isin(args.jahre)]
+    # Filtern auf valide Werte (> 0) übernimmt ValueSummary
+    summary = ValueSummary()
+    summary.update(df_final['tender_value'].to_numpy(dtype='float64'))
+    # Median direkt aus den Daten statt aus der Skizze
+    values = df_final['tender_value'].dropna()
+    return summary, values[values > 0].median()
+
+
+# Zähler laden: aus den Verteilungsskizzen (ohne Zeilen zu laden) oder aus den Daten
 try:
-    df_de = pd.read_csv(os.path.join(base_path, 'germany_analysis_ready.csv'), low_memory=False)
-    df_fr = pd.read_csv(os.path.join(base_path, 'france_analysis_ready.csv'), low_memory=False)
-    df_ee = pd.read_csv(os.path.join(base_path, 'estonia_analysis_ready.csv'), low_memory=False)
+    summary = None if args.exakt else summary_from_sketches()
+    from_sketches = summary is not None
+    if from_sketches:
+        median_val = summary.sketch.quantile(0.5)
+    else:
+        summary, median_val = summary_from_data()
 except:
     print("Fehler: Daten nicht gefunden.")
     exit()
 
-# Zusammenfügen
-df_final = pd.concat([df_de, df_fr, df_ee], ignore_index=True)
-
-# Filtern auf valide Werte (> 0)
-values = df_final['tender_value'].dropna()
-values = values[values > 0]
-
 # Berechnungen
-median_val = values.median()
-mean_val = values.mean()
-min_val = values.min()
-max_val = values.max()
+mean_val = summary.mean
+min_val = summary.min
+max_val = summary.max
 
 # Anteile berechnen
 # EU-Schwellenwert für Dienstleistungen/Lieferungen (Zentralregierung) ca. 140.000€, sonst ca. 215.000€
 # Bauleistungen ca. 5.3 Mio €.
 # Wir nehmen mal 215.000 € als grobe Grenze für "Oberschwellig" bei Services.
+# (Schwellenwerte siehe verteilung.VALUE_THRESHOLDS)
 
-count_under_25k = len(values[values < 25000])
-count_under_100k = len(values[values < 100000])
-count_under_215k = len(values[values < 215000])
-total = len(values)
+count_under_25k, count_under_100k, count_under_215k = (summary.below[t] for t in VALUE_THRESHOLDS)
+total = summary.count
 
 print(f"Anzahl Beobachtungen mit Wert: {total}")
 print("-" * 40)
@@ -45,6 +80,9 @@ print(f"Minimum:    {min_val:,.2f} €")
 print(f"Median:     {median_val:,.2f} €  <-- DAS IST DER ENTSCHEIDENDE WERT")
 print(f"Mittelwert: {mean_val:,.2f} €")
 print(f"Maximum:    {max_val:,.2f} €")
+if from_sketches and summary.sketch.rank_error:
+    print(f"(Median aus der Quantilskizze: Rangfehler höchstens ±{summary.sketch.rank_error:.2%}, "
+          f"exakt mit --exakt)")
 print("-" * 40)
 print(f"Anteil unter 25.000 €:  {count_under_25k} ({count_under_25k/total:.1%})")
 print(f"Anteil unter 100.000 €: {count_under_100k} ({count_under_100k/total:.1%})")
@@ -56,4 +94,4 @@ if median_val > 200000:
 elif median_val < 50000:
     print("FAZIT: Eindeutig viele Unterschwellige (nationale) Daten dabei.")
 else:
-    print("FAZIT: Mischmasch / Grauzone.")
\ No newline at end of file
+    print("FAZIT: Mischmasch / Grauzone.")
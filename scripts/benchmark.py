@@ -0,0 +1,263 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from laender import DEFAULT_COUNTRIES, country_info
+from synthetische_daten import DEFAULT_SEED
+
+# --- Benchmark der Pipeline auf synthetischen Daten ---
+# Für jede Größe (Standard: 10k, 1M und 10M Zeilen) wird in einem Arbeitsordner eine Kopie von scripts/ mit
+# eigenem data/, results/ und plots/ angelegt, synthetische_daten.py schreibt die Jahresdateien, und die Stufen
+# 01 (Aufbereitung), 02 (Bereinigung), merkmale.py (Modellierungsdatensatz), 03 (ZINB und Fractional Logit,
+# Kaltstart) und 06 (Plots) laufen nacheinander als eigene Prozesse. Je Stufe werden Laufzeit, CPU-Zeit und
+# der Spitzenwert des Arbeitsspeichers (RSS des größten Prozesses der Stufe, auch der Arbeitsprozesse)
+# gemessen. Die Messungen werden mit Commit, Rechner und Optionen an results/benchmarks/benchmark.jsonl
+# angehängt und mit dem letzten Lauf eines anderen Commits (oder --vergleich) verglichen.
+BENCHMARK_DIR = 'benchmarks'
+BENCHMARK_FILE = 'benchmark.jsonl'
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+# Als Verschlechterung gilt ein Anstieg um mehr als die Toleranz (und bei der Zeit um mehr als MIN_SECONDS)
+DEFAULT_TOLERANCE = 0.2
+MIN_SECONDS = 0.5
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+results_dir = os.path.join(script_dir, '..', 'results')
+
+
+def parse_size(text):
+    """'10k', '1M', '10M' oder eine Zeilenzahl."""
+    if text in SIZES:
+        return SIZES[text]
+    factor = {'k': 1_000, 'm': 1_000_000}.get(text[-1].lower(), 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def size_label(rows):
+    return next((label for label, value in SIZES.items() if value == rows), str(rows))
+
+
+def git_state():
+    """Kurzer Hash des aktuellen Commits und ob der Arbeitsbaum Änderungen hat (None ohne git)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=script_dir, capture_output=True,
+                                text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def stage_commands(countries, workers, options, seed, rows):
+    """(Stufe, Skript, Argumente) in Ausführungsreihenfolge; 'daten' erzeugt die Eingaben."""
+    country_args = ['--countries'] + countries
+    duenn = ['--duenn'] if 'duenn' in options else []
+    blockweise = ['--blockweise'] if 'blockweise' in options else []
+    return [
+        ('daten', 'synthetische_daten.py', ['--zeilen', str(rows), '--seed', str(seed), '--workers', str(workers)]
+         + country_args),
+        ('01', '01_datenaufbereitung.py', country_args + ['--workers', str(workers)]),
+        ('02', '02_bereinigung.py', country_args + ['--workers', str(workers)]),
+        ('merkmale', 'merkmale.py', country_args + blockweise),
+        ('03', '03_analyse_zinb_glm.py', country_args + ['--kaltstart'] + duenn + blockweise),
+        ('06', '06_visualisierung.py', country_args + duenn),
+    ]
+
+
+def prepare_workdir(workdir):
+    """Arbeitsordner mit einer Kopie der Skripte; deren Pfade (../data, ../results) zeigen dann hierher."""
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(os.path.join(workdir, 'scripts'))
+    for path in glob.glob(os.path.join(script_dir, '*.py')):
+        shutil.copy2(path, os.path.join(workdir, 'scripts'))
+    for name in ['data', 'results', 'plots']:
+        os.makedirs(os.path.join(workdir, name))
+
+
+def run_measured(command, cwd, log_path):
+    """
+    Führt command aus und gibt (Rückgabecode, Sekunden, CPU-Sekunden, Spitzen-RSS in MB) zurück.
+    Der RSS stammt aus wait4 und umfasst alle beendeten Unterprozesse; ohne wait4 (Windows) fehlen
+    CPU-Zeit und RSS.
+    """
+    start_time = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        if not hasattr(os, 'wait4'):
+            return process.wait(), time.perf_counter() - start_time, None, None
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # Linux meldet KB, macOS Bytes
+    rss_mb = usage.ru_maxrss / 1024 ** 2 if sys.platform == 'darwin' else usage.ru_maxrss / 1024
+    return process.returncode, seconds, usage.ru_utime + usage.ru_stime, rss_mb
+
+
+def input_mb(workdir):
+    files = glob.glob(os.path.join(workdir, 'data', '*', '*.jsonl*'))
+    return sum(os.path.getsize(path) for path in files) / 1024 ** 2
+
+
+def run_size(workdir, rows, countries, workers, options, seed, run_info):
+    """Alle Stufen für eine Größe; bricht nach der ersten fehlgeschlagenen Stufe ab. Gibt die Messungen zurück."""
+    prepare_workdir(workdir)
+    work_scripts = os.path.join(workdir, 'scripts')
+    log_dir = os.path.join(workdir, 'results', 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    records = []
+    for stage, script, stage_args in stage_commands(countries, workers, options, seed, rows):
+        log_path = os.path.join(log_dir, f'benchmark_{stage}.log')
+        print(f"[{size_label(rows)}] {stage}: {script} {' '.join(stage_args)}")
+        returncode, seconds, cpu_seconds, rss_mb = run_measured(
+            [sys.executable, os.path.join(work_scripts, script)] + stage_args, work_scripts, log_path)
+        record = dict(run_info, rows=rows, size=size_label(rows), stage=stage, seconds=round(seconds, 3),
+                      cpu_seconds=None if cpu_seconds is None else round(cpu_seconds, 3),
+                      peak_rss_mb=None if rss_mb is None else round(rss_mb, 1), returncode=returncode)
+        if stage == 'daten':
+            record['input_mb'] = round(input_mb(workdir), 1)
+        records.append(record)
+        rss_text = 'n. v.' if rss_mb is None else f'{rss_mb:.0f} MB'
+        print(f"  {seconds:.2f} Sekunden, Spitzen-RSS {rss_text}")
+        if returncode != 0:
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                tail = f.readlines()[-20:]
+            print(f"  FEHLER (Rückgabecode {returncode}), letzte Zeilen von {log_path}:")
+            print(''.join(f'    {line}' for line in tail), end='')
+            break
+    return records
+
+
+def append_records(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def load_records(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def reference_records(history, run_info, commit=None):
+    """
+    Messungen des Vergleichslaufs je (Zeilen, Stufe): der letzte Lauf mit denselben Optionen und Ländern
+    auf diesem Rechner, von Commit commit (Präfix) oder sonst von einem anderen Commit als dem aktuellen.
+    """
+    def matches(record):
+        if (record['options'] != run_info['options'] or record['countries'] != run_info['countries']
+                or record['host'] != run_info['host'] or record['returncode'] != 0):
+            return False
+        if commit is not None:
+            return (record['commit'] or '').startswith(commit)
+        return record['commit'] != run_info['commit']
+
+    reference = {}
+    for record in history:
+        if matches(record):
+            reference[(record['rows'], record['stage'])] = record
+    return reference
+
+
+def change(value, before):
+    if value is None or before is None or before == 0:
+        return None
+    return value / before - 1
+
+
+def compare(records, reference, tolerance=DEFAULT_TOLERANCE):
+    """Vergleichstabelle von Laufzeit und RSS; gibt die Zahl der Verschlechterungen zurück."""
+    print(f"\n{'Größe':<6} | {'Stufe':<9} | {'Sekunden':>9} | {'CPU-s':>8} | {'RSS (MB)':>9} | "
+          f"{'Referenz':<9} | {'Δ Zeit':>8} | {'Δ RSS':>8}")
+    print("-" * 88)
+    regressions = 0
+    for record in records:
+        before = reference.get((record['rows'], record['stage']))
+        time_change = change(record['seconds'], before and before['seconds'])
+        rss_change = change(record['peak_rss_mb'], before and before['peak_rss_mb'])
+        flags = []
+        if (time_change is not None and time_change > tolerance
+                and record['seconds'] - before['seconds'] > MIN_SECONDS):
+            flags.append('Zeit')
+        if rss_change is not None and rss_change > tolerance:
+            flags.append('RSS')
+        regressions += bool(flags)
+        cpu = 'n. v.' if record['cpu_seconds'] is None else f"{record['cpu_seconds']:.2f}"
+        rss = 'n. v.' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.0f}"
+        time_text = '' if time_change is None else f'{time_change:+.0%}'
+        rss_text = '' if rss_change is None else f'{rss_change:+.0%}'
+        print(f"{record['size']:<6} | {record['stage']:<9} | {record['seconds']:>9.2f} | {cpu:>8} | {rss:>9} | "
+              f"{before['commit'] if before else '-':<9} | {time_text:>8} | {rss_text:>8}"
+              + (f"  VERSCHLECHTERT ({', '.join(flags)})" if flags else ''))
+    print("-" * 88)
+    if not reference:
+        print("Keine Referenzmessung mit denselben Optionen auf diesem Rechner (erster Lauf).")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst Laufzeit und Speicher der Pipeline auf synthetischen Daten")
+    parser.add_argument('--groessen', nargs='+', default=list(SIZES),
+                        help="Zeilen insgesamt je Lauf, z. B. 10k 1M 10M oder 250000 (Standard: 10k 1M 10M)")
+    parser.add_argument('--countries', nargs='+',
+                        help="Länder (Ordnername, ISO-Code oder Anzeigename); Standard: Deutschland, Frankreich, Estland")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Prozesse für Datenerzeugung, 01 und 02")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed der synthetischen Daten")
+    parser.add_argument('--duenn', action='store_true', help="03 und 06 mit dünn besetzten Designmatrizen")
+    parser.add_argument('--blockweise', action='store_true', help="merkmale.py und 03 blockweise")
+    parser.add_argument('--arbeitsordner', help="Ordner für Daten und Zwischenergebnisse (Standard: temporär)")
+    parser.add_argument('--behalten', action='store_true', help="Temporären Arbeitsordner nach dem Lauf nicht löschen")
+    parser.add_argument('--vergleich', metavar='COMMIT', help="Mit dem letzten Lauf dieses Commits vergleichen")
+    parser.add_argument('--toleranz', type=float, default=DEFAULT_TOLERANCE,
+                        help="Relativer Anstieg, ab dem eine Stufe als verschlechtert gilt (Standard: 0.2)")
+    parser.add_argument('--streng', action='store_true', help="Rückgabecode 1 bei Verschlechterungen")
+    args = parser.parse_args()
+
+    countries = [country_info(country)['folder'] for country in args.countries or DEFAULT_COUNTRIES]
+    options = [name for name in ['duenn', 'blockweise'] if getattr(args, name)]
+    commit, dirty = git_state()
+    run_info = {'run': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'dirty': dirty,
+                'host': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+                'workers': args.workers, 'seed': args.seed, 'countries': countries, 'options': options}
+    dirty_text = ' (mit lokalen Änderungen)' if dirty else ''
+    print(f"--- Benchmark: Commit {commit or 'unbekannt'}{dirty_text}, {len(args.groessen)} Größen ---")
+
+    base_dir = args.arbeitsordner or tempfile.mkdtemp(prefix='benchmark_')
+    records = []
+    try:
+        for size in args.groessen:
+            rows = parse_size(size)
+            records += run_size(os.path.join(base_dir, size_label(rows)), rows, countries, args.workers, options,
+                                args.seed, run_info)
+    finally:
+        if args.behalten or args.arbeitsordner:
+            print(f"Arbeitsordner: {base_dir}")
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    path = os.path.join(results_dir, BENCHMARK_DIR, BENCHMARK_FILE)
+    history = load_records(path)
+    regressions = compare(records, reference_records(history, run_info, args.vergleich), args.toleranz)
+    append_records(path, records)
+    print(f"Messungen angehängt an {os.path.relpath(path, os.path.join(script_dir, '..'))}.")
+    if any(record['returncode'] != 0 for record in records):
+        sys.exit(1)
+    if regressions:
+        print(f"Verschlechtert gegenüber der Referenz: {regressions} Stufen (Toleranz {args.toleranz:.0%}).")
+        if args.streng:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
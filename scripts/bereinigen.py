@@ -0,0 +1,246 @@
+import contextlib
+import io
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from protokoll import record_steps
+from speicher import DEFAULT_FORMAT, RAW_SCHEMA, READY_SCHEMA, dataset_path, read_table, write_table
+from verteilung import CountrySketches, write_sketches
+
+# Wettbewerbliche Verfahren, die für die Analyse relevant sind
+COMPETITIVE_METHODS = ['open', 'selective']  # Passe diese Liste bei Bedarf an
+
+# Datumsangaben in OpenTender: ISO 8601 als Datum oder Zeitpunkt, optional mit Sekundenbruchteilen
+# und Zeitzone ('Z' oder '+01:00'), z. B. '2019-03-19', '2019-03-19T10:00:00Z', '2019-03-19T10:00:00.000+01:00'
+ISO_DATE_PATTERN = (r'\d{4}-\d{2}-\d{2}'
+                    r'(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?'
+                    r'(?:Z|[+-]\d{2}:?\d{2})?')
+
+# Angaben in anderen Formaten: europäische Schreibweise (Tag vor Monat), z. B. '05.03.2019' = 5. März
+FALLBACK_DAYFIRST = True
+
+# Filterschritte der Bereinigung in ihrer Reihenfolge (Schlüssel in drops -> Name im Protokoll)
+CLEANING_STEPS = [
+    ('missing_dates', 'fehlende Datumsangaben'),
+    ('end_before_start', 'Ende vor Start'),
+    ('non_competitive', 'nicht-wettbewerbliches Verfahren'),
+]
+
+
+def ready_output_path(results_dir, country_name, fmt=DEFAULT_FORMAT):
+    return dataset_path(results_dir, f'{country_name.lower()}_analysis_ready', fmt)
+
+
+def parse_iso_dates(values):
+    """
+    Wandelt eine Spalte mit Datumsangaben (Text) schnell in datetime um.
+    Jede unterschiedliche Angabe wird nur einmal umgewandelt (viele Ausschreibungen teilen ein Datum);
+    ISO-8601-Angaben werden vektorisiert mit festem Format gelesen, nur unbekannte Formate über
+    den langsamen Weg von pd.to_datetime. Fehlerhafte Einträge werden zu 'NaT'.
+
+    Alle Angaben werden als UTC gelesen (Angaben ohne Zeitzone gelten als UTC) und ohne Zeitzone
+    zurückgegeben, sodass der Typ (datetime64[ns]) nicht von der Spalte oder dem Block abhängt.
+    Gibt die umgewandelte Spalte und die Anzahl der Werte auf dem langsamen Weg zurück.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype='object').astype(str)
+    is_iso = uniques.str.fullmatch(ISO_DATE_PATTERN)
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns, UTC]')
+    if is_iso.any():
+        parsed[is_iso] = pd.to_datetime(uniques[is_iso], format='ISO8601', errors='coerce', utc=True)
+    if not is_iso.all():
+        with warnings.catch_warnings():
+            # Hinweise zu unbekannten Formaten; die Werte werden gezählt
+            warnings.simplefilter('ignore')
+            # Format je Angabe erkennen (nicht aus der ersten übernehmen), damit das Ergebnis nur von der
+            # Angabe selbst abhängt und nicht von den übrigen Werten im Block
+            parsed[~is_iso] = pd.to_datetime(uniques[~is_iso], format='mixed', dayfirst=FALLBACK_DAYFIRST,
+                                             errors='coerce', utc=True)
+    parsed = parsed.dt.tz_convert(None)
+
+    n_fallback = int(np.isin(codes, np.flatnonzero(~is_iso.to_numpy())).sum())
+    # Zurück auf alle Zeilen verteilen (Code -1 = fehlender Wert -> NaT)
+    result = pd.Series(parsed.array.take(codes, allow_fill=True), index=values.index)
+    return result, n_fallback
+
+
+def parse_dates(df):
+    """
+    Wandelt die Datums-Spalten in das korrekte datetime-Format um.
+    Fehlerhafte Einträge werden zu 'NaT' (Not a Time), was als fehlender Wert behandelt wird.
+    Gibt den DataFrame und die Anzahl der Werte zurück, deren Format nicht erkannt wurde.
+    """
+    n_fallback = 0
+    for col in ['publication_date', 'end_date']:
+        df[col], n = parse_iso_dates(df[col])
+        n_fallback += n
+    return df, n_fallback
+
+
+def apply_filters(df):
+    """
+    Filtert fehlende und unlogische Daten sowie nicht-wettbewerbliche Verfahren.
+    Gibt den gefilterten DataFrame und die Anzahl entfernter Zeilen je Grund zurück.
+    """
+    drops = {}
+    current_rows = len(df)
+
+    # 3a: Entferne alle Zeilen, in denen das Start- oder Enddatum fehlt.
+    # Ohne diese können wir die Dauer nicht berechnen.
+    df = df.dropna(subset=['publication_date', 'end_date'])
+    drops['missing_dates'] = current_rows - len(df)
+    current_rows = len(df)
+
+    # 3b: Entferne unlogische Einträge, bei denen das Enddatum vor dem Startdatum liegt.
+    df = df[df['end_date'] >= df['publication_date']].copy()
+    drops['end_before_start'] = current_rows - len(df)
+    current_rows = len(df)
+
+    # 3c (Optional, aber empfohlen): Filtere nur auf wettbewerbliche Verfahren, die für deine Analyse relevant sind.
+    df = df[df['procurement_method'].isin(COMPETITIVE_METHODS)].copy()
+    drops['non_competitive'] = current_rows - len(df)
+    return df, drops
+
+
+def compute_variables(df):
+    """Berechnet die Analysevariablen (Operationalisierung)."""
+    # 4a: Berechne die Dauer in Tagen (unsere unabhängige Variable)
+    df['duration_days'] = (df['end_date'] - df['publication_date']).dt.days
+
+    # 4b: Finalisiere die abhängigen Variablen (Anzahl der Gebote)
+    # Fehlende Werte bei den Geboten füllen wir mit 0 auf (Annahme: Kein Eintrag = 0 Gebote)
+    df['total_bids'] = df['total_bids'].fillna(0)
+    df['sme_bids'] = df['sme_bids'].fillna(0)
+    # In saubere Ganzzahlen umwandeln
+    df['total_bids'] = df['total_bids'].astype(int)
+    df['sme_bids'] = df['sme_bids'].astype(int)
+    return df
+
+
+def clean_batch(df):
+    """
+    Wendet alle Bereinigungsschritte auf einen Block von Rohdaten an (für die Bereinigung
+    direkt im Extraktionsstrom). Gibt den bereinigten Block und die entfernten Zeilen je Grund zurück
+    (unter 'date_fallback' zusätzlich die Datumswerte in unbekanntem Format).
+    """
+    df, n_fallback = parse_dates(df)
+    df, drops = apply_filters(df)
+    drops['date_fallback'] = n_fallback
+    return compute_variables(df), drops
+
+
+def print_drops(drops):
+    """Gibt die entfernten Zeilen je Grund im Format der Bereinigung aus."""
+    print(f"-> {drops['missing_dates']} Zeilen wegen fehlender Daten entfernt.")
+    print(f"-> {drops['end_before_start']} Zeilen wegen unlogischer Daten (Ende vor Start) entfernt.")
+    print(f"-> {drops['non_competitive']} Zeilen wegen nicht-wettbewerblicher Verfahren entfernt.")
+
+
+def print_fallback(n_fallback):
+    """Meldet, wie viele Datumswerte nicht im ISO-Format vorlagen (langsamer Weg)."""
+    print(f"-> {n_fallback} Datumswerte in unbekanntem Format (langsame Umwandlung).")
+
+
+def lineage_steps(country_name, rows_in, drops):
+    """Protokolleinträge der Bereinigung aus der Zeilenzahl vorher und den entfernten Zeilen je Grund."""
+    steps = []
+    for key, step in CLEANING_STEPS:
+        rows_out = rows_in - drops[key]
+        steps.append({'country': country_name, 'step': step, 'rows_in': rows_in, 'rows_out': rows_out})
+        rows_in = rows_out
+    return steps
+
+
+def clean_country(country_name, raw_file_path, final_output_file):
+    """
+    Bereinigt die Rohdaten eines Landes und erstellt die Analysevariablen
+    (ehemals der Inhalt von 02_bereinigung_*.py).
+    Gibt die Protokolleinträge der Filterschritte zurück (siehe protokoll.py).
+    """
+    print(f"--- Starte Datenbereinigung & Variablenerstellung für {country_name} ---")
+
+    # --- Schritt 1: Lade die aufbereiteten Rohdaten ---
+    print(f"Lade Rohdaten aus: {raw_file_path}")
+    start_time = time.time()
+    df = read_table(raw_file_path, schema=RAW_SCHEMA)
+    rows_in = len(df)
+    print(f"-> Fertig in {time.time() - start_time:.2f} Sekunden. {df.shape[0]} Zeilen geladen.")
+
+    # --- Schritt 2: Datentypen korrigieren ---
+    print("\nSchritt 2: Wandle Datumsspalten um...")
+    df, n_fallback = parse_dates(df)
+    print("-> Datumsspalten erfolgreich umgewandelt.")
+    print_fallback(n_fallback)
+
+    # --- Schritt 3: Fehlende und unlogische Daten filtern ---
+    print("\nSchritt 3: Filtere fehlende und unlogische Daten...")
+    df, drops = apply_filters(df)
+    print_drops(drops)
+
+    # --- Schritt 4: Variablen berechnen (Operationalisierung) ---
+    print("\nSchritt 4: Berechne die Analysevariablen...")
+    df = compute_variables(df)
+    print("-> 'duration_days', 'total_bids' und 'sme_bids' finalisiert.")
+
+    # --- Schritt 5: Finalen Datensatz speichern ---
+    write_table(df, final_output_file, schema=READY_SCHEMA)
+    # Verteilungsskizzen je Jahr (für 07 und den p99-Cap, siehe verteilung.py)
+    sketches = CountrySketches()
+    sketches.update(df)
+    write_sketches(os.path.dirname(final_output_file), country_name, sketches, final_output_file)
+
+    print("\n--- Prozess abgeschlossen! ---")
+    print(f"Der finale, analysebereite Datensatz hat {df.shape[0]} Zeilen.")
+    print(f"Gespeichert unter: {final_output_file}")
+
+    # Zeige eine Vorschau und wichtige Kennzahlen des finalen Datensatzes
+    print("\nAnalyse des finalen Datensatzes:")
+    print(df[['duration_days', 'total_bids', 'sme_bids', 'tender_value']].describe())
+    return lineage_steps(country_name, rows_in, drops)
+
+
+def clean_country_captured(job):
+    """
+    Wie clean_country, aber die Ausgabe wird gesammelt und als Text zurückgegeben,
+    damit sich die Protokolle parallel bereinigter Länder nicht vermischen.
+    """
+    country_name, raw_file_path, final_output_file = job
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        steps = clean_country(country_name, raw_file_path, final_output_file)
+    return steps, buffer.getvalue()
+
+
+def clean_countries(jobs, workers=1, pool=None):
+    """
+    Bereinigt mehrere Länder; jobs ist eine Liste von (Land, Rohdatei, Ausgabedatei).
+    Mit workers > 1 (oder einem übergebenen Pool) laufen die Länder parallel.
+    Die Filterschritte werden im Protokoll der Stichprobenreduktion (Stufe 'bereinigung') vermerkt.
+    Gibt ein Dictionary Land -> Anzahl Zeilen zurück.
+    """
+    results = []
+    if workers <= 1 and pool is None:
+        for job in jobs:
+            results.append(clean_country(*job))
+            print()
+    else:
+        if pool is None:
+            with ProcessPoolExecutor(max_workers=workers) as own_pool:
+                captured = list(own_pool.map(clean_country_captured, jobs))
+        else:
+            captured = list(pool.map(clean_country_captured, jobs))
+        for steps, log in captured:
+            print(log)
+            results.append(steps)
+
+    counts = {}
+    for job, steps in zip(jobs, results):
+        counts[job[0]] = steps[-1]['rows_out']
+        record_steps(os.path.dirname(job[2]), 'bereinigung', steps)
+    return counts
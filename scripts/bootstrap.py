@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from robustheit import build_design, fit_design
+
+# --- Bootstrap der Hauptmodelle ---
+# Nichtparametrischer Bootstrap: jede Replikation zieht innerhalb jeder Schicht Land × Jahr so viele Zeilen
+# mit Zurücklegen, wie die Schicht hat, und schätzt das Modell darauf neu (Newton ab den Koeffizienten der
+# vollen Stichprobe). Der Zufallsstrom einer Replikation hängt nur von Seed und Nummer ab, nicht von der
+# Reihenfolge oder der Zahl der Prozesse. Jede fertige Replikation wird sofort als Zeile an
+# results/bootstrap/<modell>_<schlüssel>_s<seed>.jsonl angehängt (Schlüssel wie das Modellartefakt);
+# ein abgebrochener Lauf setzt bei den fehlenden Replikationen fort.
+BOOTSTRAP_DIR = 'bootstrap'
+STRATA_COLUMNS = ['country', 'year']
+DEFAULT_SEED = 2024
+
+# Zustand je Arbeitsprozess (Design und Schichten werden einmal je Prozess aufgebaut, nicht je Replikation)
+_worker = {}
+
+
+def replicate_path(results_dir, name, key, seed):
+    return os.path.join(results_dir, BOOTSTRAP_DIR, f'{name}_{key}_s{seed}.jsonl')
+
+
+def strata_indices(data, columns=STRATA_COLUMNS):
+    """Zeilenpositionen je Schicht (sortiert nach den Schichtmerkmalen)."""
+    return [np.asarray(rows) for _, rows in sorted(data.groupby(columns, observed=True).indices.items())]
+
+
+def replicate_rows(strata, seed, replicate):
+    """Zeilen einer Replikation: Ziehen mit Zurücklegen innerhalb jeder Schicht."""
+    rng = np.random.default_rng([seed, replicate])
+    return np.concatenate([rows[rng.integers(0, len(rows), len(rows))] for rows in strata])
+
+
+def load_replicates(path):
+    """Bereits geschätzte Replikationen je Nummer; unlesbare Zeilen (abgebrochener Schreibvorgang) fehlen."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['replicate']] = record
+    return records
+
+
+def _drop_partial_line(path):
+    """Kürzt die Datei auf die letzte vollständige Zeile, damit angehängte Zeilen nicht verkleben."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+
+def _init_worker(spec, data, countries, main_params, seed, sparse):
+    y, X, Z, design_info = build_design(spec, data, countries, sparse)
+    _worker.update(spec=spec, y=y, X=X, Z=Z, design_info=design_info, main_params=main_params, seed=seed,
+                   strata=strata_indices(data))
+
+
+def fit_replicate(replicate):
+    """Schätzt eine Replikation im Arbeitsprozess; Fehler werden als 'error' vermerkt."""
+    rows = replicate_rows(_worker['strata'], _worker['seed'], replicate)
+    Z = _worker['Z']
+    start_time = time.time()
+    try:
+        result = fit_design(_worker['spec'], _worker['y'][rows], _worker['X'][rows], None if Z is None else Z[rows],
+                            _worker['design_info'], _worker['main_params'], start_name='Hauptmodell',
+                            cov_type='nonrobust')
+    except Exception as e:
+        return {'replicate': replicate, 'error': str(e)}
+    info = result.mle_retvals
+    return {'replicate': replicate, 'converged': bool(info['converged']), 'iterations': int(info['iterations']),
+            'seconds': round(time.time() - start_time, 3), 'params': result.params.to_dict()}
+
+
+def _iter_fits(replicates, init_args, workers):
+    if workers <= 1 or len(replicates) <= 1:
+        _init_worker(*init_args)
+        for replicate in replicates:
+            yield fit_replicate(replicate)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(replicates)), initializer=_init_worker,
+                             initargs=init_args) as pool:
+        futures = [pool.submit(fit_replicate, replicate) for replicate in replicates]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_bootstrap(results_dir, spec, data, countries, main_result, replicates, seed=DEFAULT_SEED, workers=1,
+                  sparse=False):
+    """
+    Bootstrap-Replikationen 0 bis replicates-1 des Modells main_result (Modellartefakt der Stichprobe data).
+    Vorhandene Replikationen werden aus der Datei übernommen, nur die fehlenden geschätzt und sofort
+    angehängt. Gibt die Replikationen in der Reihenfolge ihrer Nummern zurück.
+    """
+    path = replicate_path(results_dir, spec['family'], main_result.key, seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    records = load_replicates(path)
+    todo = [replicate for replicate in range(replicates) if replicate not in records]
+    print(f"{spec['name']} {spec['title']}: {replicates - len(todo)} von {replicates} Replikationen vorhanden, "
+          f"schätze {len(todo)} mit bis zu {workers} Prozessen...")
+    start_time = time.time()
+    if todo:
+        _drop_partial_line(path)
+        with open(path, 'a', encoding='utf-8') as f:
+            for done, record in enumerate(_iter_fits(todo, (spec, data, countries, main_result.params, seed, sparse),
+                                                     workers), start=1):
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                records[record['replicate']] = record
+                if done % 100 == 0:
+                    print(f"  {done} von {len(todo)} Replikationen ({time.time() - start_time:.1f} Sekunden)")
+    print(f"  Fertig nach {time.time() - start_time:.1f} Sekunden: {os.path.relpath(path, results_dir)}")
+    return [records[replicate] for replicate in range(replicates)]
+
+
+def bootstrap_intervals(records, result, alpha=0.05):
+    """
+    Perzentil-Intervalle und Bootstrap-Standardfehler je Parameter aus den konvergierten Replikationen,
+    neben Koeffizient und modellbasiertem Standardfehler der vollen Stichprobe. Gibt die Tabelle und die
+    Zahl der verwendeten Replikationen zurück.
+    """
+    draws = pd.DataFrame([record['params'] for record in records if record.get('converged')],
+                         columns=result.params.index)
+    table = pd.DataFrame({'coef': result.params, 'se_modell': result.bse, 'se_bootstrap': draws.std(ddof=1),
+                          'ci_unten': draws.quantile(alpha / 2), 'ci_oben': draws.quantile(1 - alpha / 2)})
+    return table, len(draws)
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import patsy
+from scipy import stats
+from scipy.special import expit
+
+# --- Vorhersagen und marginale Effekte mit Delta-Methode ---
+# Für ein ModelResults (ZINB oder Fractional Logit, siehe zaehlmodelle.py) werden vorhergesagte
+# Erwartungswerte und marginale Effekte einer stetigen Variablen (z_duration) für ganze Wertegitter auf
+# einmal berechnet, gemittelt über die Zeilen eines Profils: eine Zeile ("an den Modi") oder eine Stichprobe
+# ("gemittelt über die Stichprobe"). Da das Design linear in der Variablen ist (Haupteffekt und
+# Interaktionen mit Faktoren), gilt X(v) = X0 + v * D; Erwartungswerte, Effekte und deren Gradienten nach
+# den Parametern entstehen damit für alle Gitterpunkte als Matrixprodukte, die Standardfehler über
+# die Delta-Methode (J Cov J'). Die Zeilen werden blockweise verarbeitet (Speicher: Block x Gitterpunkte).
+
+DEFAULT_CHUNK_ROWS = 20_000
+
+
+def design(result, data):
+    return np.asarray(patsy.build_design_matrices([result.design_info], data)[0])
+
+
+def linear_design(result, data, variable):
+    """X0 (Design bei variable = 0) und D = dX/d variable; ValueError, wenn das Design nicht linear ist."""
+    X0 = design(result, data.assign(**{variable: 0.0}))
+    X1 = design(result, data.assign(**{variable: 1.0}))
+    D = X1 - X0
+    if not np.allclose(design(result, data.assign(**{variable: 2.0})) - X1, D):
+        raise ValueError(f"Design ist nicht linear in {variable}")
+    return X0, D
+
+
+def _block(result, X0, D, Z, V):
+    """
+    Summen über die Zeilen eines Blocks für alle Gitterpunkte (Spalten von V, Werte der Variablen je Zeile):
+    Erwartungswert und marginaler Effekt (je Länge G) sowie ihre Gradienten nach den Parametern (G x K).
+    """
+    params = result.params.to_numpy()
+    k_infl = len(result.infl_columns)
+    beta = params[k_infl:-1] if k_infl else params
+    slope = D @ beta
+    eta = (X0 @ beta)[:, None] + V * slope[:, None]
+    if k_infl:
+        # ZINB: m = (1 - w) exp(eta), w aus dem Inflations-Design (unabhängig von der Variablen)
+        w = expit(Z @ params[:k_infl])[:, None]
+        mean = (1 - w) * np.exp(eta)
+        d_mean, d_effect, d_linear = mean, mean * slope[:, None], mean
+        infl_mean, infl_effect = -(w * mean).T @ Z, -(w * mean * slope[:, None]).T @ Z
+    else:
+        # Fractional Logit: m = expit(eta)
+        mean = expit(eta)
+        d_mean = mean * (1 - mean)
+        d_effect, d_linear = d_mean * (1 - 2 * mean) * slope[:, None], d_mean
+    effect = d_linear * slope[:, None]
+    # d/dbeta sum_i f_i(eta_i) = f'(eta)' X0 + (f'(eta) V)' D; beim Effekt zusätzlich der Term aus slope
+    grad_mean = d_mean.T @ X0 + (d_mean * V).T @ D
+    grad_effect = d_effect.T @ X0 + (d_effect * V).T @ D + d_linear.T @ D
+    if k_infl:
+        alpha = np.zeros((V.shape[1], 1))
+        grad_mean = np.hstack([infl_mean, grad_mean, alpha])
+        grad_effect = np.hstack([infl_effect, grad_effect, alpha])
+    return mean.sum(axis=0), effect.sum(axis=0), grad_mean, grad_effect
+
+
+def _margins(result, data, values, variable, alpha, chunk_rows):
+    """Mittelwerte über die Zeilen von data; values: Gitter (Länge G) oder None (beobachtete Werte, G = 1)."""
+    n_points = 1 if values is None else len(values)
+    k = len(result.params)
+    mean, effect = np.zeros(n_points), np.zeros(n_points)
+    grad_mean, grad_effect = np.zeros((n_points, k)), np.zeros((n_points, k))
+    for start in range(0, len(data), chunk_rows):
+        block = data.iloc[start:start + chunk_rows]
+        X0, D = linear_design(result, block, variable)
+        Z = block[result.infl_columns].to_numpy(dtype='float64') if result.infl_columns else None
+        V = (block[[variable]].to_numpy(dtype='float64') if values is None
+             else np.broadcast_to(np.asarray(values, dtype='float64'), (len(block), n_points)))
+        sums = _block(result, X0, D, Z, V)
+        mean += sums[0]
+        effect += sums[1]
+        grad_mean += sums[2]
+        grad_effect += sums[3]
+
+    n = len(data)
+    cov = np.asarray(result.cov_params())
+    q = stats.norm.ppf(1 - alpha / 2)
+    table = {}
+    for name, estimate, grad in [('pred', mean / n, grad_mean / n), ('me', effect / n, grad_effect / n)]:
+        se = np.sqrt(np.einsum('gk,kl,gl->g', grad, cov, grad))
+        table.update({name: estimate, f'{name}_se': se, f'{name}_unten': estimate - q * se,
+                      f'{name}_oben': estimate + q * se})
+    return pd.DataFrame(table)
+
+
+def prediction_grid(result, profile, values, variable='z_duration', alpha=0.05, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Vorhergesagter Erwartungswert (pred) und marginaler Effekt von variable (me) für jeden Wert in values,
+    gemittelt über die Zeilen von profile (eine Zeile: an festen Werten, z. B. den Modi), mit Standardfehlern
+    und (1 - alpha)-Konfidenzintervallen der Delta-Methode. Eine Zeile je Wert.
+    """
+    table = _margins(result, profile, values, variable, alpha, chunk_rows)
+    table.insert(0, variable, np.asarray(values, dtype='float64'))
+    return table
+
+
+def average_marginal_effect(result, data, variable='z_duration', by=None, alpha=0.05, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Durchschnittlicher marginaler Effekt (AME) von variable an den beobachteten Werten der Stichprobe data,
+    optional je Ausprägung von by (z. B. 'country'), mit Delta-Methode-Standardfehlern.
+    """
+    if by is None:
+        return _margins(result, data, None, variable, alpha, chunk_rows)
+    tables = [_margins(result, group, None, variable, alpha, chunk_rows).assign(**{by: level})
+              for level, group in data.groupby(by, observed=True)]
+    return pd.concat(tables, ignore_index=True).set_index(by)
@@ -0,0 +1,457 @@
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from bereinigen import CLEANING_STEPS, clean_batch
+from speicher import DEFAULT_FORMAT, RAW_SCHEMA, READY_SCHEMA, TableWriter, apply_schema, dataset_path, iter_batches
+from verteilung import CountrySketches, write_sketches
+
+# Spaltenreihenfolge der Rohdaten (entspricht den Schlüsseln aus extract_tender_data)
+RAW_COLUMNS = [
+    'tender_id', 'buyer_id', 'publication_date', 'end_date', 'total_bids', 'sme_bids', 'tender_value',
+    'procurement_method', 'procurement_category', 'award_criteria', 'year'
+]
+
+# Spaltenreihenfolge des analysebereiten Datensatzes (wie nach der Bereinigung in 02)
+READY_COLUMNS = RAW_COLUMNS + ['duration_days']
+
+# Ausgabestufen der Extraktion: 'raw' schreibt die Rohdaten, 'ready' wendet die Filter
+# der Bereinigung bereits im Datenstrom an und schreibt direkt den analysebereiten Datensatz
+STAGES = {
+    'raw': (RAW_SCHEMA, RAW_COLUMNS),
+    'ready': (READY_SCHEMA, READY_COLUMNS),
+}
+
+# Dateien über dieser Größe werden in mehrere Byte-Abschnitte aufgeteilt
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Anzahl extrahierter Zeilen, die gesammelt und dann gemeinsam geschrieben werden
+DEFAULT_BATCH_SIZE = 50_000
+
+COPY_BUFFER_BYTES = 16 * 1024 * 1024
+
+# Lesepuffer für komprimierte Eingaben
+READ_BUFFER_BYTES = 8 * 1024 * 1024
+
+# Unterstützte Eingabeformate: Endung -> Kompression (None = unkomprimiert)
+INPUT_SUFFIXES = {
+    '.jsonl': None,
+    '.jsonl.gz': 'gzip',
+    '.jsonl.zst': 'zstd',
+    '.jsonl.xz': 'xz',
+}
+
+# Bei Änderungen an der Extraktionslogik erhöhen, damit alle Partitionen neu erstellt werden
+MANIFEST_VERSION = 4
+
+
+# --- Hilfsfunktion zum Extrahieren der Daten aus einem JSON-Objekt ---
+def extract_tender_data(tender_json, year):
+    """
+    Extrahiert alle für die Analyse benötigten Felder aus einem JSON-Objekt.
+    Gibt ein "flaches" Dictionary zurück.
+    """
+    tender_info = tender_json.get('tender', {})
+
+    # Extrahiere alle benötigten Felder sicher mit .get()
+    publication_date = tender_json.get('date')
+    end_date = tender_info.get('tenderPeriod', {}).get('endDate')
+
+    tender_value = tender_info.get('value', {}).get('amount')
+    procurement_method = tender_info.get('procurementMethod')
+    procurement_category = tender_info.get('mainProcurementCategory')
+    award_criteria = tender_info.get('awardCriteria')  # NEU
+    tender_id = tender_info.get('id')
+    # Kennung des Auftraggebers (OCDS: buyer.id), z. B. für Cluster-robuste Standardfehler
+    buyer_id = (tender_json.get('buyer') or {}).get('id')
+
+    # Extrahiere Gebotsstatistiken
+    total_bids, sme_bids = None, None
+    if 'statistics' in tender_json.get('bids', {}):
+        for stat in tender_json['bids']['statistics']:
+            if stat.get('measure') == 'electronicBids':
+                total_bids = stat.get('value')
+            if stat.get('measure') == 'smeBids':
+                sme_bids = stat.get('value')
+
+    return {
+        'tender_id': tender_id,
+        'buyer_id': buyer_id,
+        'publication_date': publication_date,
+        'end_date': end_date,
+        'total_bids': total_bids,
+        'sme_bids': sme_bids,
+        'tender_value': tender_value,
+        'procurement_method': procurement_method,
+        'procurement_category': procurement_category,
+        'award_criteria': award_criteria,  # NEU
+        'year': year  # NEU
+    }
+
+
+def input_suffix(filename):
+    """Gibt die erkannte Endung (z. B. '.jsonl.gz') zurück oder None."""
+    for suffix in INPUT_SUFFIXES:
+        if filename.endswith(suffix):
+            return suffix
+    return None
+
+
+def is_compressed(file_path):
+    return INPUT_SUFFIXES.get(input_suffix(os.path.basename(file_path))) is not None
+
+
+def year_from_filename(filename):
+    """Liest das Jahr aus Dateinamen wie 'germany_2019.jsonl' oder 'germany_2019.jsonl.gz'."""
+    return int(filename[:-len(input_suffix(filename))].split('_')[-1])
+
+
+def list_input_files(data_path):
+    """
+    Listet alle jährlichen *.jsonl-Dateien (auch komprimiert) eines Länderordners auf.
+    Gibt (Pfad, Jahr)-Paare in fester Reihenfolge zurück.
+    """
+    files = []
+    for filename in sorted(os.listdir(data_path)):
+        if input_suffix(filename):
+            files.append((os.path.join(data_path, filename), year_from_filename(filename)))
+    return files
+
+
+def split_file(file_path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Teilt eine Datei in Byte-Bereiche [start, end) auf.
+    Die Grenzen werden erst beim Lesen auf Zeilenanfänge verschoben (siehe iter_lines).
+    Komprimierte Dateien lassen sich nicht an beliebiger Stelle lesen und bleiben ein Abschnitt.
+    """
+    size = os.path.getsize(file_path)
+    chunk_bytes = max(1, chunk_bytes)
+    if size <= chunk_bytes or is_compressed(file_path):
+        return [(0, size)]
+    return [(start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def open_compressed(file_path):
+    """
+    Öffnet eine komprimierte Eingabedatei als Datenstrom, der beim Lesen entpackt wird.
+    Es wird nichts auf die Festplatte entpackt; große Puffer halten die Zahl der Lesezugriffe klein.
+    """
+    compression = INPUT_SUFFIXES[input_suffix(os.path.basename(file_path))]
+    raw = open(file_path, 'rb', buffering=READ_BUFFER_BYTES)
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw, mode='rb')
+    elif compression == 'xz':
+        stream = lzma.LZMAFile(raw, mode='rb')
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raw.close()
+            raise ImportError(f"Für {os.path.basename(file_path)} wird das Paket 'zstandard' benötigt "
+                              "(pip install zstandard).")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_BUFFER_BYTES, closefd=True)
+    return io.BufferedReader(stream, buffer_size=READ_BUFFER_BYTES)
+
+
+def iter_lines(file_path, start, end):
+    """
+    Liefert alle Zeilen, deren erstes Byte im Bereich [start, end) liegt.
+    So wird jede Zeile genau einem Abschnitt zugeordnet, egal wo die Grenzen liegen.
+
+    Unkomprimierte Dateien werden per Memory-Mapping gelesen, komprimierte
+    als entpackender Datenstrom (dort ist der Bereich immer die ganze Datei).
+    """
+    if is_compressed(file_path):
+        with open_compressed(file_path) as f:
+            for line in f:
+                if line.strip():
+                    yield line
+        return
+
+    if end <= start:
+        return
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if start > 0:
+            # Rest der angeschnittenen Zeile überspringen (gehört zum vorherigen Abschnitt)
+            mm.seek(start - 1)
+            mm.readline()
+        pos = mm.tell()
+        while pos < end:
+            line = mm.readline()
+            if not line:
+                break
+            pos += len(line)
+            if line.strip():
+                yield line
+
+
+class BatchWriter:
+    """
+    Sammelt extrahierte Zeilen und schreibt sie in Blöcken fester Größe in eine Datei
+    (Format nach Dateiendung, Schema der Stufe).
+    Der Speicherbedarf hängt damit nur von batch_size ab, nicht von der Datenmenge.
+
+    Mit stage='ready' wird jeder Block vor dem Schreiben wie in 02 bereinigt; verworfene
+    Zeilen werden nur je Grund gezählt (siehe stats) und nie geschrieben.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, stage='raw'):
+        self.batch_size = batch_size
+        self.stage = stage
+        self.stats = {'rows_in': 0, 'rows_out': 0}
+        self._rows = []
+        schema, columns = STAGES[stage]
+        self._writer = TableWriter(path, schema, columns=columns, sidecar=False)
+
+    def add(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            df = pd.DataFrame(self._rows, columns=RAW_COLUMNS)
+            self.stats['rows_in'] += len(df)
+            if self.stage == 'ready':
+                df, drops = clean_batch(apply_schema(df, RAW_SCHEMA))
+                for reason, n in drops.items():
+                    self.stats[reason] = self.stats.get(reason, 0) + n
+            if len(df):
+                self._writer.write(df)
+            self._rows = []
+
+    def close(self):
+        """Schreibt den letzten Block und gibt die Zähler (gelesene/geschriebene Zeilen, Filter) zurück."""
+        self.flush()
+        self.stats['rows_out'] = self._writer.close()
+        return self.stats
+
+
+def process_chunk(task):
+    """
+    Verarbeitet einen Abschnitt (Pfad, Jahr, start, end, Teil-Datei, batch_size, Stufe)
+    und schreibt die extrahierten Zeilen blockweise in die Teil-Datei (Parquet).
+    Gibt die Zähler des BatchWriter zurück.
+    """
+    file_path, year, start, end, part_path, batch_size, stage = task
+    writer = BatchWriter(part_path, batch_size=batch_size, stage=stage)
+    for line in iter_lines(file_path, start, end):
+        extracted_data = extract_tender_data(json.loads(line), year)
+        writer.add(tuple(extracted_data[col] for col in RAW_COLUMNS))
+    return writer.close()
+
+
+def build_tasks(files, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Erstellt aus (Pfad, Jahr)-Paaren die Abschnitte (Pfad, Jahr, start, end)."""
+    tasks = []
+    for file_path, year in files:
+        for start, end in split_file(file_path, chunk_bytes):
+            tasks.append((file_path, year, start, end))
+    return tasks
+
+
+def raw_output_path(results_dir, country_name, fmt=DEFAULT_FORMAT):
+    return dataset_path(results_dir, f'{country_name.lower()}_all_tenders_raw', fmt)
+
+
+def manifest_path(results_dir, country_name, stage='raw'):
+    suffix = '' if stage == 'raw' else f'_{stage}'
+    return os.path.join(results_dir, f'{country_name.lower()}{suffix}_manifest.json')
+
+
+def partition_dir(results_dir, country_name, stage='raw'):
+    suffix = '' if stage == 'raw' else f'_{stage}'
+    return os.path.join(results_dir, 'partitions', country_name.lower() + suffix)
+
+
+def sum_stats(stats_list):
+    """Addiert Zähler-Dictionaries (z. B. je Abschnitt zu je Datei oder je Land)."""
+    total = {}
+    for stats in stats_list:
+        for key, n in stats.items():
+            total[key] = total.get(key, 0) + n
+    return total
+
+
+def file_hash(file_path):
+    """SHA-256 des Dateiinhalts, blockweise gelesen."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    """
+    Lädt das Manifest der bereits verarbeiteten Eingabedateien.
+    Ein fehlendes Manifest oder eines aus einer älteren Extraktionslogik gilt als leer.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(path, entries, output_file):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'output': {'path': os.path.basename(output_file),
+                   'size': os.path.getsize(output_file),
+                   'mtime': os.path.getmtime(output_file)},
+        'files': entries,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def output_is_current(manifest_file, output_file):
+    """Prüft, ob die Ausgabedatei noch diejenige ist, die beim letzten Lauf geschrieben wurde."""
+    if not os.path.exists(manifest_file) or not os.path.exists(output_file):
+        return False
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        output = json.load(f).get('output', {})
+    return (output.get('size') == os.path.getsize(output_file)
+            and output.get('mtime') == os.path.getmtime(output_file))
+
+
+def find_changed_files(files, entries, parts_dir):
+    """
+    Vergleicht die Eingabedateien mit dem Manifest und gibt die Namen der neuen oder
+    geänderten Dateien sowie die aktualisierten Manifest-Einträge zurück.
+    Der Hash wird nur berechnet, wenn sich Größe oder Änderungszeit unterscheiden;
+    fehlt die Partition einer Datei, wird sie ebenfalls neu gelesen.
+    """
+    changed, new_entries = [], {}
+    for file_path, year in files:
+        filename = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        entry = dict(entries.get(filename, {}))
+        if not os.path.isdir(os.path.join(parts_dir, filename)):
+            entry = {}
+        if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            new_entries[filename] = entry
+            continue
+        content_hash = file_hash(file_path)
+        if entry.get('sha256') != content_hash:
+            changed.append(filename)
+        entry.update({'path': os.path.normpath(file_path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                      'sha256': content_hash, 'year': year})
+        new_entries[filename] = entry
+    return changed, new_entries
+
+
+def extract_countries(jobs, workers=1, chunk_bytes=DEFAULT_CHUNK_BYTES, batch_size=DEFAULT_BATCH_SIZE,
+                      pool=None, full=False, stage='raw'):
+    """
+    Extrahiert mehrere Länder in einem gemeinsamen Lauf.
+    jobs ist eine Liste von (Land, Datenordner, Ausgabedatei); zurückgegeben wird
+    ein Dictionary Land -> Zähler ('rows_in' gelesene, 'rows_out' geschriebene Zeilen,
+    bei stage='ready' zusätzlich die entfernten Zeilen je Filter wie in 02).
+
+    Jede Eingabedatei wird in eine eigene Partition results/partitions/<land>/<datei>/
+    (Parquet-Teildateien je Abschnitt) extrahiert und im Manifest (<land>_manifest.json) mit Größe, Änderungszeit und
+    Hash vermerkt. Bei einem erneuten Lauf werden nur neue oder geänderte Dateien
+    gelesen (full=True erzwingt alles); danach wird die Ländertabelle aus den
+    Partitionen zusammengesetzt.
+
+    Die Abschnitte aller Länder landen im selben Prozess-Pool, damit auch kleine
+    Länder die Maschine nicht halb leer laufen lassen.
+
+    Mit stage='ready' werden die Filter und Variablen der Bereinigung direkt beim Lesen
+    angewendet (eigene Partitionen und eigenes Manifest); die Ausgabedatei ist dann der
+    analysebereite Datensatz, Rohdaten werden nicht geschrieben.
+    """
+    schema, columns = STAGES[stage]
+    plans, all_tasks = [], []
+    for country_name, data_path, output_file in jobs:
+        results_dir = os.path.dirname(output_file)
+        parts_dir = partition_dir(results_dir, country_name, stage)
+        os.makedirs(parts_dir, exist_ok=True)
+        manifest_file = manifest_path(results_dir, country_name, stage)
+
+        files = list_input_files(data_path)
+        entries = {} if full else load_manifest(manifest_file)
+        changed, new_entries = find_changed_files(files, entries, parts_dir)
+        removed = sorted(set(entries) - set(new_entries))
+        print(f"{country_name}: {len(files)} Datei(en) gefunden, {len(changed)} neu oder geändert.")
+
+        tasks = []
+        for file_path, year in files:
+            filename = os.path.basename(file_path)
+            if filename not in changed:
+                continue
+            print(f"Verarbeite Datei: {filename}...")
+            file_parts_dir = os.path.join(parts_dir, filename)
+            shutil.rmtree(file_parts_dir, ignore_errors=True)
+            os.makedirs(file_parts_dir)
+            for i, (start, end) in enumerate(split_file(file_path, chunk_bytes)):
+                part_path = os.path.join(file_parts_dir, f'part_{i:05d}.parquet')
+                tasks.append((file_path, year, start, end, part_path, batch_size, stage))
+        plans.append((country_name, output_file, parts_dir, manifest_file, files, changed + removed,
+                      new_entries, tasks))
+        all_tasks += tasks
+
+    if workers <= 1 and pool is None:
+        stats_per_task = [process_chunk(task) for task in all_tasks]
+    elif pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as own_pool:
+            stats_per_task = list(own_pool.map(process_chunk, all_tasks))
+    else:
+        stats_per_task = list(pool.map(process_chunk, all_tasks))
+    stats_by_part = {task[4]: stats for task, stats in zip(all_tasks, stats_per_task)}
+
+    counts = {}
+    for country_name, output_file, parts_dir, manifest_file, files, changed, entries, tasks in plans:
+        for filename in changed:
+            if filename in entries:
+                file_parts_dir = os.path.join(parts_dir, filename)
+                stats = sum_stats(s for part_path, s in stats_by_part.items()
+                                  if os.path.dirname(part_path) == file_parts_dir)
+                entries[filename]['rows'] = stats['rows_out']
+                entries[filename]['stats'] = stats
+
+        # Partitionen nicht mehr vorhandener Eingabedateien entfernen
+        for partition in os.listdir(parts_dir):
+            if partition not in entries:
+                shutil.rmtree(os.path.join(parts_dir, partition), ignore_errors=True)
+
+        initial = {'rows_in': 0, 'rows_out': 0}
+        if stage == 'ready':
+            # Alle Filtergründe mit 0 vorbelegen: ohne Zeilen läuft clean_batch nie und liefert keine Zähler
+            initial.update({key: 0 for key, _ in CLEANING_STEPS}, date_fallback=0)
+        counts[country_name] = {**initial, **sum_stats(entry['stats'] for entry in entries.values())}
+        if not changed and output_is_current(manifest_file, output_file):
+            print(f"{country_name}: Keine Änderungen, {os.path.basename(output_file)} ist aktuell.")
+            save_manifest(manifest_file, entries, output_file)
+            continue
+
+        # Partitionen in Dateireihenfolge blockweise in die Ländertabelle übernehmen
+        # (analysebereite Daten zusätzlich in die Verteilungsskizzen, siehe verteilung.py)
+        writer = TableWriter(output_file, schema, columns=columns)
+        sketches = CountrySketches()
+        for file_path, _ in files:
+            file_parts_dir = os.path.join(parts_dir, os.path.basename(file_path))
+            for part in sorted(os.listdir(file_parts_dir)):
+                for batch in iter_batches(os.path.join(file_parts_dir, part), batch_size=batch_size):
+                    writer.write(batch)
+                    if stage == 'ready':
+                        sketches.update(batch)
+        writer.close()
+        if stage == 'ready':
+            write_sketches(os.path.dirname(output_file), country_name, sketches, output_file)
+        save_manifest(manifest_file, entries, output_file)
+    return counts
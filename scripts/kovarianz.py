@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# --- Robuste Kovarianzen, blockweise ---
+# Sandwich-Kovarianz B M B mit B = (-H)^-1 (Hesse-Matrix der Log-Likelihood) und M = Summe der äußeren
+# Produkte der Scores: je Beobachtung (HC0) oder je Cluster (Scores innerhalb eines Clusters summiert).
+# Hesse-Matrix und M werden Block für Block über die Zeilen aufsummiert; gleichzeitig liegt nur die
+# Score-Matrix eines Blocks im Speicher, nie die volle N x K-Matrix. Zweiweg-Cluster nach Cameron,
+# Gelbach & Miller: V = V_1 + V_2 - V_12 (V_12 geclustert nach der Schnittmenge beider Merkmale).
+# Kleine-Stichproben-Korrektur der Cluster-Varianten wie statsmodels: G / (G - 1) * (N - 1) / (N - K).
+
+DEFAULT_CHUNK_ROWS = 100_000
+# Standardfehler der Hauptmodelle ohne --cluster: modellbasiert (ZINB) bzw. HC0 (Fractional Logit)
+DEFAULT_COV_TYPES = {'zinb': 'nonrobust', 'glm': 'HC0'}
+
+
+def cluster_groups(data, specs):
+    """
+    Cluster-Kennungen aus Spalten von data: je Angabe eine Spalte oder mehrere mit ':' verbunden
+    (z. B. 'country:year' für Land × Jahr). Eine Angabe ergibt ein 1-D-Array (Einweg), zwei Angaben
+    ein N x 2-Array (Zweiweg), wie cov_kwds['groups'] in statsmodels. Zeilen mit fehlender Angabe
+    (z. B. ohne buyer_id) bilden je einen eigenen Cluster.
+    """
+    codes = []
+    for spec in specs:
+        spec_codes = data.groupby(spec.split(':'), observed=True, sort=True).ngroup()
+        missing = spec_codes.isna().to_numpy()
+        spec_codes = spec_codes.fillna(-1).to_numpy(dtype='int64')
+        spec_codes[missing] = spec_codes.max(initial=-1) + 1 + np.arange(missing.sum())
+        codes.append(spec_codes)
+    return codes[0] if len(codes) == 1 else np.column_stack(codes)
+
+
+def _factorize(groups):
+    codes, uniques = pd.factorize(groups, sort=True)
+    return codes, len(uniques)
+
+
+def sandwich_cov(chunk_derivatives, nobs, k_params, groups=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Sandwich-Kovarianz aus Blöcken: chunk_derivatives(rows) gibt für den Zeilenbereich rows (slice)
+    die Hesse-Matrix (K x K) und die Scores je Beobachtung (Zeilen x K) zurück. groups: None (HC0),
+    1-D (Einweg-Cluster) oder N x 2 (Zweiweg-Cluster). Speicher: K x K je Kovarianz plus ein Block,
+    bei Clustern zusätzlich die Score-Summen je Cluster (G x K).
+    """
+    if groups is None:
+        groupings = [None]
+    else:
+        groups = np.asarray(groups)
+        if groups.ndim == 1:
+            groupings = [_factorize(groups)]
+        else:
+            # Zweiweg: beide Merkmale einzeln und ihre Schnittmenge
+            first, second = _factorize(groups[:, 0]), _factorize(groups[:, 1])
+            groupings = [first, second, _factorize(first[0].astype('int64') * second[1] + second[0])]
+
+    hess = np.zeros((k_params, k_params))
+    # je Gruppierung: Summe der äußeren Produkte (HC0) bzw. Score-Summen je Cluster
+    sums = [np.zeros((k_params, k_params)) if grouping is None else np.zeros((grouping[1], k_params))
+            for grouping in groupings]
+    for start in range(0, nobs, chunk_rows):
+        rows = slice(start, min(start + chunk_rows, nobs))
+        hess_chunk, scores = chunk_derivatives(rows)
+        hess += hess_chunk
+        for total, grouping in zip(sums, groupings):
+            if grouping is None:
+                total += scores.T @ scores
+            else:
+                codes = grouping[0][rows]
+                indicator = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                                              shape=(grouping[1], len(codes)))
+                total += indicator @ scores
+
+    bread = np.linalg.inv(-hess)
+    covs = []
+    for total, grouping in zip(sums, groupings):
+        if grouping is None:
+            covs.append(bread @ total @ bread)
+            continue
+        n_groups = grouping[1]
+        correction = n_groups / (n_groups - 1) * (nobs - 1) / (nobs - k_params)
+        covs.append(correction * bread @ (total.T @ total) @ bread)
+    cov = covs[0] if len(covs) == 1 else covs[0] + covs[1] - covs[2]
+    return (cov + cov.T) / 2
+
+
+def cov_description(cov_type, groups=None):
+    """Kurzbeschreibung der Kovarianz für die Ausgabe (z. B. 'Zweiweg-Cluster (9 und 3 Cluster)')."""
+    if cov_type != 'cluster':
+        return cov_type
+    groups = np.asarray(groups)
+    if groups.ndim == 1:
+        return f"Cluster ({len(np.unique(groups))} Cluster)"
+    return f"Zweiweg-Cluster ({len(np.unique(groups[:, 0]))} und {len(np.unique(groups[:, 1]))} Cluster)"
+
+
+def cov_label(cov_type, specs=None):
+    """
+    Kennung der Kovarianz für Modellartefakte: der Typ, bei Clustern mit den Angaben von --cluster
+    (z. B. 'cluster(country:year, buyer_id)'). Gleiche Koeffizienten mit anderer Kovarianz sind ein anderes Artefakt.
+    """
+    return f"{cov_type}({', '.join(specs)})" if specs else cov_type
@@ -0,0 +1,118 @@
+import os
+
+# --- Länderregister ---
+# Alle Länder der OpenTender-Abdeckung mit ISO-Code, deutschem Anzeigenamen (Tabellen und Sätze),
+# Datenordner unter data/ (zugleich Wert der Spalte 'country' und Präfix der Dateien in results/),
+# Referenzkategorie der Modelle und Plotfarbe (None = aus PALETTE). 'default' markiert die Länder,
+# die ohne --countries verarbeitet werden; 'aliases' sind weitere gebräuchliche Codes (z. B. 'UK' für 'GB').
+REGISTRY = [
+    {'code': 'DE', 'name': 'Deutschland', 'folder': 'Germany', 'reference': False, 'color': '#2ca02c', 'default': True},
+    {'code': 'FR', 'name': 'Frankreich', 'folder': 'France', 'reference': False, 'color': '#ff7f0e', 'default': True},
+    {'code': 'EE', 'name': 'Estland', 'folder': 'Estonia', 'reference': True, 'color': '#1f77b4', 'default': True},
+    {'code': 'AT', 'name': 'Österreich', 'folder': 'Austria', 'reference': False, 'color': None, 'default': False},
+    {'code': 'BE', 'name': 'Belgien', 'folder': 'Belgium', 'reference': False, 'color': None, 'default': False},
+    {'code': 'BG', 'name': 'Bulgarien', 'folder': 'Bulgaria', 'reference': False, 'color': None, 'default': False},
+    {'code': 'CH', 'name': 'Schweiz', 'folder': 'Switzerland', 'reference': False, 'color': None, 'default': False},
+    {'code': 'CY', 'name': 'Zypern', 'folder': 'Cyprus', 'reference': False, 'color': None, 'default': False},
+    {'code': 'CZ', 'name': 'Tschechien', 'folder': 'Czechia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'DK', 'name': 'Dänemark', 'folder': 'Denmark', 'reference': False, 'color': None, 'default': False},
+    {'code': 'ES', 'name': 'Spanien', 'folder': 'Spain', 'reference': False, 'color': None, 'default': False},
+    {'code': 'FI', 'name': 'Finnland', 'folder': 'Finland', 'reference': False, 'color': None, 'default': False},
+    {'code': 'GE', 'name': 'Georgien', 'folder': 'Georgia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'GR', 'name': 'Griechenland', 'folder': 'Greece', 'reference': False, 'color': None, 'default': False},
+    {'code': 'HR', 'name': 'Kroatien', 'folder': 'Croatia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'HU', 'name': 'Ungarn', 'folder': 'Hungary', 'reference': False, 'color': None, 'default': False},
+    {'code': 'IE', 'name': 'Irland', 'folder': 'Ireland', 'reference': False, 'color': None, 'default': False},
+    {'code': 'IS', 'name': 'Island', 'folder': 'Iceland', 'reference': False, 'color': None, 'default': False},
+    {'code': 'IT', 'name': 'Italien', 'folder': 'Italy', 'reference': False, 'color': None, 'default': False},
+    {'code': 'LT', 'name': 'Litauen', 'folder': 'Lithuania', 'reference': False, 'color': None, 'default': False},
+    {'code': 'LU', 'name': 'Luxemburg', 'folder': 'Luxembourg', 'reference': False, 'color': None, 'default': False},
+    {'code': 'LV', 'name': 'Lettland', 'folder': 'Latvia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'MT', 'name': 'Malta', 'folder': 'Malta', 'reference': False, 'color': None, 'default': False},
+    {'code': 'NL', 'name': 'Niederlande', 'folder': 'Netherlands', 'reference': False, 'color': None, 'default': False},
+    {'code': 'NO', 'name': 'Norwegen', 'folder': 'Norway', 'reference': False, 'color': None, 'default': False},
+    {'code': 'PL', 'name': 'Polen', 'folder': 'Poland', 'reference': False, 'color': None, 'default': False},
+    {'code': 'PT', 'name': 'Portugal', 'folder': 'Portugal', 'reference': False, 'color': None, 'default': False},
+    {'code': 'RO', 'name': 'Rumänien', 'folder': 'Romania', 'reference': False, 'color': None, 'default': False},
+    {'code': 'SE', 'name': 'Schweden', 'folder': 'Sweden', 'reference': False, 'color': None, 'default': False},
+    {'code': 'SI', 'name': 'Slowenien', 'folder': 'Slovenia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'SK', 'name': 'Slowakei', 'folder': 'Slovakia', 'reference': False, 'color': None, 'default': False},
+    {'code': 'GB', 'name': 'Vereinigtes Königreich', 'folder': 'UnitedKingdom', 'reference': False, 'color': None,
+     'default': False, 'aliases': ['UK']},
+    {'code': 'EU', 'name': 'EU-Institutionen', 'folder': 'EU', 'reference': False, 'color': None, 'default': False},
+]
+
+# Farben für Länder ohne eigene Plotfarbe (tab20 ohne die bereits vergebenen)
+PALETTE = ['#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf', '#aec7e8',
+           '#ffbb78', '#98df8a', '#ff9896', '#c5b0d5', '#c49c94', '#f7b6d2', '#c7c7c7', '#dbdb8d', '#9edae5']
+
+# Länder der Bachelorarbeit; weitere OpenTender-Länder über --countries bzw. 'all'
+DEFAULT_COUNTRIES = [entry['folder'] for entry in REGISTRY if entry['default']]
+
+
+def country_info(country):
+    """
+    Registereintrag zu einem Land (Ordnername, ISO-Code, Alias-Code oder Anzeigename, ohne Groß-/Kleinschreibung).
+    Länder, die nicht im Register stehen (z. B. weitere Ordner unter data/), erhalten einen Eintrag
+    mit dem Ordnernamen als Anzeigename.
+    """
+    key = country.lower()
+    for entry in REGISTRY:
+        names = [entry['folder'], entry['code'], entry['name'], *entry.get('aliases', [])]
+        if key in (name.lower() for name in names):
+            return entry
+    return {'code': None, 'name': country, 'folder': country, 'reference': False, 'color': None, 'default': False}
+
+
+def display_name(country):
+    return country_info(country)['name']
+
+
+def list_countries(data_root):
+    """Alle Länderordner unter data/ (Register-Reihenfolge, unbekannte Ordner alphabetisch danach)."""
+    folders = [name for name in os.listdir(data_root)
+               if os.path.isdir(os.path.join(data_root, name)) and not name.startswith('.')]
+    order = {entry['folder']: i for i, entry in enumerate(REGISTRY)}
+    return sorted(folders, key=lambda name: (order.get(name, len(order)), name))
+
+
+def resolve_countries(requested, data_root):
+    """
+    Löst die Länderauswahl der Kommandozeile auf (Ordnernamen, ISO-Codes oder Anzeigenamen).
+    'all' steht für alle Ordner unter data/, ohne Angabe gelten DEFAULT_COUNTRIES.
+    """
+    if not requested:
+        return list(DEFAULT_COUNTRIES)
+    if [c.lower() for c in requested] == ['all']:
+        return list_countries(data_root)
+    return [country_info(country)['folder'] for country in requested]
+
+
+def reference_country(countries):
+    """Referenzkategorie der Modelle unter den gewählten Ländern (laut Register, sonst das erste alphabetisch)."""
+    for country in countries:
+        if country_info(country)['reference']:
+            return country
+    return sorted(countries)[0]
+
+
+def country_term(countries):
+    """Patsy-Term der Länder mit Referenzkategorie, z. B. C(country, Treatment('Estonia'))."""
+    return f"C(country, Treatment('{reference_country(countries)}'))"
+
+
+def plot_colors(countries):
+    """Plotfarben der gewählten Länder; Länder ohne eigene Farbe erhalten der Reihe nach eine aus PALETTE."""
+    colors = {country: country_info(country)['color'] for country in countries}
+    free = iter(PALETTE)
+    for country in sorted(countries):
+        if colors[country] is None:
+            colors[country] = next(free, '#7f7f7f')
+    return colors
+
+
+def add_country_argument(parser):
+    """Gemeinsame Option --countries der Skripte 03-07."""
+    parser.add_argument('--countries', nargs='+',
+                        help="Länder (Ordnername, ISO-Code oder Anzeigename) oder 'all' für alle Ordner "
+                             "unter data/; Standard: Deutschland, Frankreich, Estland")
@@ -0,0 +1,471 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from laender import DEFAULT_COUNTRIES, add_country_argument, resolve_countries
+from protokoll import country_counts, filter_steps, record_steps
+from speicher import (READY_SCHEMA, TableWriter, apply_schema, concat_countries, drop_unused_categories,
+                      find_dataset, iter_batches, load_countries, read_table, write_table)
+from verteilung import RunningMoments, histogram_quantile, load_sketches, merge_histograms
+
+# Bereinigungsparameter der Analyse (Kapitel 4). Änderungen führen automatisch zu einem neuen Cache.
+DEFAULT_PARAMS = {
+    'max_bids': 100,         # Technische Bereinigung: total_bids < max_bids
+    'min_duration': 0,       # duration_days > min_duration
+    'cap_quantile': 0.99,    # Obergrenze der Dauer (Perzentil)
+    'min_value': 0,          # tender_value > min_value
+}
+
+# Bei Änderungen an build_features erhöhen, damit bestehende Caches verworfen werden
+FEATURE_VERSION = 3
+
+# Spalten, die aus den analysebereiten Datensätzen geladen werden
+INPUT_COLUMNS = ['total_bids', 'sme_bids', 'duration_days', 'tender_value',
+                 'procurement_method', 'procurement_category', 'award_criteria', 'year', 'buyer_id']
+
+# Schema des Modellierungsdatensatzes (Spaltenreihenfolge wie in build_features)
+FEATURE_SCHEMA = {
+    **{col: READY_SCHEMA[col] for col in INPUT_COLUMNS},
+    'country': 'category',
+    'duration_days_capped': 'float',
+    'z_duration': 'float',
+    'log_tender_value': 'float',
+    'z_value': 'float',
+    'sme_share': 'float',
+    'const': 'int',
+}
+
+# Speicherplan der geladenen Modellierungsdaten (compact_dtypes): ganze Zahlen auf den kleinsten
+# passenden Typ (verlustfrei), Text-Spalten als Kategorien, abgeleitete Merkmale optional als float32
+DERIVED_COLUMNS = ['duration_days_capped', 'z_duration', 'log_tender_value', 'z_value', 'sme_share']
+
+# Spalten, die die Modelle in 03, 04 und 06 benötigen (Projektion beim Laden); buyer_id für --cluster in 03
+MODEL_COLUMNS = ['total_bids', 'z_duration', 'country', 'z_value', 'procurement_method',
+                 'procurement_category', 'year', 'const', 'sme_share', 'buyer_id']
+
+# Zeilen je Block im blockweisen Modus (--blockweise)
+DEFAULT_BATCH_SIZE = 250_000
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+default_results_dir = os.path.join(script_dir, '..', 'results')
+
+
+def filter_rows(df, params, step_log):
+    """
+    Technische Bereinigung und Filter der Analyse:
+    A. total_bids < max_bids, B. duration_days > min_duration, C. tender_value > min_value.
+    Gibt die Zeilen nach B (Grundlage der Dauer-Konstanten) und nach C zurück;
+    die Zeilenzahlen je Land und Schritt werden an step_log angehängt.
+    """
+    # Numerische Spalten vorab umwandeln (fehlerhafte Einträge -> NaN, fallen durch die Filter)
+    df['duration_days'] = pd.to_numeric(df['duration_days'], errors='coerce')
+    df['tender_value'] = pd.to_numeric(df['tender_value'], errors='coerce')
+
+    # A. Technische Bereinigung (Extremwerte Bids)
+    rows_in = country_counts(df)
+    df = df[df['total_bids'] < params['max_bids']]
+    step_log += filter_steps(f"total_bids < {params['max_bids']}", rows_in, df)
+
+    # B. Duration
+    rows_in = country_counts(df)
+    df_duration = df[df['duration_days'] > params['min_duration']]
+    step_log += filter_steps(f"duration_days > {params['min_duration']}", rows_in, df_duration)
+
+    # C. Tender Value
+    rows_in = country_counts(df_duration)
+    df_value = df_duration[df_duration['tender_value'] > params['min_value']]
+    step_log += filter_steps(f"tender_value > {params['min_value']}", rows_in, df_value)
+    return df_duration, df_value
+
+
+def add_features(reg_df, constants):
+    """Berechnet die Modellvariablen mit den (globalen) Normierungskonstanten."""
+    # Dauer, gecappt beim p99, und Z-Standardisierung für Regression
+    reg_df['duration_days_capped'] = reg_df['duration_days'].clip(upper=constants['p99_duration'])
+    reg_df['z_duration'] = (reg_df['duration_days_capped'] - constants['duration_mean']) / constants['duration_std']
+
+    # Logarithmierter und standardisierter Auftragswert
+    reg_df['log_tender_value'] = np.log(reg_df['tender_value'])
+    reg_df['z_value'] = (reg_df['log_tender_value'] - constants['log_value_mean']) / constants['log_value_std']
+
+    # D. H2 Variable (KMU Anteil)
+    # Logik: Wenn Bids > 0, berechne Anteil. Wenn Bids = 0, ist Anteil NaN (nicht 0!)
+    reg_df['sme_share'] = np.where(
+        reg_df['total_bids'] > 0,
+        reg_df['sme_bids'] / reg_df['total_bids'],
+        np.nan
+    )
+    reg_df['sme_share'] = reg_df['sme_share'].clip(0, 1)
+
+    # E. Konstante für Regression
+    reg_df['const'] = 1
+    return reg_df
+
+
+def build_features(df_final, params=DEFAULT_PARAMS, p99_duration=None):
+    """
+    Erstellt den Modellierungsdatensatz reg_df aus den zusammengefügten Länderdaten
+    (Bereinigung und Feature Engineering aus 03/04/06).
+    Ist p99_duration bereits bekannt (z. B. aus den Verteilungsskizzen), entfällt die Sortierung der Dauer.
+    Gibt reg_df, die Normierungskonstanten als Dictionary und die Protokolleinträge
+    der Filterschritte (je Land, siehe protokoll.py) zurück.
+    """
+    steps = []
+    df_duration, reg_df = filter_rows(df_final.copy(), params, steps)
+
+    # Normierungskonstanten: Dauer über alle Zeilen nach B, Auftragswert nach C
+    p99_dur = p99_duration if p99_duration is not None else df_duration['duration_days'].quantile(params['cap_quantile'])
+    duration_capped = df_duration['duration_days'].clip(upper=p99_dur)
+    log_value = np.log(reg_df['tender_value'])
+    constants = {
+        'p99_duration': float(p99_dur),
+        'duration_mean': float(duration_capped.mean()),
+        'duration_std': float(duration_capped.std()),
+        'log_value_mean': float(log_value.mean()),
+        'log_value_std': float(log_value.std()),
+    }
+    del df_duration, duration_capped, log_value
+
+    reg_df = add_features(reg_df, constants)
+    return drop_unused_categories(reg_df.reset_index(drop=True)), constants, steps
+
+
+def sum_steps(step_log):
+    """Fasst blockweise protokollierte Schritte je Land und Schritt zusammen (Reihenfolge bleibt erhalten)."""
+    totals = {}
+    for step in step_log:
+        key = (step['country'], step['step'])
+        if key not in totals:
+            totals[key] = {**step, 'rows_in': 0, 'rows_out': 0}
+        totals[key]['rows_in'] += step['rows_in']
+        totals[key]['rows_out'] += step['rows_out']
+    return list(totals.values())
+
+
+def iter_country_batches(results_dir, countries, batch_size):
+    """Liest die analysebereiten Datensätze aller Länder blockweise (Spalte 'country' gesetzt)."""
+    for country_name in countries:
+        path = find_dataset(results_dir, f'{country_name.lower()}_analysis_ready')
+        for batch in iter_batches(path, batch_size=batch_size, columns=INPUT_COLUMNS):
+            batch = apply_schema(batch, {col: READY_SCHEMA[col] for col in INPUT_COLUMNS})
+            batch['country'] = country_name
+            yield country_name, batch
+
+
+def build_features_chunked(results_dir, countries, params, data_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Wie build_features, aber blockweise (out-of-core), ohne alle Länder gleichzeitig im Speicher:
+    Im ersten Durchlauf werden die globalen Konstanten bestimmt (p99 und Mittelwert/SD der Dauer
+    exakt aus dem Dauer-Histogramm, Mittelwert/SD des log. Auftragswerts über zusammengeführte
+    Momente), im zweiten die Blöcke transformiert und direkt nach data_path geschrieben.
+    Gibt die Zeilen je Land vor der Bereinigung, die geschriebenen Zeilen, die Konstanten
+    und die Protokolleinträge zurück.
+    """
+    # --- Durchlauf 1: Konstanten ---
+    rows_in, histogram, log_moments, step_log = {}, {}, RunningMoments(), []
+    for country_name, batch in iter_country_batches(results_dir, countries, batch_size):
+        rows_in[country_name] = rows_in.get(country_name, 0) + len(batch)
+        df_duration, df_value = filter_rows(batch, params, step_log)
+        counts = df_duration['duration_days'].value_counts()
+        histogram = merge_histograms([histogram, {int(d): int(n) for d, n in counts.items()}])
+        log_moments.update(np.log(df_value['tender_value'].to_numpy(dtype='float64')))
+
+    p99_dur = histogram_quantile(histogram, params['cap_quantile'])
+    durations = np.array(list(histogram), dtype='float64')
+    weights = np.array(list(histogram.values()), dtype='float64')
+    capped = np.minimum(durations, p99_dur)
+    duration_mean = (capped * weights).sum() / weights.sum()
+    duration_std = np.sqrt((weights * (capped - duration_mean) ** 2).sum() / (weights.sum() - 1))
+    constants = {
+        'p99_duration': float(p99_dur),
+        'duration_mean': float(duration_mean),
+        'duration_std': float(duration_std),
+        'log_value_mean': float(log_moments.mean),
+        'log_value_std': float(log_moments.std),
+    }
+
+    # --- Durchlauf 2: Transformation und Schreiben ---
+    writer = TableWriter(data_path, FEATURE_SCHEMA, columns=list(FEATURE_SCHEMA), sidecar=False)
+    for country_name, batch in iter_country_batches(results_dir, countries, batch_size):
+        _, df_value = filter_rows(batch, params, [])
+        writer.write(add_features(df_value.copy(), constants))
+    rows_out = writer.close()
+    return rows_in, rows_out, constants, sum_steps(step_log)
+
+
+def compact_dtypes(df, float32=False):
+    """
+    Wendet den Speicherplan an: ganze Zahlen werden auf den kleinsten passenden Typ verkleinert
+    (z. B. total_bids und const als int8, year als int16), Text-Spalten sind Kategorien. Mit float32
+    werden die abgeleiteten Merkmale (DERIVED_COLUMNS) mit halber Genauigkeit gehalten; die
+    Ergebnisse weichen dann in den letzten Nachkommastellen ab.
+    """
+    for col in df.columns:
+        kind = FEATURE_SCHEMA.get(col)
+        if kind == 'int':
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif kind == 'category' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        elif float32 and col in DERIVED_COLUMNS:
+            df[col] = df[col].astype('float32')
+    return df
+
+
+def measure_rss(load, interval=0.001):
+    """
+    Führt load() aus und tastet dabei in einem Thread den Arbeitsspeicher (RSS) ab. Gibt das Ergebnis,
+    den RSS vorher und den Spitzenwert während load() in MB zurück (ohne psutil None). Der Spitzenwert
+    des Prozesses (ru_maxrss) taugt dafür nicht: Schon die Importe heben ihn über den eines kleinen Ladevorgangs.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return load(), None, None
+    process = psutil.Process()
+    before = peak = process.memory_info().rss
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, process.memory_info().rss)
+            done.wait(interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = load()
+    finally:
+        done.set()
+        sampler.join()
+    peak = max(peak, process.memory_info().rss)
+    return result, before / 1024 ** 2, peak / 1024 ** 2
+
+
+def frame_mb(df):
+    """Speicherbedarf eines DataFrames in MB (inkl. Text-Inhalte)."""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def input_fingerprint(results_dir, countries):
+    """
+    Beschreibt die Eingabedateien über Name, Größe und Änderungszeit.
+    Das genügt, um jede neu geschriebene Datei zu erkennen, ohne Gigabytes zu hashen.
+    """
+    inputs = []
+    for country_name in countries:
+        path = find_dataset(results_dir, f'{country_name.lower()}_analysis_ready')
+        stat = os.stat(path)
+        inputs.append({'country': country_name, 'file': os.path.basename(path),
+                       'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return inputs
+
+
+def _inputs_by_country(inputs):
+    return {entry['country']: entry for entry in inputs or []}
+
+
+def cache_key(inputs, params):
+    payload = json.dumps({'inputs': inputs, 'params': params, 'version': FEATURE_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_paths(results_dir, key):
+    cache_dir = os.path.join(results_dir, 'cache')
+    return (os.path.join(cache_dir, f'reg_df_{key}.parquet'),
+            os.path.join(cache_dir, f'reg_df_{key}.json'))
+
+
+def sketch_cap(results_dir, countries, params):
+    """
+    Obergrenze der Dauer (cap_quantile) aus den exakten Dauer-Histogrammen der Verteilungsskizzen.
+    Gibt None zurück, wenn Skizzen fehlen, veraltet sind oder mit anderem max_bids erstellt wurden.
+    """
+    histograms = []
+    for country_name in countries:
+        data_file = find_dataset(results_dir, f'{country_name.lower()}_analysis_ready')
+        sketches = load_sketches(results_dir, country_name, data_file)
+        if sketches is None or sketches.max_bids != params['max_bids']:
+            return None
+        histograms.append(sketches.duration_histogram())
+    histogram = {d: n for d, n in merge_histograms(histograms).items() if d > params['min_duration']}
+    return histogram_quantile(histogram, params['cap_quantile'])
+
+
+def build_feature_cache(results_dir, countries, params, key, inputs, chunked=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Lädt die Länderdaten, erstellt reg_df und speichert es samt Metadaten im Cache.
+    Mit chunked wird blockweise gearbeitet (build_features_chunked) und reg_df nicht zurückgegeben (None).
+    """
+    data_path, meta_path = cache_paths(results_dir, key)
+    cache_dir = os.path.dirname(data_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Caches veralteter Eingaben entfernen: dieselben Länder, aber geänderte Dateien (Größe oder Änderungszeit).
+    # Caches mit anderen Parametern oder einer anderen Länderauswahl bleiben erhalten.
+    current = _inputs_by_country(inputs)
+    for filename in os.listdir(cache_dir):
+        if not (filename.startswith('reg_df_') and filename.endswith('.json')):
+            continue
+        with open(os.path.join(cache_dir, filename), 'r', encoding='utf-8') as f:
+            old_inputs = _inputs_by_country(json.load(f).get('inputs'))
+        if old_inputs.keys() == current.keys() and old_inputs != current:
+            for old_path in cache_paths(results_dir, filename[len('reg_df_'):-len('.json')]):
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+    if chunked:
+        reg_df = None
+        rows_in, rows_out, constants, steps = build_features_chunked(results_dir, countries, params,
+                                                                     data_path, batch_size)
+    else:
+        frames = load_countries(results_dir, countries, columns=INPUT_COLUMNS)
+        rows_in = {country_name: len(df) for country_name, df in frames.items()}
+        reg_df, constants, steps = build_features(concat_countries(frames), params,
+                                                  p99_duration=sketch_cap(results_dir, countries, params))
+        del frames
+        rows_out = len(reg_df)
+        write_table(reg_df, data_path, sidecar=False)
+    meta = {
+        'key': key,
+        'version': FEATURE_VERSION,
+        'params': params,
+        'inputs': inputs,
+        'countries': list(countries),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'constants': constants,
+        'lineage': steps,
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return reg_df, meta
+
+
+def load_features(results_dir=default_results_dir, countries=None, params=None, columns=None, rebuild=False,
+                  chunked=False, batch_size=DEFAULT_BATCH_SIZE, compact=True, float32=False, record=True):
+    """
+    Gibt den Modellierungsdatensatz reg_df und seine Metadaten zurück.
+    Der Datensatz wird aus dem Cache geladen; fehlt dieser oder haben sich Eingaben bzw.
+    Parameter geändert, wird er neu erstellt. Mit columns werden nur diese Spalten geladen
+    (z. B. MODEL_COLUMNS); mit compact wird der Speicherplan angewendet (compact_dtypes, float32).
+
+    Die Metadaten enthalten u. a. die Zeilenzahlen je Land vor der Bereinigung ('rows_in')
+    und die Normierungskonstanten ('constants': p99_duration, duration_mean, duration_std,
+    log_value_mean, log_value_std). Mit chunked wird ein fehlender Cache blockweise erstellt
+    (begrenzter Speicherbedarf, gleiche Ergebnisse). Die Filterschritte werden bei jedem Aufruf im Protokoll
+    der Stichprobenreduktion (Stufe 'merkmale') vermerkt; record=False unterdrückt das für Varianten mit
+    abweichenden Parametern (z. B. Robustheits-Checks), damit sie die Einträge des Hauptdatensatzes nicht ersetzen.
+    """
+    countries = list(countries or DEFAULT_COUNTRIES)
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    inputs = input_fingerprint(results_dir, countries)
+    key = cache_key(inputs, params)
+    data_path, meta_path = cache_paths(results_dir, key)
+
+    if rebuild or not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        print(f"Erstelle Modellierungsdatensatz (Cache {key})...")
+        reg_df, meta = build_feature_cache(results_dir, countries, params, key, inputs, chunked, batch_size)
+        if reg_df is not None and columns is not None:
+            reg_df = reg_df[columns]
+    else:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        reg_df = None
+    if reg_df is None:
+        reg_df = read_table(data_path, columns=columns, schema=FEATURE_SCHEMA)
+    if compact:
+        reg_df = compact_dtypes(reg_df, float32=float32)
+    if record:
+        record_steps(results_dir, 'merkmale', meta['lineage'])
+    return reg_df, meta
+
+
+def read_unplanned(path):
+    """
+    Liest den Cache ohne Speicherplan, wie die Skripte reg_df vor dem Cache aufgebaut haben: alle Spalten,
+    Text als object, ganze Zahlen als int64 und Gleitkommazahlen als float64 (keine Kategorien).
+    """
+    table = pq.read_table(path)
+    fields = [pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+              for field in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata)).to_pandas()
+
+
+def _measure_load(results_dir, countries, columns, compact, float32):
+    """
+    Lädt reg_df in einem frischen Prozess (ohne Speicherplan: read_unplanned) und gibt RSS vor dem Laden,
+    Spitzen-RSS während des Ladens, die Größe in MB und die Spaltenzahl zurück. Ein Ladevorgang einer
+    Spalte vorab stellt den Cache sicher und lädt die Leser-Module, damit deren Importe nicht mitzählen.
+    """
+    _, meta = load_features(results_dir, countries, columns=['const'], record=False)
+    data_path = cache_paths(results_dir, meta['key'])[0]
+    if compact:
+        reg_df, rss_before, rss_peak = measure_rss(
+            lambda: compact_dtypes(read_table(data_path, columns=columns, schema=FEATURE_SCHEMA), float32=float32))
+    else:
+        reg_df, rss_before, rss_peak = measure_rss(lambda: read_unplanned(data_path))
+    return rss_before, rss_peak, frame_mb(reg_df), len(reg_df.columns)
+
+
+def memory_report(results_dir, countries, float32=False):
+    """
+    Vergleicht den Speicherbedarf von reg_df ohne Speicherplan (alle Spalten, int64/float64, Text als
+    object) und mit Speicherplan (nur MODEL_COLUMNS, verkleinerte Typen, Kategorien). Jede Variante läuft
+    in einem eigenen Prozess, damit der RSS nicht von der anderen beeinflusst wird; gemessen wird der
+    Zuwachs während des Ladens (measure_rss).
+    """
+    variants = [('vorher (alle Spalten, int64/float64/object)', None, False, False),
+                ('nachher (Modellspalten, Speicherplan' + (', float32)' if float32 else ')'),
+                 MODEL_COLUMNS, True, float32)]
+    print(f"{'Variante':<48} | {'Spalten':>7} | {'reg_df (MB)':>11} | {'RSS-Zuwachs (MB)':>16} | {'Spitzen-RSS (MB)':>16}")
+    print("-" * 111)
+    sizes = []
+    for label, columns, compact, use_float32 in variants:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            rss_before, rss_peak, size, n_columns = pool.submit(
+                _measure_load, results_dir, countries, columns, compact, use_float32).result()
+        sizes.append(size)
+        if rss_peak is None:
+            print(f"{label:<48} | {n_columns:>7} | {size:>11.2f} | {'n. v.':>16} | {'n. v.':>16}")
+        else:
+            print(f"{label:<48} | {n_columns:>7} | {size:>11.2f} | {rss_peak - rss_before:>16.1f} | {rss_peak:>16.1f}")
+    print(f"reg_df ist mit Speicherplan {sizes[0] / sizes[1]:.1f}-mal kleiner.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Erstellt den gemeinsamen Modellierungsdatensatz (reg_df)")
+    add_country_argument(parser)
+    parser.add_argument('--neu', action='store_true', help="Cache unabhängig vom Stand neu erstellen")
+    parser.add_argument('--blockweise', action='store_true',
+                        help="Cache blockweise erstellen (begrenzter Speicherbedarf bei großen Datensätzen)")
+    parser.add_argument('--blockgroesse', type=int, default=DEFAULT_BATCH_SIZE, help="Zeilen je Block")
+    parser.add_argument('--speicherbericht', action='store_true',
+                        help="Speicherbedarf von reg_df ohne und mit Speicherplan vergleichen")
+    parser.add_argument('--float32', action='store_true',
+                        help="Im Speicherbericht die abgeleiteten Merkmale als float32 laden")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    countries = resolve_countries(args.countries, os.path.join(script_dir, '..', 'data'))
+    reg_df, meta = load_features(countries=countries, rebuild=args.neu,
+                                 chunked=args.blockweise, batch_size=args.blockgroesse)
+    print(f"reg_df: {len(reg_df)} Zeilen (Cache {meta['key']}), {time.time() - start_time:.2f} Sekunden.")
+    for name, value in meta['constants'].items():
+        print(f"  {name}: {value:.4f}")
+    if args.speicherbericht:
+        print("\n--- Speicherbericht reg_df ---")
+        memory_report(default_results_dir, countries, float32=args.float32)
+
+
+if __name__ == '__main__':
+    main()
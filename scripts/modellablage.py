@@ -0,0 +1,184 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import patsy
+
+from zaehlmodelle import ModelResults
+
+# --- Modellartefakte ---
+# 03 legt die geschätzten Modelle (Koeffizienten, Kovarianz, Bauplan des Designs, Normierungskonstanten)
+# unter results/modelle/<name>_<schlüssel>.json ab. Der Schlüssel ist ein Hash aus Modellname, Formel, der Art
+# der Kovarianz (kovarianz.cov_label, z. B. 'HC0' oder 'cluster(country:year)') und den in der Formel
+# verwendeten Spalten der Stichprobe (Werte, Typen, Kategorien). 06 und andere
+# Verbraucher laden das Artefakt und sagen ohne erneute Schätzung vorher; passt kein Artefakt zur
+# Stichprobe (neue Daten, andere Formel), wird neu geschätzt und das Artefakt ersetzt.
+MODEL_VERSION = 2
+MODEL_DIR = 'modelle'
+
+
+def model_dir(results_dir):
+    return os.path.join(results_dir, MODEL_DIR)
+
+
+def artifact_path(results_dir, name, key):
+    return os.path.join(model_dir(results_dir), f'{name}_{key}.json')
+
+
+def formula_columns(formula, data, infl_columns=()):
+    """Spalten von data, die in der Formel vorkommen, plus die Spalten des Inflations-Designs."""
+    names = set(re.findall(r'[A-Za-z_][A-Za-z0-9_]*', formula)) | set(infl_columns)
+    return [column for column in data.columns if column in names]
+
+
+def model_key(name, formula, data, infl_columns=(), *, cov):
+    """Hash aus Modellname, Formel, Kovarianz und den verwendeten Spalten der Stichprobe (Reihenfolge der Zeilen zählt)."""
+    columns = formula_columns(formula, data, infl_columns)
+    row_hashes = pd.util.hash_pandas_object(data[columns], index=False).to_numpy()
+    dtypes = {column: (data[column].cat.categories.tolist() if isinstance(data[column].dtype, pd.CategoricalDtype)
+                       else str(data[column].dtype)) for column in columns}
+    payload = json.dumps({'name': name, 'formula': formula, 'infl_columns': list(infl_columns), 'cov': cov,
+                          'dtypes': dtypes,
+                          'rows': hashlib.sha256(row_hashes.tobytes()).hexdigest(), 'version': MODEL_VERSION},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def design_skeleton(data, columns):
+    """
+    Kleinste Teilstichprobe, die jede Ausprägung jeder nicht-stetigen Spalte enthält. Aus ihr entsteht
+    beim Laden derselbe Bauplan (design_info) wie bei der Schätzung; patsy-Baupläne lassen sich nicht speichern.
+    """
+    discrete = [column for column in columns if not pd.api.types.is_float_dtype(data[column])]
+    rows = (pd.concat([data[columns].drop_duplicates(column) for column in discrete]) if discrete
+            else data[columns].iloc[:1])
+    skeleton = {}
+    for column in columns:
+        values = rows[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            skeleton[column] = {'dtype': 'category', 'values': values.astype(object).tolist(),
+                                'categories': values.cat.categories.tolist()}
+        else:
+            skeleton[column] = {'dtype': str(values.dtype), 'values': values.tolist()}
+    return skeleton
+
+
+def skeleton_frame(skeleton):
+    columns = {}
+    for column, entry in skeleton.items():
+        if entry['dtype'] == 'category':
+            columns[column] = pd.Categorical(entry['values'], categories=entry['categories'])
+        else:
+            columns[column] = pd.Series(entry['values'], dtype=entry['dtype'])
+    return pd.DataFrame(columns)
+
+
+def _diagnostics(result):
+    """Skalare Konvergenzdiagnose eines statsmodels- oder ModelResults-Ergebnisses."""
+    retvals = getattr(result, 'mle_retvals', None)
+    if retvals is None:
+        # GLM (IRLS) ohne mle_retvals
+        retvals = {'converged': result.converged, 'iterations': result.fit_history['iteration']}
+    return {key: (value.item() if isinstance(value, np.generic) else value) for key, value in retvals.items()
+            if isinstance(value, (bool, int, float, str, np.generic))}
+
+
+def save_model(results_dir, name, formula, result, data, features_meta, infl_columns=(), *, cov):
+    """
+    Speichert ein geschätztes Modell (statsmodels-Ergebnis oder ModelResults) als Artefakt und gibt es
+    in geladener Form (ModelResults, siehe load_model) zurück. cov ist die Kennung der Kovarianz
+    (kovarianz.cov_label). Artefakte desselben Modells aus älteren Modellierungsdatensätzen (anderer
+    Cache-Schlüssel in features_meta) oder einer älteren MODEL_VERSION werden entfernt. ValueError, wenn cov nicht zur Kovarianz des
+    Ergebnisses passt oder sich der Bauplan des Designs aus der Teilstichprobe nicht wiederherstellen lässt.
+    """
+    if cov.split('(', 1)[0] != result.cov_type:
+        raise ValueError(f"Modellartefakt {name}: Kovarianz {result.cov_type} des Ergebnisses passt nicht zu {cov}")
+    key = model_key(name, formula, data, infl_columns, cov=cov)
+    columns = formula_columns(formula, data, infl_columns)
+    k_infl = len(infl_columns)
+    params = result.params
+    artifact = {
+        'name': name,
+        'key': key,
+        'version': MODEL_VERSION,
+        'formula': formula,
+        'model': getattr(result, 'model_name', None) or result.model.__class__.__name__,
+        'yname': getattr(result, 'yname', None) or result.model.endog_names,
+        'method': getattr(result, 'method', None) or 'MLE',
+        'cov_type': result.cov_type,
+        'cov_label': cov,
+        'infl_columns': list(infl_columns),
+        'column_names': list(params.index[k_infl:len(params) - (1 if k_infl else 0)]),
+        'param_names': list(params.index),
+        'params': np.asarray(params, dtype='float64').tolist(),
+        'cov': np.asarray(result.cov_params(), dtype='float64').tolist(),
+        'llf': float(result.llf),
+        'nobs': int(result.nobs),
+        'diagnostics': _diagnostics(result),
+        'skeleton': design_skeleton(data, columns),
+        'constants': features_meta['constants'],
+        'features_key': features_meta['key'],
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    loaded = _from_artifact(artifact)
+    if loaded is None:
+        raise ValueError(f"Modellartefakt {name}: der aus der Teilstichprobe wiederhergestellte Bauplan des Designs "
+                         f"hat andere Spalten als das geschätzte Modell ({formula})")
+
+    directory = model_dir(results_dir)
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if not (filename.startswith(f'{name}_') and filename.endswith('.json')):
+            continue
+        # Ein anderer Prozess kann die Datei gleichzeitig ersetzen oder entfernen
+        try:
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                old = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        if old.get('features_key') != features_meta['key'] or old.get('version') != MODEL_VERSION:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, filename))
+    # Erst in eine temporäre Datei schreiben, dann ersetzen (Leser sehen nie eine halb geschriebene Datei)
+    path = artifact_path(results_dir, name, key)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return loaded
+
+
+def load_model(results_dir, name, formula, data, infl_columns=(), *, cov):
+    """
+    Lädt das Artefakt des Modells für diese Formel, Stichprobe und Kovarianz (kovarianz.cov_label) als
+    ModelResults (predict, summary, Normierungskonstanten in .constants). None, wenn keines existiert
+    oder es nicht mehr passt.
+    """
+    path = artifact_path(results_dir, name, model_key(name, formula, data, infl_columns, cov=cov))
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        artifact = json.load(f)
+    if artifact.get('version') != MODEL_VERSION or artifact.get('cov_label') != cov:
+        return None
+    return _from_artifact(artifact)
+
+
+def _from_artifact(artifact):
+    rhs = artifact['formula'].split('~', 1)[1]
+    design_info = patsy.dmatrix(rhs, skeleton_frame(artifact['skeleton'])).design_info
+    if design_info.column_names != artifact['column_names']:
+        return None
+    result = ModelResults(artifact['model'], artifact['yname'],
+                          pd.Series(artifact['params'], index=artifact['param_names']),
+                          np.array(artifact['cov']), artifact['llf'], artifact['nobs'], artifact['diagnostics'],
+                          design_info, cov_type=artifact['cov_type'], infl_columns=artifact['infl_columns'],
+                          method=artifact['method'])
+    result.constants = artifact['constants']
+    result.key = artifact['key']
+    return result
@@ -0,0 +1,289 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bereinigen import ready_output_path
+from einlesen import raw_output_path
+from laender import resolve_countries
+from speicher import DEFAULT_FORMAT, FORMATS
+from verteilung import sketch_path
+
+# --- Pfade dynamisch erstellen ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_root = os.path.join(script_dir, '..', 'data')
+results_dir = os.path.join(script_dir, '..', 'results')
+plots_dir = os.path.join(script_dir, '..', 'plots')
+
+# Stand der zuletzt erfolgreich ausgeführten Stufen (Eingaben je Stufe)
+STATUS_FILE = 'pipeline_status.json'
+# Ausgaben der Skripte je Stufe (auch Nachweis, dass die Stufe gelaufen ist)
+LOG_DIR = 'logs'
+
+
+class Stage:
+    """
+    Eine Stufe der Pipeline: ein nummeriertes Skript mit Argumenten, den Stufen, von denen sie
+    abhängt, sowie ihren Eingaben (Dateien oder Ordner) und Ausgaben. Die Ausgabe des Skripts
+    wird in results/logs/<stufe>.log geschrieben.
+    """
+
+    def __init__(self, name, script, args=(), deps=(), inputs=(), outputs=()):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.log_path = os.path.join(results_dir, LOG_DIR, f"{name.replace(':', '_')}.log")
+        self.outputs = list(outputs) + [self.log_path]
+
+    @property
+    def command(self):
+        return [sys.executable, os.path.join(script_dir, self.script)] + self.args
+
+
+def local_modules(script, seen=None):
+    """Das Skript und alle (rekursiv) importierten Module aus scripts/ – Codeänderungen machen eine Stufe veraltet."""
+    seen = set() if seen is None else seen
+    if script in seen:
+        return seen
+    seen.add(script)
+    with open(os.path.join(script_dir, script), 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if os.path.exists(os.path.join(script_dir, f'{name}.py')):
+                local_modules(f'{name}.py', seen)
+    return seen
+
+
+def file_entries(path):
+    """Name, Größe und Änderungszeit einer Datei bzw. aller Dateien eines Ordners (None, wenn sie fehlt)."""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    entries = []
+    for file_path in files:
+        if not os.path.exists(file_path):
+            entries.append([os.path.relpath(file_path, script_dir), None, None])
+            continue
+        stat = os.stat(file_path)
+        entries.append([os.path.relpath(file_path, script_dir), stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def stage_fingerprint(stage):
+    """Beschreibt Befehl, Code und Eingaben einer Stufe (wie das Manifest über Größe und Änderungszeit)."""
+    code = [os.path.join(script_dir, module) for module in sorted(local_modules(stage.script))]
+    return {
+        'args': stage.args,
+        'inputs': [entry for path in code + stage.inputs for entry in file_entries(path)],
+    }
+
+
+def build_stages(countries, fmt, stream, workers):
+    """
+    Abhängigkeitsgraph der nummerierten Skripte. Die Länderzweige von 01 und 02 sind voneinander
+    unabhängig; merkmale.py erstellt den gemeinsamen Cache einmal, bevor 03, 04 und 06 ihn lesen.
+    """
+    stages = []
+    worker_args = ['--workers', str(workers)]
+    ready_stages, ready_files = [], []
+    for country_name in countries:
+        raw_file = raw_output_path(results_dir, country_name, fmt)
+        ready_file = ready_output_path(results_dir, country_name, fmt)
+        country_data = os.path.join(data_root, country_name)
+        if stream:
+            # 01 schreibt direkt den analysebereiten Datensatz, 02 entfällt
+            stages.append(Stage(f'01:{country_name}', '01_datenaufbereitung.py',
+                                ['--countries', country_name, '--format', fmt, '--filter-im-stream'] + worker_args,
+                                inputs=[country_data],
+                                outputs=[ready_file, sketch_path(results_dir, country_name)]))
+        else:
+            stages.append(Stage(f'01:{country_name}', '01_datenaufbereitung.py',
+                                ['--countries', country_name, '--format', fmt] + worker_args,
+                                inputs=[country_data], outputs=[raw_file]))
+            stages.append(Stage(f'02:{country_name}', '02_bereinigung.py',
+                                ['--countries', country_name, '--format', fmt, '--workers', '1'],
+                                deps=[f'01:{country_name}'], inputs=[raw_file],
+                                outputs=[ready_file, sketch_path(results_dir, country_name)]))
+        ready_stages.append(stages[-1].name)
+        ready_files += [ready_file, sketch_path(results_dir, country_name)]
+
+    country_args = ['--countries'] + countries
+    feature_stage = Stage('merkmale', 'merkmale.py', country_args,
+                          deps=ready_stages, inputs=ready_files)
+    stages.append(feature_stage)
+    analysis_stage = Stage('03', '03_analyse_zinb_glm.py', country_args, deps=['merkmale'],
+                           inputs=[feature_stage.log_path])
+    stages.append(analysis_stage)
+    # 04 und 06 laden die Modellartefakte von 03 (results/modelle/) statt die Hauptmodelle erneut zu schätzen
+    stages.append(Stage('04', '04_robustheitsanalyse.py', country_args, deps=['merkmale', '03'],
+                        inputs=[feature_stage.log_path, analysis_stage.log_path]))
+    stages.append(Stage('06', '06_visualisierung.py', country_args, deps=['merkmale', '03'],
+                        inputs=[feature_stage.log_path, analysis_stage.log_path],
+                        outputs=[os.path.join(plots_dir, name) for name in
+                                 ['01_boxplot_dauer.png', '02_interaction_wettbewerb_H1_H3a.png',
+                                  '03_interaction_kmu_H2_H3b.png']]))
+    # 05 liest das Protokoll der Stichprobenreduktion, das 03, 04 und 06 ergänzen
+    stages.append(Stage('05', '05_zaehle_eintraege.py', country_args, deps=ready_stages + ['03', '04', '06'],
+                        inputs=ready_files + [stage.log_path for stage in stages[-3:]]))
+    stages.append(Stage('07', '07_check_tresholds.py', country_args, deps=ready_stages, inputs=ready_files))
+    return stages
+
+
+def select_stages(stages, targets):
+    """Die gewünschten Stufen samt allen Stufen, von denen sie abhängen (ohne Angabe: alle)."""
+    if not targets:
+        return stages
+    by_name = {stage.name: stage for stage in stages}
+    selected = set()
+    pending = [name for name in by_name if name in targets or name.split(':')[0] in targets]
+    if not pending:
+        raise SystemExit(f"Unbekannte Stufen: {', '.join(targets)} (verfügbar: {', '.join(by_name)})")
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending += by_name[name].deps
+    return [stage for stage in stages if stage.name in selected]
+
+
+def load_status():
+    path = os.path.join(results_dir, STATUS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_status(status):
+    path = os.path.join(results_dir, STATUS_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_stage(stage):
+    """Führt das Skript einer Stufe aus; gibt Rückgabecode und Dauer zurück."""
+    os.makedirs(os.path.dirname(stage.log_path), exist_ok=True)
+    start_time = time.time()
+    with open(stage.log_path, 'w', encoding='utf-8') as log:
+        returncode = subprocess.call(stage.command, stdout=log, stderr=subprocess.STDOUT, cwd=script_dir)
+    return returncode, time.time() - start_time
+
+
+def run_pipeline(stages, jobs, force=False, dry_run=False):
+    """
+    Führt die Stufen in Abhängigkeitsreihenfolge aus, unabhängige Stufen parallel (bis zu jobs).
+    Eine Stufe wird übersprungen, wenn Code, Argumente und Eingaben seit ihrem letzten erfolgreichen
+    Lauf unverändert sind und alle Ausgaben existieren. Da die Eingaben die Ausgaben der vorherigen
+    Stufen sind, macht jede neu ausgeführte Stufe die von ihr abhängigen Stufen veraltet.
+    Gibt je Stufe Status und Dauer zurück.
+    """
+    status = load_status()
+    names = {stage.name for stage in stages}
+    results = {}
+    pending = list(stages)
+    running = {}
+
+    def ready(stage):
+        return all(dep in results or dep not in names for dep in stage.deps)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for stage in [stage for stage in pending if ready(stage)]:
+                pending.remove(stage)
+                failed_deps = [dep for dep in stage.deps
+                               if dep in results and results[dep][0] in ('fehlgeschlagen', 'abgebrochen')]
+                if failed_deps:
+                    print(f"[{stage.name}] abgebrochen (fehlgeschlagen: {', '.join(failed_deps)})")
+                    results[stage.name] = ('abgebrochen', 0.0)
+                    continue
+                fingerprint = stage_fingerprint(stage)
+                up_to_date = (not force and status.get(stage.name) == fingerprint
+                              and all(os.path.exists(path) for path in stage.outputs))
+                if up_to_date:
+                    print(f"[{stage.name}] aktuell")
+                    results[stage.name] = ('aktuell', 0.0)
+                elif dry_run:
+                    print(f"[{stage.name}] würde ausgeführt: {' '.join(stage.command[1:])}")
+                    results[stage.name] = ('veraltet', 0.0)
+                else:
+                    print(f"[{stage.name}] starte: {' '.join(stage.command[1:])}")
+                    running[pool.submit(run_stage, stage)] = (stage, fingerprint)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                returncode, duration = future.result()
+                if returncode == 0:
+                    status[stage.name] = fingerprint
+                    save_status(status)
+                    results[stage.name] = ('ausgeführt', duration)
+                    print(f"[{stage.name}] fertig nach {duration:.2f} Sekunden")
+                else:
+                    status.pop(stage.name, None)
+                    save_status(status)
+                    results[stage.name] = ('fehlgeschlagen', duration)
+                    print(f"[{stage.name}] FEHLER (Rückgabecode {returncode}), siehe {stage.log_path}")
+    return results
+
+
+def print_summary(stages, results, wall_time):
+    """Zeitübersicht je Stufe."""
+    print("\n--- Zusammenfassung ---")
+    print(f"{'Stufe':<18} | {'Status':<15} | {'Dauer (s)':>10}")
+    print("-" * 50)
+    for stage in stages:
+        state, duration = results[stage.name]
+        print(f"{stage.name:<18} | {state:<15} | {duration:>10.2f}")
+    print("-" * 50)
+    total = sum(duration for _, duration in results.values())
+    print(f"Gesamtdauer: {wall_time:.2f} Sekunden (Summe der Stufen: {total:.2f} Sekunden).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Führt die Pipeline (01-07) aus; aktuelle Stufen werden übersprungen")
+    parser.add_argument('stufen', nargs='*',
+                        help="Nur diese Stufen (und ihre Voraussetzungen), z. B. 03 oder 02:Germany; Standard: alle")
+    parser.add_argument('--countries', nargs='+',
+                        help="Länderordner unter data/ oder 'all'; Standard: Deutschland, Frankreich, Estland")
+    parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count()),
+                        help="Anzahl parallel laufender Stufen")
+    parser.add_argument('--format', choices=list(FORMATS), default=DEFAULT_FORMAT,
+                        help="Speicherformat der Datensätze von 01 und 02")
+    parser.add_argument('--filter-im-stream', action='store_true',
+                        help="01 schreibt direkt die analysebereiten Datensätze (ohne Schritt 02)")
+    parser.add_argument('--neu', action='store_true', help="Alle gewählten Stufen unabhängig vom Stand ausführen")
+    parser.add_argument('--trocken', action='store_true', help="Nur anzeigen, welche Stufen ausgeführt würden")
+    args = parser.parse_args()
+
+    countries = resolve_countries(args.countries, data_root)
+    # Prozesse von 01 auf die parallel laufenden Länderzweige aufteilen
+    workers = max(1, os.cpu_count() // max(1, min(args.jobs, len(countries))))
+    stages = select_stages(build_stages(countries, args.format, args.filter_im_stream, workers), args.stufen)
+
+    print(f"--- Pipeline: {len(stages)} Stufen, bis zu {args.jobs} parallel ---")
+    start_time = time.time()
+    results = run_pipeline(stages, args.jobs, force=args.neu, dry_run=args.trocken)
+    print_summary(stages, results, time.time() - start_time)
+    if any(state in ('fehlgeschlagen', 'abgebrochen') for state, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import contextlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Protokoll der Stichprobenreduktion: Jeder Filterschritt (Bereinigung, Feature Engineering,
+# Modellstichproben) wird mit Stufe, Schritt, Land und Zeilen vorher/nachher festgehalten.
+LINEAGE_FILE = 'stichprobe_protokoll.json'
+
+# Reihenfolge der Stufen in der Pipeline (für die Reduktionstabelle in 05)
+STAGE_ORDER = ['bereinigung', 'merkmale', 'analyse', 'robustheit', 'visualisierung']
+
+
+def lineage_path(results_dir):
+    return os.path.join(results_dir, LINEAGE_FILE)
+
+
+@contextlib.contextmanager
+def locked(path, timeout=30):
+    """
+    Exklusive Sperre, damit parallel laufende Skripte eine JSON-Datei (Protokoll, Startwerte) nicht gleichzeitig
+    schreiben. Die Sperre hält das Betriebssystem auf der Datei path + '.lock' (flock, unter Windows
+    msvcrt.locking) und gibt sie frei, sobald der haltende Prozess endet; verwaiste Sperren nach einem Absturz
+    gibt es daher nicht, die Sperrdatei selbst bleibt liegen. TimeoutError, wenn sie nach timeout Sekunden
+    noch belegt ist.
+    """
+    lock_path = path + '.lock'
+    deadline = time.time() + timeout
+    with open(lock_path, 'a+b') as f:
+        while True:
+            try:
+                _lock_file(f, lock=True)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise TimeoutError(f"Sperre {lock_path} ist seit {timeout} Sekunden belegt")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            _lock_file(f, lock=False)
+
+
+def _lock_file(f, lock):
+    """Setzt (nicht blockierend, OSError wenn belegt) oder löst die Sperre auf der geöffneten Datei f."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), (fcntl.LOCK_EX | fcntl.LOCK_NB) if lock else fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK if lock else msvcrt.LK_UNLCK, 1)
+
+
+def load_lineage(results_dir):
+    """Lädt alle protokollierten Schritte als Liste von Dictionaries (leer, wenn noch nichts protokolliert wurde)."""
+    path = lineage_path(results_dir)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['steps']
+
+
+def record_steps(results_dir, stage, steps):
+    """
+    Schreibt die Schritte einer Stufe ins Protokoll. steps ist eine Liste von Dictionaries mit
+    'country', 'step', 'rows_in' und 'rows_out'. Frühere Einträge dieser Stufe für dieselben
+    Länder werden ersetzt, sodass ein erneuter Lauf das Protokoll aktualisiert statt es zu verlängern.
+    """
+    path = lineage_path(results_dir)
+    os.makedirs(results_dir, exist_ok=True)
+    countries = {step['country'] for step in steps}
+    with locked(path):
+        kept = [s for s in load_lineage(results_dir) if not (s['stage'] == stage and s['country'] in countries)]
+        new = [{'stage': stage, 'step': step['step'], 'country': step['country'],
+                'rows_in': int(step['rows_in']), 'rows_out': int(step['rows_out'])} for step in steps]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'steps': kept + new}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def country_counts(df):
+    """Zeilen je Land eines DataFrames mit Spalte 'country'."""
+    return {str(country): int(n) for country, n in df['country'].value_counts(sort=False).items()}
+
+
+def filter_steps(step, df_in, df_out):
+    """
+    Protokolleinträge (je Land) für einen Filterschritt von df_in nach df_out.
+    Statt eines DataFrames kann auch bereits das Ergebnis von country_counts übergeben werden.
+    """
+    rows_in, rows_out = (df if isinstance(df, dict) else country_counts(df) for df in (df_in, df_out))
+    return [{'country': country, 'step': step, 'rows_in': n, 'rows_out': rows_out.get(country, 0)}
+            for country, n in rows_in.items()]
+
+
+def stage_steps(lineage, stage, country):
+    """Die Schritte einer Stufe für ein Land in protokollierter Reihenfolge."""
+    return [s for s in lineage if s['stage'] == stage and s['country'] == country]
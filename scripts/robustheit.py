@@ -0,0 +1,191 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import patsy
+
+from laender import country_term
+from modellablage import formula_columns
+from speicher import drop_unused_categories
+from startwerte import START_NAME, start_values
+from zaehlmodelle import diagnostics, fit_glm_sparse, fit_zinb_sparse, sparse_dmatrices
+
+# --- Spezifikationen der Robustheits-Checks ---
+# Jede Spezifikation legt fest: Formel ({country} steht für den Länder-Term mit Referenzkategorie),
+# Zeilenfilter (pandas-Query, None = alle Zeilen), Modellfamilie ('zinb' für total_bids, 'glm' für den
+# Fractional Logit des KMU-Anteils), optional abweichende Parameter des Modellierungsdatensatzes
+# ('features', siehe merkmale.DEFAULT_PARAMS) und den Namen des Filterschritts im Protokoll ('step').
+# Mit 'details' wird die Koeffiziententabelle ausgegeben, 'note' folgt darauf.
+
+CONTROLS = "z_value + C(procurement_method) + C(procurement_category) + C(year)"
+ZINB_FORMULA = "total_bids ~ z_duration * {country} + " + CONTROLS
+GLM_FORMULA = "sme_share_safe ~ z_duration * {country} + " + CONTROLS
+
+# Hauptmodelle aus 03 (erste Zeilen der Vergleichstabelle, Bootstrap)
+MAIN_SPECS = [
+    {'name': 'H1', 'title': 'Hauptmodell ZINB', 'family': 'zinb', 'formula': ZINB_FORMULA, 'rows': None},
+    {'name': 'H2', 'title': 'Hauptmodell Fractional Logit', 'family': 'glm', 'formula': GLM_FORMULA, 'rows': None},
+]
+
+SPECS = [
+    {'name': 'R1', 'title': "ZINB mit 'award_criteria'", 'family': 'zinb',
+     'formula': ZINB_FORMULA + " + C(award_criteria)", 'rows': None,
+     'step': 'award_criteria vorhanden (R1)', 'details': True,
+     'note': "\n-> Wenn z_duration und Interaktionen ähnlich wie im Hauptmodell sind: ROBUST!"},
+    {'name': 'R2', 'title': "ZINB nur für 'Services'", 'family': 'zinb',
+     'formula': "total_bids ~ z_duration * {country} + z_value + C(procurement_method) + C(year)",
+     'rows': "procurement_category == 'services'",
+     'step': 'nur services, Modellvariablen vollständig (R2)', 'details': True},
+    {'name': 'R3', 'title': "ZINB nur für 'Goods'", 'family': 'zinb',
+     'formula': "total_bids ~ z_duration * {country} + z_value + C(procurement_method) + C(year)",
+     'rows': "procurement_category == 'goods'", 'step': 'nur goods, Modellvariablen vollständig (R3)'},
+    {'name': 'R4', 'title': "ZINB nur für 'Works'", 'family': 'zinb',
+     'formula': "total_bids ~ z_duration * {country} + z_value + C(procurement_method) + C(year)",
+     'rows': "procurement_category == 'works'", 'step': 'nur works, Modellvariablen vollständig (R4)'},
+    {'name': 'R5', 'title': 'ZINB ohne p99-Cap der Dauer', 'family': 'zinb', 'formula': ZINB_FORMULA,
+     'rows': None, 'features': {'cap_quantile': 1.0}, 'step': 'ohne p99-Cap, Modellvariablen vollständig (R5)'},
+    {'name': 'R6', 'title': 'ZINB mit total_bids < 50', 'family': 'zinb', 'formula': ZINB_FORMULA,
+     'rows': None, 'features': {'max_bids': 50}, 'step': 'total_bids < 50, Modellvariablen vollständig (R6)'},
+    {'name': 'R7', 'title': 'ZINB mit total_bids < 500', 'family': 'zinb', 'formula': ZINB_FORMULA,
+     'rows': None, 'features': {'max_bids': 500}, 'step': 'total_bids < 500, Modellvariablen vollständig (R7)'},
+    {'name': 'R8', 'title': "Fractional Logit mit 'award_criteria'", 'family': 'glm',
+     'formula': GLM_FORMULA + " + C(award_criteria)", 'rows': None,
+     'step': 'award_criteria und sme_share vorhanden (R8)'},
+    {'name': 'R9', 'title': "Fractional Logit nur für 'Services'", 'family': 'glm',
+     'formula': "sme_share_safe ~ z_duration * {country} + z_value + C(procurement_method) + C(year)",
+     'rows': "procurement_category == 'services'", 'step': 'nur services, sme_share vorhanden (R9)'},
+]
+
+
+def country_specs(countries):
+    """Je Land ein ZINB ohne Länder-Term (Steigung der Dauer im Land selbst)."""
+    return [{'name': f'L:{country}', 'title': f'ZINB nur {country}', 'family': 'zinb',
+             'formula': "total_bids ~ z_duration + " + CONTROLS, 'rows': f"country == '{country}'",
+             'step': f'nur {country}, Modellvariablen vollständig (L)'} for country in countries]
+
+
+def all_specs(countries, names=None):
+    """Alle Spezifikationen (SPECS und je Land), optional nur die mit den angegebenen Namen bzw. Präfixen."""
+    specs = SPECS + country_specs(countries)
+    if names:
+        specs = [spec for spec in specs if any(spec['name'] == n or spec['name'].startswith(n + ':') for n in names)]
+    return specs
+
+
+def resolve_formula(spec, countries):
+    return spec['formula'].format(country=country_term(countries))
+
+
+def prepare_sample(spec, reg_df, countries):
+    """Stichprobe einer Spezifikation: Zeilenfilter, vollständige Modellvariablen, nur die Spalten der Formel."""
+    formula = resolve_formula(spec, countries)
+    df = reg_df if spec['rows'] is None else reg_df.query(spec['rows'])
+    columns = formula_columns(formula, reg_df, ['const'] + (['sme_share'] if spec['family'] == 'glm' else []))
+    # 'country' bleibt immer erhalten (Protokoll der Stichprobenreduktion je Land)
+    keep = columns + ([] if 'country' in columns else ['country'])
+    df = drop_unused_categories(df.dropna(subset=columns)[keep].copy())
+    if spec['family'] == 'glm':
+        # Epsilon-Korrektur für Fractional Logit (0/1 Ränder) wie in 03
+        df['sme_share_safe'] = df['sme_share'].clip(1e-6, 1 - 1e-6)
+    return df
+
+
+def build_design(spec, data, countries, sparse=False):
+    """Zielvariable, Design (dicht über patsy oder dünn besetzt), Inflations-Design (nur ZINB) und Bauplan."""
+    formula = resolve_formula(spec, countries)
+    if sparse:
+        y, X, design_info = sparse_dmatrices(formula, data)
+    else:
+        y, X = patsy.dmatrices(formula, data)
+        design_info = X.design_info
+        y, X = np.asarray(y)[:, 0], np.asarray(X)
+    Z = data[['const']].to_numpy(dtype='float64') if spec['family'] == 'zinb' else None
+    return y, X, Z, design_info
+
+
+def fit_design(spec, y, X, Z, design_info, seed_params=None, start_name=START_NAME, cov_type='HC0'):
+    """
+    Schätzt eine Spezifikation auf einem fertigen Design; Startwerte aus seed_params (Series, siehe
+    startwerte.start_values), ohne sie die Standard-Startwerte. mle_retvals['cold'] vermerkt, ob die
+    Schätzung ab den Standard-Startwerten lief (Kaltstart-Referenz für den Startwert-Cache).
+    """
+    if spec['family'] == 'zinb':
+        start = start_values(seed_params, ['inflate_const'] + design_info.column_names + ['alpha'])
+        result = fit_zinb_sparse(y, X, Z, design_info, start_params=start, start_name=start_name)
+    else:
+        start = start_values(seed_params, design_info.column_names)
+        result = fit_glm_sparse(y, X, design_info, cov_type=cov_type, start_params=start, start_name=start_name)
+    result.mle_retvals['cold'] = start is None
+    return result
+
+
+def fit_model(spec, data, countries, seed_params=None, sparse=False):
+    """Schätzt eine Spezifikation (ModelResults; GLM mit HC0-Standardfehlern wie in 03)."""
+    return fit_design(spec, *build_design(spec, data, countries, sparse), seed_params=seed_params)
+
+
+def summarize(spec, result, seconds):
+    """Serialisierbare Zusammenfassung eines Ergebnisses (für den Prozess-Pool und die Vergleichstabelle)."""
+    info = result.mle_retvals
+    return {'name': spec['name'], 'params': result.params, 'bse': result.bse, 'pvalues': result.pvalues,
+            'nobs': result.nobs, 'llf': result.llf, 'iterations': info.get('iterations'),
+            'converged': info.get('converged'), 'start': info.get('start'), 'cold': info.get('cold', False),
+            'seconds': seconds,
+            'table': str(result.summary().tables[1]),
+            'diagnostics': diagnostics(result) if 'score_max' in info else None}
+
+
+def fit_spec(spec, data, countries, seed_params=None, sparse=False):
+    """Arbeitsfunktion des Prozess-Pools; Fehler werden als 'error' zurückgegeben statt abzubrechen."""
+    start_time = time.time()
+    try:
+        result = fit_model(spec, data, countries, seed_params, sparse)
+    except Exception as e:
+        return {'name': spec['name'], 'error': str(e), 'nobs': len(data)}
+    return summarize(spec, result, time.time() - start_time)
+
+
+def run_specs(tasks, workers):
+    """Schätzt alle Aufgaben (Argumente von fit_spec) parallel; Ergebnisse in der Reihenfolge der Aufgaben."""
+    if workers <= 1 or len(tasks) <= 1:
+        return [fit_spec(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [pool.submit(fit_spec, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def _stars(p):
+    return '***' if p < 0.001 else '**' if p < 0.01 else '*' if p < 0.05 else ''
+
+
+def comparison_table(specs, summaries):
+    """
+    Koeffizienten von z_duration und den Interaktionen z_duration × Land aller Spezifikationen
+    (Koeffizient mit Signifikanzsternen, Standardfehler in Klammern) sowie Stichprobe und Konvergenz.
+    Gibt die Tabelle zur Ausgabe und die Werte im Langformat (für die CSV-Datei) zurück.
+    """
+    rows, long_rows = [], []
+    for spec, summary in zip(specs, summaries):
+        row = {'Spezifikation': f"{spec['name']} {spec['title']}", 'n': summary['nobs']}
+        if 'error' in summary:
+            row['z_duration'] = f"Fehler: {summary['error']}"
+            rows.append(row)
+            continue
+        for term, coef in summary['params'].items():
+            if not (term == 'z_duration' or term.startswith('z_duration:')):
+                continue
+            label = 'z_duration' if term == 'z_duration' else f"z_duration × {term.rsplit('[T.', 1)[1][:-1]}"
+            se, p = summary['bse'][term], summary['pvalues'][term]
+            row[label] = f"{coef:.3f}{_stars(p)} ({se:.3f})"
+            long_rows.append({'spec': spec['name'], 'title': spec['title'], 'family': spec['family'],
+                              'term': label, 'coef': coef, 'se': se, 'p': p, 'nobs': summary['nobs']})
+        row['Schritte'] = summary['iterations']
+        row['Start'] = summary['start']
+        row['Sek.'] = round(summary['seconds'], 2)
+        rows.append(row)
+    table = pd.DataFrame(rows).set_index('Spezifikation')
+    # Spaltenreihenfolge: z_duration, Interaktionen, dann Stichprobe und Konvergenz
+    effect_columns = [c for c in table.columns if c.startswith('z_duration')]
+    table = table[['n'] + effect_columns + [c for c in ['Schritte', 'Start', 'Sek.'] if c in table.columns]]
+    return table.fillna('-'), pd.DataFrame(long_rows)
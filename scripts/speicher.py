@@ -0,0 +1,436 @@
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+# Unterstützte Speicherformate und ihre Dateiendungen.
+# Parquet ist der Standard; CSV bleibt als Exportformat erhalten.
+FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv',
+}
+DEFAULT_FORMAT = 'parquet'
+
+# --- Feste Schemata (Spalte -> Typ) ---
+# Die Rohdaten enthalten die Datumsangaben noch als Text; sie werden erst in der Bereinigung
+# (mit Behandlung fehlerhafter Einträge) umgewandelt. Gebote fehlen in den Rohdaten häufig
+# und sind dort daher float, im analysebereiten Datensatz ganze Zahlen.
+RAW_SCHEMA = {
+    'tender_id': 'string',
+    'buyer_id': 'category',
+    'publication_date': 'string',
+    'end_date': 'string',
+    'total_bids': 'float',
+    'sme_bids': 'float',
+    'tender_value': 'float',
+    'procurement_method': 'category',
+    'procurement_category': 'category',
+    'award_criteria': 'category',
+    'year': 'int',
+}
+
+READY_SCHEMA = {
+    **RAW_SCHEMA,
+    'publication_date': 'datetime',
+    'end_date': 'datetime',
+    'total_bids': 'int',
+    'sme_bids': 'int',
+    'duration_days': 'int',
+    'country': 'category',
+}
+
+ARROW_TYPES = {
+    'string': pa.string(),
+    'float': pa.float64(),
+    'int': pa.int64(),
+    'category': pa.dictionary(pa.int32(), pa.string()),
+    'datetime': pa.timestamp('ns'),
+}
+
+# Kennzahlen-Datei neben jedem Datensatz, z. B. germany_analysis_ready.parquet.stats.json
+SIDECAR_SUFFIX = '.stats.json'
+
+
+def dataset_path(results_dir, name, fmt=DEFAULT_FORMAT):
+    """Pfad eines Datensatzes, z. B. results/germany_analysis_ready.parquet."""
+    return os.path.join(results_dir, name + FORMATS[fmt])
+
+
+def find_dataset(results_dir, name):
+    """
+    Sucht einen Datensatz in allen Formaten und gibt den zuletzt geschriebenen Pfad zurück.
+    Existiert keine Datei, wird FileNotFoundError ausgelöst.
+    """
+    candidates = [dataset_path(results_dir, name, fmt) for fmt in FORMATS]
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        raise FileNotFoundError(f"Kein Datensatz '{name}' in {results_dir} gefunden "
+                                f"({', '.join(FORMATS.values())}).")
+    return max(existing, key=os.path.getmtime)
+
+
+def format_of(path):
+    for fmt, suffix in FORMATS.items():
+        if path.endswith(suffix):
+            return fmt
+    raise ValueError(f"Unbekanntes Dateiformat: {path}")
+
+
+def drop_unused_categories(df):
+    """
+    Sortiert die Kategorien aller kategorialen Spalten und entfernt nicht (mehr) vorkommende.
+    patsy verwendet bei kategorialen Spalten alle Kategorien als Stufen; ohne diesen Schritt
+    entstünden nach dem Filtern reine Null-Spalten in der Designmatrix.
+    """
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            used = df[col].dropna().unique()
+            df[col] = df[col].cat.set_categories(sorted(used))
+    return df
+
+
+def apply_schema(df, schema):
+    """Wandelt die Spalten von df in die Typen des Schemas um (nur vorhandene Spalten); Kategorien sortiert."""
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        if kind == 'float':
+            if not pd.api.types.is_float_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif kind == 'int':
+            if not pd.api.types.is_integer_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('int64')
+        elif kind == 'category':
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+            elif not df[col].cat.categories.is_monotonic_increasing:
+                # Blockweise geschriebene Dateien liefern die Kategorien in Reihenfolge des Auftretens
+                df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+        elif kind == 'datetime':
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601')
+        elif kind == 'string':
+            df[col] = df[col].astype('object').where(df[col].notna(), None)
+    return drop_unused_categories(df)
+
+
+def arrow_schema(schema, columns, stream_format, df=None):
+    """
+    Arrow-Schema für das blockweise Schreiben. Im Feather-Format (Arrow IPC) sind
+    wechselnde Dictionaries zwischen Blöcken nicht erlaubt, dort werden Kategorien als Text abgelegt.
+    Die Zeitzone von Datumsspalten wird aus dem ersten Block (df) übernommen.
+    """
+    fields = []
+    for col in columns:
+        arrow_type = ARROW_TYPES[schema[col]]
+        if stream_format == 'feather' and schema[col] == 'category':
+            arrow_type = pa.string()
+        if schema[col] == 'datetime' and df is not None:
+            tz = getattr(df[col].dtype, 'tz', None)
+            if tz is not None:
+                arrow_type = pa.timestamp('ns', tz=str(tz))
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+def write_table(df, path, schema=None, sidecar=True):
+    """
+    Schreibt einen DataFrame im Format der Dateiendung (Parquet, Feather oder CSV).
+    Mit sidecar=True werden zusätzlich die Kennzahlen (siehe table_stats) daneben gespeichert.
+    """
+    if schema is not None:
+        df = apply_schema(df, schema)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fmt = format_of(path)
+    if schema is not None and fmt != 'csv' and set(df.columns) <= set(schema):
+        # Arrow-Typen wie beim blockweisen Schreiben (TableWriter), damit beide Wege dieselbe Datei ergeben,
+        # auch bei leeren Datensätzen (sonst werden Kategorien ohne Werte als Null-Typ gespeichert)
+        table = pa.Table.from_pandas(df, schema=arrow_schema(schema, list(df.columns), fmt, df), preserve_index=False)
+        if fmt == 'parquet':
+            pq.write_table(table, path)
+        else:
+            with pa.OSFile(path, 'wb') as sink, ipc.new_file(
+                    sink, table.schema, options=ipc.IpcWriteOptions(compression='lz4')) as writer:
+                writer.write_table(table)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    if sidecar:
+        write_sidecar(path, table_stats(df))
+
+
+def read_table(path, columns=None, schema=None):
+    """
+    Lädt einen Datensatz; mit columns werden nur die benötigten Spalten gelesen.
+    Bei CSV-Dateien werden die Typen anhand des Schemas wiederhergestellt.
+    """
+    fmt = format_of(path)
+    if fmt == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+    elif fmt == 'feather':
+        df = pd.read_feather(path, columns=columns)
+    else:
+        # Text-Spalten (z. B. IDs) nicht als Zahlen interpretieren lassen
+        text_columns = {col: str for col, kind in (schema or {}).items() if kind == 'string'}
+        df = pd.read_csv(path, usecols=columns, dtype=text_columns or None, low_memory=False)
+    if schema is not None:
+        df = apply_schema(df, schema)
+    return df
+
+
+def load_ready(results_dir, country_name, columns=None):
+    """Lädt den analysebereiten Datensatz eines Landes (nur die angegebenen Spalten)."""
+    path = find_dataset(results_dir, f'{country_name.lower()}_analysis_ready')
+    return read_table(path, columns=columns, schema=READY_SCHEMA)
+
+
+def load_raw(results_dir, country_name, columns=None):
+    """Lädt die Rohdaten eines Landes (nur die angegebenen Spalten)."""
+    path = find_dataset(results_dir, f'{country_name.lower()}_all_tenders_raw')
+    return read_table(path, columns=columns, schema=RAW_SCHEMA)
+
+
+def load_countries(results_dir, countries, columns=None, loader=load_ready, workers=8):
+    """
+    Lädt die Datensätze mehrerer Länder parallel (Threads; pyarrow liest ohne GIL) und gibt
+    ein Dictionary Land -> DataFrame in der Reihenfolge von countries zurück.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(countries)))) as pool:
+        frames = pool.map(lambda country_name: loader(results_dir, country_name, columns=columns), countries)
+        return dict(zip(countries, frames))
+
+
+def concat_countries(frames):
+    """
+    Fügt die Datensätze mehrerer Länder zusammen (frames: Land -> DataFrame) und setzt
+    die Spalte 'country'. Kategoriale Spalten erhalten gemeinsame, sortierte Kategorien,
+    damit pd.concat sie nicht in Text-Spalten umwandelt.
+    """
+    frames = {country: df.assign(country=country) for country, df in frames.items()}
+    columns = next(iter(frames.values())).columns
+    for col in columns:
+        if col == 'country' or any(isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames.values()):
+            categories = sorted(set().union(*(df[col].dropna().unique() for df in frames.values())))
+            for df in frames.values():
+                df[col] = df[col].astype(pd.CategoricalDtype(categories))
+    return pd.concat(list(frames.values()), ignore_index=True)
+
+
+def count_rows(path):
+    """Zeilenanzahl eines Datensatzes; bei Parquet und Feather nur aus den Metadaten."""
+    fmt = format_of(path)
+    if fmt == 'parquet':
+        return pq.ParquetFile(path).metadata.num_rows
+    if fmt == 'feather':
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    n_rows = 0
+    for chunk in pd.read_csv(path, usecols=[0], chunksize=1_000_000):
+        n_rows += len(chunk)
+    return n_rows
+
+
+def iter_batches(path, batch_size=100_000, columns=None):
+    """Liest einen Datensatz blockweise als DataFrames (konstanter Speicherbedarf)."""
+    fmt = format_of(path)
+    if fmt == 'parquet':
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'feather':
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size, low_memory=False)
+
+
+def _python_value(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def table_stats(df):
+    """
+    Kennzahlen eines Datensatzes (oder Blocks) für Berichte ohne erneutes Lesen der Daten:
+    Zeilenanzahl, fehlende Werte je Spalte, Anzahl Null-Gebote (total_bids == 0)
+    und Minimum, Maximum und Summe je numerischer Spalte.
+    """
+    stats = {
+        'rows': len(df),
+        'nulls': {col: int(n) for col, n in df.isna().sum().items()},
+        'numeric': {},
+    }
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            values = df[col].dropna()
+            stats['numeric'][col] = {
+                'min': _python_value(values.min()) if len(values) else None,
+                'max': _python_value(values.max()) if len(values) else None,
+                'sum': _python_value(values.sum()),
+            }
+    if 'total_bids' in df.columns:
+        stats['zero_bids'] = int((df['total_bids'] == 0).sum())
+    return stats
+
+
+def merge_stats(total, stats):
+    """Fasst die Kennzahlen zweier Blöcke zusammen (total darf None sein)."""
+    if total is None:
+        return stats
+    merged = {
+        'rows': total['rows'] + stats['rows'],
+        'nulls': {col: total['nulls'].get(col, 0) + stats['nulls'].get(col, 0)
+                  for col in {**total['nulls'], **stats['nulls']}},
+        'numeric': {},
+    }
+    for col in {**total['numeric'], **stats['numeric']}:
+        a = total['numeric'].get(col, {'min': None, 'max': None, 'sum': 0})
+        b = stats['numeric'].get(col, {'min': None, 'max': None, 'sum': 0})
+        merged['numeric'][col] = {
+            'min': min((v for v in (a['min'], b['min']) if v is not None), default=None),
+            'max': max((v for v in (a['max'], b['max']) if v is not None), default=None),
+            'sum': a['sum'] + b['sum'],
+        }
+    if 'zero_bids' in total or 'zero_bids' in stats:
+        merged['zero_bids'] = total.get('zero_bids', 0) + stats.get('zero_bids', 0)
+    return merged
+
+
+def stats_equal(a, b, rel_tol=1e-9):
+    """Vergleicht zwei Kennzahlen-Dictionaries (Summen mit Toleranz für die Rundung)."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(stats_equal(a[k], b[k], rel_tol) for k in a)
+    if isinstance(a, float) or isinstance(b, float):
+        return a is not None and b is not None and math.isclose(a, b, rel_tol=rel_tol)
+    return a == b
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def write_sidecar(path, stats):
+    """Speichert die Kennzahlen neben dem Datensatz, zusammen mit Größe und Änderungszeit der Datei."""
+    stat = os.stat(path)
+    sidecar = {'file': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, **stats}
+    with open(sidecar_path(path), 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2)
+
+
+def read_sidecar(path):
+    """
+    Lädt die Kennzahlen eines Datensatzes. Gibt None zurück, wenn keine vorhanden sind
+    oder die Datei seitdem neu geschrieben wurde.
+    """
+    if not os.path.exists(sidecar_path(path)):
+        return None
+    with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+    stat = os.stat(path)
+    if stats.pop('file', None) != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+        return None
+    return stats
+
+
+def build_sidecar(path, schema=None):
+    """Berechnet die Kennzahlen blockweise aus den Daten neu und speichert sie."""
+    total = None
+    for batch in iter_batches(path):
+        if schema is not None:
+            batch = apply_schema(batch, schema)
+        total = merge_stats(total, table_stats(batch))
+    if total is None:
+        total = table_stats(read_table(path, schema=schema))
+    write_sidecar(path, total)
+    return total
+
+
+def dataset_stats(path, schema=None):
+    """Kennzahlen eines Datensatzes aus der Kennzahlen-Datei; fehlt sie oder ist sie veraltet, wird sie neu erstellt."""
+    stats = read_sidecar(path)
+    if stats is None:
+        stats = build_sidecar(path, schema)
+    return stats
+
+
+class TableWriter:
+    """
+    Schreibt einen Datensatz blockweise mit festem Schema in eine Datei (Parquet, Feather oder CSV).
+    Jeder Block wird sofort geschrieben; im Speicher liegt immer nur der aktuelle Block.
+    Die Kennzahlen der Blöcke werden mitgeführt und beim Schließen daneben gespeichert (sidecar=True).
+    """
+
+    def __init__(self, path, schema, columns=None, sidecar=True):
+        self.path = path
+        self.fmt = format_of(path)
+        self.schema = schema
+        self.columns = list(columns or schema)
+        self.rows_written = 0
+        self.sidecar = sidecar
+        self.stats = None
+        self._writer = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if self.fmt == 'csv':
+            self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+            self._header = True
+
+    def _open(self, df=None):
+        """Öffnet den Parquet- bzw. Feather-Writer (Schema nach dem ersten Block, siehe arrow_schema)."""
+        self._arrow_schema = arrow_schema(self.schema, self.columns, self.fmt, df)
+        if self.fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self.path, self._arrow_schema)
+        else:
+            self._sink = pa.OSFile(self.path, 'wb')
+            self._writer = ipc.new_file(self._sink, self._arrow_schema,
+                                        options=ipc.IpcWriteOptions(compression='lz4'))
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        df = apply_schema(df[self.columns].copy(), self.schema)
+        if self.sidecar:
+            self.stats = merge_stats(self.stats, table_stats(df))
+        if self.fmt != 'csv' and self._writer is None:
+            self._open(df)
+        if self.fmt == 'csv':
+            df.to_csv(self._file, index=False, header=self._header)
+            self._header = False
+        else:
+            if self.fmt == 'feather':
+                for col in self.columns:
+                    if self.schema[col] == 'category':
+                        df[col] = df[col].astype('object')
+            table = pa.Table.from_pandas(df, schema=self._arrow_schema, preserve_index=False)
+            self._writer.write_table(table)
+        self.rows_written += len(df)
+
+    def close(self):
+        if self.fmt == 'csv':
+            if self._header:
+                pd.DataFrame(columns=self.columns).to_csv(self._file, index=False)
+            self._file.close()
+        else:
+            if self._writer is None:
+                self._open()
+            self._writer.close()
+            if self.fmt == 'feather':
+                self._sink.close()
+        if self.sidecar:
+            if self.stats is None:
+                self.stats = table_stats(apply_schema(pd.DataFrame(columns=self.columns), self.schema))
+            write_sidecar(self.path, self.stats)
+        return self.rows_written
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from modellablage import model_dir
+from protokoll import locked
+
+# --- Startwerte aus früheren Schätzungen ---
+# results/modelle/startwerte.json hält je Modellfamilie ('zinb', 'glm') die zuletzt konvergierten Koeffizienten
+# je Parametername (inflate_*, Spalten des Designs, alpha). Jede Schätzung startet für bekannte Parameter bei
+# diesen Werten, für neue Spalten bei 0; die Spezifikationen teilen fast alle Spalten. Zum Vergleich wird je
+# Modell die Zahl der Newton-Schritte und die Laufzeit der letzten Schätzung ab den Standard-Startwerten
+# (Kaltstart: Poisson/NB2 bzw. Nullvektor) festgehalten; --kaltstart in 03 und 04 misst sie neu.
+START_FILE = 'startwerte.json'
+START_NAME = 'Cache'
+
+
+def start_cache_path(results_dir):
+    return os.path.join(model_dir(results_dir), START_FILE)
+
+
+def load_start_cache(results_dir):
+    path = start_cache_path(results_dir)
+    if not os.path.exists(path):
+        return {'families': {}, 'cold': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_start_cache(results_dir, cache):
+    # Erst in eine temporäre Datei schreiben, dann ersetzen (Leser sehen nie eine halb geschriebene Datei)
+    path = start_cache_path(results_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def family_params(cache, family):
+    """Zuletzt konvergierte Koeffizienten der Familie als Series (leer, wenn noch keine)."""
+    return pd.Series(cache['families'].get(family, {}).get('params', {}), dtype='float64')
+
+
+def start_values(params, names):
+    """
+    Startwerte für die Parameter names aus params (Series) für alle bekannten Namen, 0 für neue Spalten.
+    None (Standard-Startwerte), wenn kein Name bekannt ist oder alpha der ZINB fehlt (0 ist dort unzulässig).
+    """
+    if params is None or not any(name in params.index for name in names):
+        return None
+    if 'alpha' in names and 'alpha' not in params.index:
+        return None
+    return np.array([params.get(name, 0.0) for name in names], dtype='float64')
+
+
+def fit_stats(result):
+    """Newton-Schritte (bzw. IRLS-Iterationen) und Konvergenz eines Ergebnisses."""
+    retvals = getattr(result, 'mle_retvals', None)
+    if retvals is None:
+        # statsmodels GLM (IRLS)
+        return result.fit_history['iteration'], bool(result.converged)
+    return retvals['iterations'], bool(retvals['converged'])
+
+
+def record_fits(results_dir, family, fits):
+    """
+    Übernimmt die konvergierten Schätzungen fits (Liste von Dicts mit name, params, iterations, converged,
+    seconds, nobs, cold) in den Cache: Koeffizienten je Parametername (spätere überschreiben frühere),
+    bei Kaltstarts die Referenz des Modells. Gibt je Schätzung die Zeile aus savings_line zurück.
+    """
+    path = start_cache_path(results_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Lesen, Ergänzen und Schreiben unter einer Sperre, damit parallele Skripte keine Einträge verlieren
+    with locked(path):
+        cache = load_start_cache(results_dir)
+        entry = cache['families'].setdefault(family, {'params': {}})
+        lines = []
+        for fit in fits:
+            if not fit['converged']:
+                lines.append(f"{fit['name']}: nicht konvergiert, Startwerte nicht übernommen")
+                continue
+            entry['params'].update({name: float(value) for name, value in fit['params'].items()})
+            entry['source'] = fit['name']
+            entry['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            if fit['cold']:
+                cache['cold'][fit['name']] = {'iterations': int(fit['iterations']), 'seconds': fit['seconds'],
+                                              'nobs': int(fit['nobs'])}
+            lines.append(savings_line(cache, fit))
+        _save_start_cache(results_dir, cache)
+    return lines
+
+
+def record_fit(results_dir, family, name, result, seconds, cold):
+    """record_fits für ein einzelnes Ergebnis (statsmodels oder ModelResults); gibt die Zeile zurück."""
+    iterations, converged = fit_stats(result)
+    return record_fits(results_dir, family, [{'name': name, 'params': result.params, 'iterations': iterations,
+                                              'converged': converged, 'seconds': seconds, 'nobs': result.nobs,
+                                              'cold': cold}])[0]
+
+
+def cold_reference(cache, fit):
+    """Kaltstart-Referenz des Modells, nur wenn sie auf derselben Stichprobengröße beruht (sonst None)."""
+    reference = cache['cold'].get(fit['name'])
+    if reference is None or reference['nobs'] != int(fit['nobs']):
+        return None
+    return reference
+
+
+def savings(cache, fit):
+    """(gesparte Schritte, gesparte Sekunden) gegenüber der Kaltstart-Referenz des Modells, sonst None."""
+    reference = cold_reference(cache, fit)
+    if fit['cold'] or reference is None:
+        return None
+    return reference['iterations'] - fit['iterations'], reference['seconds'] - fit['seconds']
+
+
+def savings_line(cache, fit):
+    if fit['cold']:
+        return (f"Startwerte {fit['name']}: Kaltstart, {fit['iterations']} Schritte, {fit['seconds']:.2f} Sekunden "
+                f"(Referenz gespeichert)")
+    reference = cold_reference(cache, fit)
+    if reference is None:
+        return (f"Startwerte {fit['name']}: aus dem Cache, {fit['iterations']} Schritte, {fit['seconds']:.2f} Sekunden "
+                f"(keine Kaltstart-Referenz für diese Stichprobe, siehe --kaltstart)")
+    steps, seconds = savings(cache, fit)
+    return (f"Startwerte {fit['name']}: aus dem Cache, {fit['iterations']} statt {reference['iterations']} Schritte, "
+            f"{fit['seconds']:.2f} statt {reference['seconds']:.2f} Sekunden (gespart: {steps} Schritte, "
+            f"{seconds:.2f} Sekunden)")
@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import expit
+
+from laender import DEFAULT_COUNTRIES, country_info
+
+# --- Synthetische OpenTender-Daten ---
+# Schreibt Jahresdateien data/<Land>/<land>_<JAHR>.jsonl im Aufbau der OpenTender-Exporte, damit die Pipeline
+# ohne den Download getestet und gemessen werden kann. Gelesen werden dieselben Felder wie in
+# einlesen.extract_tender_data (date, tender.tenderPeriod.endDate, tender.value.amount, Verfahren, Kategorie,
+# Zuschlagskriterien, bids.statistics mit electronicBids/smeBids), mit den Eigenheiten der echten Daten:
+# fehlende Angaben und leere Objekte, Enddatum vor dem Start, nicht-wettbewerbliche Verfahren, verschiedene
+# ISO-8601-Varianten (mit Zeitzone, Sekundenbruchteilen, nur Datum) und einzelne Angaben in anderen Formaten.
+# Die Gebotsanzahl ist nullinflationiert negativ-binomial (NB2) mit Effekten der Dauer, der Kategorie und
+# des Landes, smeBids binomial aus electronicBids. Jede Datei hat einen eigenen Zufallsstrom aus Seed,
+# Land und Jahr; das Ergebnis hängt also nicht von der Zahl der Prozesse ab.
+MARKER_FILE = '.synthetisch.json'
+DEFAULT_SEED = 2024
+DEFAULT_YEARS = list(range(2019, 2022))
+BATCH_ROWS = 50_000
+
+# Anteil an allen Zeilen, Nullinflation (Logit-Achsenabschnitt), log. mittlere Gebotsanzahl und
+# mittlere Dauer in Tagen je Land; Länder ohne Eintrag erhalten OTHER_PROFILE
+PROFILES = {
+    'Germany': {'weight': 0.45, 'zero': -0.6, 'log_bids': 1.3, 'duration': 38},
+    'France': {'weight': 0.45, 'zero': -1.0, 'log_bids': 1.5, 'duration': 42},
+    'Estonia': {'weight': 0.10, 'zero': -1.4, 'log_bids': 1.0, 'duration': 24},
+}
+OTHER_PROFILE = {'weight': 0.20, 'zero': -1.0, 'log_bids': 1.2, 'duration': 35}
+ALPHA = 0.8
+
+METHODS = ['open', 'selective', 'limited', 'direct', None]
+METHOD_PROBS = [0.70, 0.10, 0.10, 0.07, 0.03]
+CATEGORIES = ['services', 'goods', 'works', None]
+CATEGORY_PROBS = [0.45, 0.35, 0.18, 0.02]
+CATEGORY_EFFECTS = np.array([0.0, 0.15, 0.35, 0.0])
+CRITERIA = ['priceOnly', 'ratedCriteria', None]
+CRITERIA_PROBS = [0.45, 0.40, 0.15]
+# Datumsformate: Z-Suffix, nur Datum, Sekundenbruchteile, Zeitzonen-Offset, anderes Format (langsamer Weg in 02)
+DATE_FORMATS = ['z', 'date', 'fraction', 'offset', 'other']
+DATE_FORMAT_PROBS = [0.60, 0.20, 0.10, 0.095, 0.005]
+
+
+def country_profile(country):
+    return PROFILES.get(country, OTHER_PROFILE)
+
+
+def file_path(target_dir, country, year):
+    return os.path.join(target_dir, country, f'{country.lower()}_{year}.jsonl')
+
+
+def allocate_rows(rows, countries, years):
+    """Zeilen je (Land, Jahr): nach Gewicht der Länder, gleichmäßig über die Jahre (Rest nach größtem Bruchteil)."""
+    cells = [(country, year) for country in countries for year in years]
+    weights = np.array([country_profile(country)['weight'] for country, _ in cells], dtype='float64')
+    shares = rows * weights / weights.sum()
+    counts = np.floor(shares).astype('int64')
+    for i in np.argsort(-(shares - counts), kind='stable')[:rows - counts.sum()]:
+        counts[i] += 1
+    return {cell: int(count) for cell, count in zip(cells, counts)}
+
+
+def format_dates(timestamps, formats, rng):
+    """ISO-Zeitpunkte (Sekunden) in der Schreibweise je Zeile; 'other' ergibt z. B. '19.03.2019'."""
+    texts = np.datetime_as_string(timestamps, unit='s')
+    millis = rng.integers(0, 1000, len(texts))
+    formatted = []
+    for text, fmt, milli in zip(texts, formats, millis):
+        if fmt == 'z':
+            formatted.append(f'{text}Z')
+        elif fmt == 'date':
+            formatted.append(text[:10])
+        elif fmt == 'fraction':
+            formatted.append(f'{text}.{milli:03d}Z')
+        elif fmt == 'offset':
+            formatted.append(f'{text}+01:00')
+        else:
+            formatted.append(f'{text[8:10]}.{text[5:7]}.{text[:4]}')
+    return formatted
+
+
+def generate_batch(rng, country, year, n, first_id):
+    """Zieht n Datensätze eines Landes und Jahres als Liste von JSON-Objekten (dicts)."""
+    profile = country_profile(country)
+    code = country_info(country)['code'] or country[:2].upper()
+
+    # Veröffentlichung im Jahr, Dauer log-normal mit schwerem Rand; etwa 2 % enden vor dem Start
+    start = (np.datetime64(f'{year}-01-01T00:00:00')
+             + rng.integers(0, 365 * 86400, n).astype('timedelta64[s]'))
+    duration = np.maximum(1, np.round(rng.lognormal(np.log(profile['duration']), 0.6, n))).astype('int64')
+    duration = np.where(rng.random(n) < 0.02, -rng.integers(1, 30, n), duration)
+    end = (start + (duration * 86400).astype('timedelta64[s]')
+           + rng.integers(-3600 * 8, 3600 * 8, n).astype('timedelta64[s]'))
+
+    method = rng.choice(len(METHODS), n, p=METHOD_PROBS)
+    category = rng.choice(len(CATEGORIES), n, p=CATEGORY_PROBS)
+    criteria = rng.choice(len(CRITERIA), n, p=CRITERIA_PROBS)
+    value = np.round(rng.lognormal(11.5, 1.6, n), 2)
+
+    # ZINB: strukturelle Nullen seltener bei langen Fristen, Erwartungswert steigt mit der Dauer
+    z = (np.log(np.abs(duration)) - np.log(profile['duration'])) / 0.6
+    zero = rng.random(n) < expit(profile['zero'] - 0.3 * z)
+    mean = np.exp(profile['log_bids'] + 0.25 * z + CATEGORY_EFFECTS[category] + 0.1 * (year - 2019))
+    bids = rng.poisson(rng.gamma(1 / ALPHA, ALPHA * mean))
+    bids = np.where(zero, 0, bids)
+    sme = rng.binomial(bids, np.where(category == 2, 0.7, 0.5))
+
+    start_text = format_dates(start, rng.choice(DATE_FORMATS, n, p=DATE_FORMAT_PROBS), rng)
+    end_text = format_dates(end, rng.choice(DATE_FORMATS, n, p=DATE_FORMAT_PROBS), rng)
+    # Fehlende Angaben und leere Objekte wie in den Exporten
+    missing = rng.random((n, 7))
+
+    records = []
+    for i in range(n):
+        tender_id = f'{code}{year}-{first_id + i:09d}'
+        tender = {'id': tender_id, 'title': f'Ausschreibung {first_id + i}', 'status': 'complete'}
+        if missing[i, 0] >= 0.08:
+            tender['tenderPeriod'] = {} if missing[i, 0] < 0.10 else {'endDate': end_text[i]}
+        if missing[i, 1] >= 0.20:
+            tender['value'] = {'amount': float(value[i]), 'currency': 'EUR'}
+        elif missing[i, 1] >= 0.15:
+            tender['value'] = {}
+        if METHODS[method[i]] is not None:
+            tender['procurementMethod'] = METHODS[method[i]]
+        if CATEGORIES[category[i]] is not None:
+            tender['mainProcurementCategory'] = CATEGORIES[category[i]]
+        tender['awardCriteria'] = CRITERIA[criteria[i]]
+
+        statistics = []
+        if missing[i, 2] >= 0.10:
+            statistics.append({'id': '1', 'measure': 'electronicBids', 'value': int(bids[i])})
+        if missing[i, 3] >= 0.20:
+            statistics.append({'id': '2', 'measure': 'smeBids', 'value': int(sme[i])})
+        record = {'ocid': f'ocds-synth-{tender_id}', 'id': tender_id}
+        if missing[i, 4] >= 0.03:
+            record['date'] = start_text[i]
+        record['tender'] = tender
+        record['buyer'] = {'id': f'{code}-B{int(missing[i, 5] * 5000):04d}'}
+        if statistics:
+            record['bids'] = {'statistics': statistics}
+        elif missing[i, 6] < 0.5:
+            record['bids'] = {}
+        records.append(record)
+    return records
+
+
+def write_file(task):
+    """Schreibt eine Jahresdatei (Aufgabe: Zielordner, Land, Jahr, Zeilen, Seed); gibt Pfad und Bytes zurück."""
+    target_dir, country, year, rows, seed = task
+    path = file_path(target_dir, country, year)
+    rng = np.random.default_rng([seed, zlib.crc32(country.encode('utf-8')), year])
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for first in range(0, rows, BATCH_ROWS):
+            batch = generate_batch(rng, country, year, min(BATCH_ROWS, rows - first), first)
+            f.write(''.join(json.dumps(record) + '\n' for record in batch))
+    os.replace(tmp_path, path)
+    return path, os.path.getsize(path)
+
+
+def check_target(target_dir, countries, overwrite=False):
+    """Bricht ab, wenn ein Länderordner bereits echte (nicht synthetische) Jahresdateien enthält."""
+    for country in countries:
+        folder = os.path.join(target_dir, country)
+        if overwrite or not os.path.isdir(folder) or os.path.exists(os.path.join(folder, MARKER_FILE)):
+            continue
+        if any('.jsonl' in name for name in os.listdir(folder)):
+            raise SystemExit(f"{folder} enthält bereits Daten, die nicht synthetisch sind "
+                             f"(--ueberschreiben ersetzt sie, oder --ziel wählt einen anderen Ordner)")
+
+
+def generate(target_dir, rows, countries=DEFAULT_COUNTRIES, years=DEFAULT_YEARS, seed=DEFAULT_SEED, workers=1,
+             overwrite=False):
+    """
+    Schreibt insgesamt rows Datensätze auf die Jahresdateien der Länder und vermerkt Seed und Zeilen
+    in <land>/.synthetisch.json. Gibt die Zeilen und Bytes je Datei zurück.
+    """
+    check_target(target_dir, countries, overwrite)
+    counts = allocate_rows(rows, countries, years)
+    for country in countries:
+        os.makedirs(os.path.join(target_dir, country), exist_ok=True)
+    tasks = [(target_dir, country, year, count, seed) for (country, year), count in counts.items()]
+    if workers <= 1:
+        written = [write_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            written = list(pool.map(write_file, tasks))
+    for country in countries:
+        with open(os.path.join(target_dir, country, MARKER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'seed': seed, 'years': list(years),
+                       'rows': {str(year): counts[(country, year)] for year in years}}, f, indent=2)
+    return [(path, counts[task[1:3]], size) for task, (path, size) in zip(tasks, written)]
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Erzeugt synthetische OpenTender-Jahresdateien (JSONL)")
+    parser.add_argument('--zeilen', type=int, default=10_000, help="Zeilen insgesamt über alle Länder und Jahre")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed des Zufallsgenerators")
+    parser.add_argument('--countries', nargs='+',
+                        help="Länder (Ordnername, ISO-Code oder Anzeigename); Standard: Deutschland, Frankreich, Estland")
+    parser.add_argument('--jahre', nargs='+', type=int, default=DEFAULT_YEARS, help="Jahre der Dateien")
+    parser.add_argument('--ziel', default=os.path.join(script_dir, '..', 'data'),
+                        help="Zielordner mit einem Unterordner je Land (Standard: data/)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Anzahl paralleler Prozesse")
+    parser.add_argument('--ueberschreiben', action='store_true',
+                        help="Auch Länderordner mit vorhandenen (echten) Daten überschreiben")
+    args = parser.parse_args()
+
+    countries = [country_info(country)['folder'] for country in args.countries or DEFAULT_COUNTRIES]
+    print(f"--- Erzeuge {args.zeilen} synthetische Datensätze (Seed {args.seed}) ---")
+    start_time = time.time()
+    written = generate(args.ziel, args.zeilen, countries, args.jahre, args.seed, args.workers, args.ueberschreiben)
+    for path, rows, size in written:
+        print(f"  {os.path.relpath(path, args.ziel)}: {rows} Zeilen, {size / 1024 ** 2:.1f} MB")
+    total = sum(size for _, _, size in written)
+    print(f"Fertig nach {time.time() - start_time:.2f} Sekunden ({total / 1024 ** 2:.1f} MB).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import json
+import os
+
+import numpy as np
+
+# --- Verteilungsskizzen je Land und Jahr ---
+# Beim Schreiben der analysebereiten Datensätze werden für tender_value exakte Zähler
+# (Anzahl, Minimum, Maximum, Summe, Anzahl unter den Schwellenwerten) und eine KLL-Quantilskizze
+# sowie für duration_days ein exaktes Histogramm gespeichert. Berichte wie 07 und der p99-Cap
+# lassen sich daraus ohne Laden der Zeilen beantworten, auch über mehrere Länder hinweg.
+#
+# Fehlerschranken:
+#   * Anzahl, Minimum, Maximum, Summe (und damit der Mittelwert) sowie die Anteile unter den
+#     Schwellenwerten sind exakt.
+#   * Quantile von duration_days (z. B. p99) sind exakt, da die Dauer ganzzahlig ist und vollständig
+#     als Histogramm vorliegt; die Interpolation entspricht pandas.Series.quantile.
+#   * Quantile von tender_value (z. B. Median) stammen aus der KLL-Skizze (Karnin, Lang, Liberty 2016).
+#     Solange ein Land-Jahr höchstens KLL_K Werte hat, ist die Skizze verlustfrei und das Ergebnis exakt.
+#     Darüber ist der Fehler ein Rangfehler: Der geschätzte Median liegt mit hoher Wahrscheinlichkeit
+#     (99 %) zwischen dem (50 - e)- und dem (50 + e)-Perzentil der Daten, mit e ≈ 1.65 % · 200 / KLL_K,
+#     bei KLL_K = 2000 also etwa ±0.17 Perzentilpunkte. Das Zusammenführen von Skizzen erhält diese Schranke.
+
+SKETCH_VERSION = 1
+
+# Größe der KLL-Skizze (Anzahl Werte der obersten Stufe); größer = genauer
+KLL_K = 2000
+
+# Schwellenwerte für tender_value (EUR), siehe 07_check_tresholds.py
+VALUE_THRESHOLDS = [25_000, 100_000, 215_000]
+
+# Das Dauer-Histogramm zählt nur Zeilen mit total_bids < MAX_BIDS (technische Bereinigung in merkmale.py)
+MAX_BIDS = 100
+
+
+class KLLSketch:
+    """
+    Zusammenführbare Quantilskizze (KLL). Werte auf Stufe h stehen für 2**h Originalwerte;
+    läuft eine Stufe über, wird sie sortiert und jeder zweite Wert (zufälliger Versatz) eine Stufe
+    höher geschoben. Die Kapazität sinkt von oben nach unten um den Faktor 2/3.
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+
+    def _compress(self):
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if len(items) <= self.capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Bei ungerader Anzahl bleibt ein Wert auf dieser Stufe
+                keep, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                compacted = True
+
+    @property
+    def exact(self):
+        """True, solange noch keine Werte zusammengefasst wurden (Ergebnis dann exakt)."""
+        return len(self.levels) == 1
+
+    @property
+    def rank_error(self):
+        """Rangfehler der Quantile (Anteil, 99 % Sicherheit), siehe Fehlerschranken oben."""
+        return 0.0 if self.exact else 0.0165 * 200 / self.k
+
+    def quantile(self, q):
+        """Quantil q (0..1); bei exakter Skizze mit linearer Interpolation wie pandas."""
+        if self.n == 0:
+            return float('nan')
+        if self.exact:
+            return float(np.quantile(self.levels[0], q))
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        index = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        return float(items[order][min(index, len(items) - 1)])
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data['k'])
+        sketch.n = data['n']
+        sketch.levels = [np.asarray(items, dtype='float64') for items in data['levels']]
+        return sketch
+
+
+class ValueSummary:
+    """Exakte Zähler und KLL-Skizze für positive tender_value-Werte."""
+
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.below = {threshold: 0 for threshold in VALUE_THRESHOLDS}
+        self.sketch = KLLSketch()
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values) & (values > 0)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        self.sum += float(values.sum())
+        for threshold in VALUE_THRESHOLDS:
+            self.below[threshold] += int((values < threshold).sum())
+        self.sketch.update(values)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sum += other.sum
+        for threshold in VALUE_THRESHOLDS:
+            self.below[threshold] += other.below[threshold]
+        self.sketch.merge(other.sketch)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('nan')
+
+    def to_dict(self):
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'sum': self.sum,
+                'below': {str(t): n for t, n in self.below.items()}, 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.count, summary.min, summary.max, summary.sum = data['count'], data['min'], data['max'], data['sum']
+        summary.below = {int(t): n for t, n in data['below'].items()}
+        summary.sketch = KLLSketch.from_dict(data['sketch'])
+        return summary
+
+
+class RunningMoments:
+    """
+    Anzahl, Mittelwert und Standardabweichung (ddof=1, wie pandas) über Blöcke hinweg.
+    Blöcke werden nach Chan et al. zusammengeführt; fehlende Werte werden übersprungen.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        block = RunningMoments()
+        block.count = len(values)
+        block._mean = float(values.mean())
+        block._m2 = float(((values - block._mean) ** 2).sum())
+        self.merge(block)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._mean += delta * other.count / count
+        self._m2 += other._m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def mean(self):
+        return self._mean if self.count else float('nan')
+
+    @property
+    def std(self):
+        return float(np.sqrt(self._m2 / (self.count - 1))) if self.count > 1 else float('nan')
+
+
+def merge_histograms(histograms):
+    """Addiert Histogramme (Dictionary Wert -> Anzahl)."""
+    total = {}
+    for histogram in histograms:
+        for value, n in histogram.items():
+            total[value] = total.get(value, 0) + n
+    return total
+
+
+def histogram_quantile(histogram, q):
+    """Exaktes Quantil aus einem Histogramm, lineare Interpolation wie pandas.Series.quantile."""
+    values = np.array(sorted(histogram), dtype='float64')
+    counts = np.array([histogram[v] for v in sorted(histogram)])
+    n = counts.sum()
+    if n == 0:
+        return float('nan')
+    position = q * (n - 1)
+    cumulative = np.cumsum(counts)
+    lower = values[np.searchsorted(cumulative, np.floor(position), side='right')]
+    upper = values[np.searchsorted(cumulative, np.ceil(position), side='right')]
+    return float(lower + (upper - lower) * (position - np.floor(position)))
+
+
+class CountrySketches:
+    """Verteilungsskizzen eines Landes je Jahr: tender_value (ValueSummary) und duration_days (Histogramm)."""
+
+    def __init__(self, max_bids=MAX_BIDS):
+        self.max_bids = max_bids
+        self.values = {}
+        self.durations = {}
+
+    def update(self, df):
+        """Nimmt einen Block des analysebereiten Datensatzes auf."""
+        for year, group in df.groupby('year', sort=True):
+            year = int(year)
+            self.values.setdefault(year, ValueSummary()).update(group['tender_value'].to_numpy(dtype='float64'))
+            durations = group.loc[group['total_bids'] < self.max_bids, 'duration_days'].dropna().astype('int64')
+            counts = durations.value_counts()
+            self.durations[year] = merge_histograms([self.durations.get(year, {}),
+                                                     {int(d): int(n) for d, n in counts.items()}])
+
+    def value_summary(self, years=None):
+        """Zusammengeführte tender_value-Zähler der angegebenen (bzw. aller) Jahre."""
+        summary = ValueSummary()
+        for year, year_summary in sorted(self.values.items()):
+            if years is None or year in years:
+                summary.merge(year_summary)
+        return summary
+
+    def duration_histogram(self, years=None):
+        return merge_histograms(h for year, h in sorted(self.durations.items()) if years is None or year in years)
+
+    def to_dict(self):
+        return {'max_bids': self.max_bids,
+                'values': {str(y): s.to_dict() for y, s in self.values.items()},
+                'durations': {str(y): {str(d): n for d, n in h.items()} for y, h in self.durations.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls(max_bids=data['max_bids'])
+        sketches.values = {int(y): ValueSummary.from_dict(s) for y, s in data['values'].items()}
+        sketches.durations = {int(y): {int(d): n for d, n in h.items()} for y, h in data['durations'].items()}
+        return sketches
+
+
+def sketch_path(results_dir, country_name):
+    return os.path.join(results_dir, f'{country_name.lower()}_verteilung.json')
+
+
+def write_sketches(results_dir, country_name, sketches, data_file):
+    """Speichert die Skizzen eines Landes zusammen mit Größe und Änderungszeit des zugehörigen Datensatzes."""
+    stat = os.stat(data_file)
+    data = {'version': SKETCH_VERSION,
+            'data': {'file': os.path.basename(data_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+            **sketches.to_dict()}
+    with open(sketch_path(results_dir, country_name), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def load_sketches(results_dir, country_name, data_file):
+    """
+    Lädt die Skizzen eines Landes. Gibt None zurück, wenn keine vorhanden sind oder sie
+    nicht zum aktuellen Datensatz data_file gehören (dann muss aus den Daten gerechnet werden).
+    """
+    path = sketch_path(results_dir, country_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    stat = os.stat(data_file)
+    if (data.get('version') != SKETCH_VERSION
+            or data['data'] != {'file': os.path.basename(data_file), 'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns}):
+        return None
+    return CountrySketches.from_dict(data)
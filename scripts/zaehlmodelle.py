@@ -0,0 +1,531 @@
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+import patsy
+from scipy import sparse, stats
+from scipy.special import digamma, expit, gammaln, polygamma
+from statsmodels.base.model import LikelihoodModelResults
+from statsmodels.discrete import count_model
+from statsmodels.iolib.summary import Summary, summary_params
+
+from kovarianz import DEFAULT_CHUNK_ROWS, cov_description, sandwich_cov
+
+# --- Schnelle Schätzung des ZINB-Modells ---
+# Zero-Inflated Negative Binomial (NB2, Inflation logit) mit analytischer Score-Funktion und
+# Hesse-Matrix. Statt Nelder-Mead + BFGS (statsmodels bestimmt die Hesse-Matrix der ZINB numerisch)
+# werden gedämpfte Newton-Schritte (Levenberg-Marquardt, wirkt wie ein Vertrauensbereich) ab
+# Startwerten aus einer Poisson- und einer NB2-Schätzung verwendet. Parameterreihenfolge und
+# Ergebnisobjekt entsprechen statsmodels (inflate_*, Koeffizienten, alpha).
+
+# Abbruch, sobald das Newton-Dekrement (erwarteter Zuwachs der Log-Likelihood) darunter liegt
+DEFAULT_TOL = 1e-10
+DEFAULT_MAXITER = 100
+
+EPS = np.finfo(float).eps
+
+
+def nb2_derivatives(y, mu, alpha):
+    """
+    Log-Likelihood der NB2 je Beobachtung samt erster und zweiter Ableitungen nach dem
+    linearen Prädiktor eta = log(mu) und nach alpha (wie statsmodels NegativeBinomialP, p=2).
+    """
+    a = 1 / alpha
+    mu_a = mu + a
+    llf = (gammaln(y + a) - gammaln(y + 1) - gammaln(a) + a * np.log(a) + y * np.log(mu)
+           - (y + a) * np.log(mu_a))
+    d_eta = a * (y - mu) / mu_a
+    d_eta2 = -(y + a) * mu * a / mu_a ** 2
+    # Ableitungen nach a = 1/alpha, anschließend Kettenregel (da/dalpha = -a^2)
+    d_a = digamma(y + a) - digamma(a) + np.log(a) + 1 - np.log(mu_a) - (y + a) / mu_a
+    d_a2 = polygamma(1, y + a) - polygamma(1, a) + 1 / a - 1 / mu_a - (mu - y) / mu_a ** 2
+    d_alpha = -a ** 2 * d_a
+    d_alpha2 = a ** 4 * d_a2 + 2 * a ** 3 * d_a
+    d_eta_alpha = -a ** 2 * (y - mu) * mu / mu_a ** 2
+    return llf, d_eta, d_alpha, d_eta2, d_eta_alpha, d_alpha2
+
+
+def gram(X, weights):
+    """X' diag(weights) X als dichte Matrix, für dichtes oder dünn besetztes X."""
+    if sparse.issparse(X):
+        return (X.T @ X.multiply(weights[:, None]).tocsr()).toarray()
+    return (X * weights[:, None]).T @ X
+
+
+def cross_gram(Z, X, weights):
+    """Z' diag(weights) X für dichtes Z (Inflations-Design) und dichtes oder dünn besetztes X."""
+    return np.asarray(X.T @ (Z * weights[:, None])).T
+
+
+def score_matrix(X, weights):
+    """diag(weights) X als dichte Matrix (Score je Beobachtung), für dichtes oder dünn besetztes X."""
+    if sparse.issparse(X):
+        return X.multiply(weights[:, None]).toarray()
+    return X * weights[:, None]
+
+
+def zinb_derivatives(params, y, X, Z, hessian=True, score_obs=False):
+    """
+    Log-Likelihood, Score und (optional) Hesse-Matrix der ZINB (NB2, Inflation logit) für die
+    Parameter [inflate_*, Koeffizienten, alpha]. X darf eine scipy.sparse-Matrix sein. Mit score_obs
+    ist der Score die N x K-Matrix der Beiträge je Beobachtung (für Sandwich-Kovarianzen, blockweise).
+    """
+    k_infl = Z.shape[1]
+    gamma, beta, alpha = params[:k_infl], params[k_infl:-1], params[-1]
+    if alpha <= 0:
+        return -np.inf, None, None
+
+    w = np.clip(expit(Z @ gamma), EPS, 1 - EPS)
+    mu = np.exp(X @ beta)
+    llf_nb, d_eta, d_alpha, d_eta2, d_eta_alpha, d_alpha2 = nb2_derivatives(y, mu, alpha)
+
+    zero = y == 0
+    f0 = np.exp(llf_nb[zero])
+    w0 = w[zero]
+    prob0 = w0 + (1 - w0) * f0
+    # r: Wahrscheinlichkeit, dass eine Null aus der NB2 stammt (nicht aus der Inflation)
+    r = (1 - w0) * f0 / prob0
+
+    llf = np.where(zero, 0.0, np.log(1 - w) + llf_nb)
+    llf[zero] = np.log(prob0)
+
+    s_eta, s_alpha = d_eta.copy(), d_alpha.copy()
+    s_eta[zero] *= r
+    s_alpha[zero] *= r
+    s_zeta = -w
+    s_zeta[zero] = w0 * (1 - w0) * (1 - f0) / prob0
+    if score_obs:
+        score = np.column_stack([Z * s_zeta[:, None], score_matrix(X, s_eta), s_alpha])
+    else:
+        score = np.concatenate([Z.T @ s_zeta, X.T @ s_eta, [s_alpha.sum()]])
+    if not hessian:
+        return llf.sum(), score, None
+
+    h_eta2, h_eta_alpha, h_alpha2 = d_eta2.copy(), d_eta_alpha.copy(), d_alpha2.copy()
+    de0, da0 = d_eta[zero], d_alpha[zero]
+    h_eta2[zero] = r * d_eta2[zero] + r * (1 - r) * de0 ** 2
+    h_eta_alpha[zero] = r * d_eta_alpha[zero] + r * (1 - r) * de0 * da0
+    h_alpha2[zero] = r * d_alpha2[zero] + r * (1 - r) * da0 ** 2
+    h_zeta2 = -w * (1 - w)
+    h_zeta2[zero] = (w0 * (1 - w0) * (1 - f0) * ((1 - 2 * w0) * prob0 - w0 * (1 - w0) * (1 - f0))
+                     / prob0 ** 2)
+    cross = np.zeros_like(w)
+    cross[zero] = -w0 * (1 - w0) * f0 / prob0 ** 2
+    h_zeta_eta, h_zeta_alpha = cross.copy(), cross.copy()
+    h_zeta_eta[zero] *= de0
+    h_zeta_alpha[zero] *= da0
+
+    k = len(params)
+    hess = np.empty((k, k))
+    infl, main = slice(0, k_infl), slice(k_infl, k - 1)
+    hess[infl, infl] = (Z * h_zeta2[:, None]).T @ Z
+    hess[main, main] = gram(X, h_eta2)
+    hess[infl, main] = cross_gram(Z, X, h_zeta_eta)
+    hess[main, infl] = hess[infl, main].T
+    hess[infl, -1] = hess[-1, infl] = Z.T @ h_zeta_alpha
+    hess[main, -1] = hess[-1, main] = X.T @ h_eta_alpha
+    hess[-1, -1] = h_alpha2.sum()
+    return llf.sum(), score, hess
+
+
+def nb2_start_params(y, X, Z, maxiter=DEFAULT_MAXITER):
+    """
+    Startwerte der ZINB: Poisson (Newton ab einer KQ-Schätzung von log(y + 0.5)), dann NB2 (Newton ab
+    Poisson und Momentenschätzer für alpha), dann die Inflation aus dem Anteil zusätzlicher Nullen.
+    """
+    # Poisson
+    beta = np.linalg.lstsq(gram(X, np.ones(len(y))), X.T @ np.log(y + 0.5), rcond=None)[0]
+
+    def poisson(beta):
+        mu = np.exp(X @ beta)
+        return (y * np.log(mu) - mu).sum(), X.T @ (y - mu), -gram(X, mu)
+
+    beta, _ = newton(poisson, beta, maxiter=maxiter)
+
+    # NB2 (ohne Inflation)
+    mu = np.exp(X @ beta)
+    alpha = max(np.mean(((y - mu) ** 2 - y) / mu ** 2), 0.1)
+
+    def nb2(params):
+        beta, alpha = params[:-1], params[-1]
+        if alpha <= 0:
+            return -np.inf, None, None
+        llf, d_eta, d_alpha, d_eta2, d_eta_alpha, d_alpha2 = nb2_derivatives(y, np.exp(X @ beta), alpha)
+        hess = np.empty((len(params), len(params)))
+        hess[:-1, :-1] = gram(X, d_eta2)
+        hess[:-1, -1] = hess[-1, :-1] = X.T @ d_eta_alpha
+        hess[-1, -1] = d_alpha2.sum()
+        return llf.sum(), np.append(X.T @ d_eta, d_alpha.sum()), hess
+
+    params_nb2, _ = newton(nb2, np.append(beta, alpha), maxiter=maxiter)
+
+    # Inflation: Anteil der Nullen, den die NB2 nicht erklärt
+    mu = np.exp(X @ params_nb2[:-1])
+    f0 = (1 + params_nb2[-1] * mu) ** (-1 / params_nb2[-1])
+    share = np.clip((np.mean(y == 0) - f0.mean()) / (1 - f0.mean()), 0.01, 0.99)
+    gamma = np.linalg.lstsq(Z, np.full(len(y), np.log(share / (1 - share))), rcond=None)[0]
+    return np.concatenate([gamma, params_nb2])
+
+
+def binomial_derivatives(params, y, X, hessian=True, score_obs=False):
+    """
+    Quasi-Log-Likelihood des Fractional Logit (Binomial, Link logit) samt Score (mit score_obs je
+    Beobachtung) und Hesse-Matrix.
+    """
+    mu = np.clip(expit(X @ params), EPS, 1 - EPS)
+    # wie statsmodels Binomial (n = 1) inkl. der Gamma-Terme für Anteile
+    llf = (gammaln(2) - gammaln(y + 1) - gammaln(2 - y) + y * np.log(mu) + (1 - y) * np.log(1 - mu)).sum()
+    score = score_matrix(X, y - mu) if score_obs else X.T @ (y - mu)
+    return llf, score, -gram(X, mu * (1 - mu)) if hessian else None
+
+
+def inverse_neg_hessian(hess):
+    """Kovarianz aus der Hesse-Matrix (wie statsmodels: nur bei positiv definitem -H, sonst None)."""
+    eigvals, eigvecs = np.linalg.eigh(-hess)
+    if not np.all(np.isfinite(eigvals)) or eigvals.min() <= 0:
+        return None
+    cov = (eigvecs / eigvals) @ eigvecs.T
+    return (cov + cov.T) / 2
+
+
+def fit_info(llf, score, hess, info, start, start_seconds, start_time, nobs):
+    """Konvergenzdiagnose im Format von statsmodels' mle_retvals (plus Score-Maximum und Laufzeit)."""
+    return {
+        'fopt': -llf / nobs,
+        'iterations': info['iterations'],
+        'score': score / nobs,
+        'Hessian': hess / nobs,
+        'converged': info['converged'],
+        'score_max': float(np.abs(score).max()),
+        'newton_decrement': info['decrement'],
+        'start': start,
+        'start_seconds': start_seconds,
+        'seconds': time.time() - start_time,
+    }
+
+
+class ZeroInflatedNegativeBinomialP(count_model.ZeroInflatedNegativeBinomialP):
+    """
+    Ersatz für statsmodels' ZeroInflatedNegativeBinomialP (Standard hier: p=2, Inflation logit) mit
+    analytischer Hesse-Matrix. Log-Likelihood, Vorhersagen und Ergebnisobjekt (samt summary()) sind
+    die von statsmodels; fit_newton schätzt das Modell mit gedämpften Newton-Schritten.
+    """
+
+    def __init__(self, endog, exog, exog_infl=None, **kwargs):
+        kwargs.setdefault('inflation', 'logit')
+        kwargs.setdefault('p', 2)
+        super().__init__(endog, exog, exog_infl=exog_infl, **kwargs)
+
+    def derivatives(self, params, hessian=True):
+        """Log-Likelihood, Score und (optional) Hesse-Matrix in einem Durchlauf."""
+        return zinb_derivatives(params, self.endog, self.exog, self.exog_infl, hessian=hessian)
+
+    def _analytic(self):
+        return self.inflation == 'logit' and self.model_main.parameterization == 2
+
+    def score(self, params):
+        if not self._analytic():
+            return super().score(params)
+        return self.derivatives(np.asarray(params, dtype='float64'), hessian=False)[1]
+
+    def hessian(self, params):
+        if not self._analytic():
+            return super().hessian(params)
+        return self.derivatives(np.asarray(params, dtype='float64'))[2]
+
+    def start_params_nb2(self, maxiter=DEFAULT_MAXITER):
+        """Startwerte aus Poisson und NB2 (siehe nb2_start_params)."""
+        return nb2_start_params(self.endog, self.exog, self.exog_infl, maxiter=maxiter)
+
+    def fit_newton(self, start_params=None, maxiter=DEFAULT_MAXITER, tol=DEFAULT_TOL, cov_type='nonrobust',
+                   cov_kwds=None, start_name='vorgegeben'):
+        """
+        Schätzt das Modell mit gedämpften Newton-Schritten und gibt ein statsmodels-Ergebnis
+        (ZeroInflatedNegativeBinomialResults) zurück. Die Diagnose (Iterationen, Konvergenz,
+        max. |Score|, Newton-Dekrement, Laufzeit) steht in result.mle_retvals; start_name benennt
+        vorgegebene Startwerte darin. cov_type 'HC0' oder 'cluster' berechnet die Sandwich-Kovarianz
+        blockweise (robust_cov) statt mit statsmodels.
+        """
+        if not self._analytic():
+            raise ValueError("fit_newton unterstützt nur NB2 (p=2) mit Inflation 'logit'")
+        start_time = time.time()
+        start = 'NB2' if start_params is None else start_name
+        if start_params is None:
+            start_params = self.start_params_nb2(maxiter)
+        start_params = np.asarray(start_params, dtype='float64')
+        start_seconds = time.time() - start_time
+        params, info = newton(self.derivatives, start_params, maxiter=maxiter, tol=tol)
+
+        llf, score, hess = self.derivatives(params)
+        mlefit = LikelihoodModelResults(self, params, inverse_neg_hessian(hess), scale=1.)
+        mlefit.mle_retvals = fit_info(llf, score, hess, info, start, start_seconds, start_time, len(self.endog))
+        mlefit.mle_settings = {'optimizer': 'newton', 'start_params': start_params, 'maxiter': maxiter,
+                               'tol': tol}
+        result = self.result_class_wrapper(self.result_class(self, mlefit))
+        result._get_robustcov_results(cov_type='nonrobust', use_self=True, use_t=None)
+        if cov_type != 'nonrobust':
+            def chunk_derivatives(rows):
+                _, scores, hess_chunk = zinb_derivatives(params, self.endog[rows], self.exog[rows],
+                                                         self.exog_infl[rows], score_obs=True)
+                return hess_chunk, scores
+
+            set_cov(result, robust_cov(None, cov_type, cov_kwds, chunk_derivatives, len(self.endog), len(params)),
+                    cov_type, cov_kwds)
+        return result
+
+
+def newton(derivatives, params, maxiter=DEFAULT_MAXITER, tol=DEFAULT_TOL):
+    """
+    Maximiert eine Log-Likelihood mit gedämpften Newton-Schritten. derivatives(params) liefert
+    Log-Likelihood, Score und Hesse-Matrix. Ist -H nicht positiv definit oder steigt die
+    Log-Likelihood nicht, wird die Diagonale verstärkt (Levenberg-Marquardt), bis der Schritt gelingt.
+    Gibt die Parameter und ein Dictionary mit Iterationen, Konvergenz und Newton-Dekrement zurück.
+    """
+    params = np.asarray(params, dtype='float64')
+    llf, score, hess = derivatives(params)
+    damping = 0.0
+    decrement = np.inf
+    for iteration in range(1, maxiter + 1):
+        neg_hess = -hess
+        scale = np.maximum(np.abs(np.diag(neg_hess)), 1e-12)
+        while True:
+            try:
+                chol = np.linalg.cholesky(neg_hess + damping * np.diag(scale))
+                step = np.linalg.solve(chol.T, np.linalg.solve(chol, score))
+            except np.linalg.LinAlgError:
+                damping = max(damping * 10, 1e-6)
+                continue
+            new_params = params + step
+            new_llf = derivatives(new_params)[0] if np.all(np.isfinite(new_params)) else -np.inf
+            if np.isfinite(new_llf) and new_llf >= llf - 1e-12 * abs(llf):
+                break
+            damping = max(damping * 10, 1e-6)
+            if damping > 1e12:
+                return params, {'iterations': iteration, 'converged': False, 'decrement': decrement}
+        decrement = float(score @ step)
+        params = new_params
+        llf, score, hess = derivatives(params)
+        damping = damping / 10 if damping > 1e-6 else 0.0
+        if decrement < tol:
+            return params, {'iterations': iteration, 'converged': True, 'decrement': decrement}
+    return params, {'iterations': maxiter, 'converged': False, 'decrement': decrement}
+
+
+# --- Dünn besetzte Designmatrizen ---
+# patsy.dmatrices erzeugt ein dichtes N x K float64-Design, obwohl die Dummy-Blöcke (Jahr, Verfahren,
+# Kategorie, Land und Interaktionen) fast nur Nullen enthalten. sparse_dmatrices baut das Design
+# blockweise und speichert es als CSR-Matrix; dicht ist dabei höchstens ein Block von chunk_rows Zeilen.
+# fit_zinb_sparse und fit_glm_sparse schätzen direkt auf dieser Matrix.
+
+DEFAULT_DESIGN_ROWS = 250_000
+
+
+def sparse_dmatrices(formula, data, chunk_rows=DEFAULT_DESIGN_ROWS):
+    """
+    Wie patsy.dmatrices, aber mit dünn besetztem Design: gibt y (1-D), X (scipy.sparse CSR) und den
+    Bauplan von X (design_info, für Vorhersagen) zurück. Die Ausprägungen der Faktoren werden in
+    einem ersten Durchlauf über alle Blöcke bestimmt (patsy.incr_dbuilders).
+    """
+    def chunks():
+        return (data.iloc[start:start + chunk_rows] for start in range(0, len(data), chunk_rows))
+
+    y_info, x_info = patsy.incr_dbuilders(formula, chunks)
+    y_parts, x_parts = [], []
+    for chunk in chunks():
+        y_chunk, x_chunk = patsy.build_design_matrices([y_info, x_info], chunk)
+        y_parts.append(np.asarray(y_chunk)[:, 0])
+        x_parts.append(sparse.csr_matrix(np.asarray(x_chunk)))
+    return np.concatenate(y_parts), sparse.vstack(x_parts, format='csr'), x_info
+
+
+class ModelResults:
+    """
+    Schlankes Modellergebnis (fit_zinb_sparse, fit_glm_sparse oder geladenes Modellartefakt, siehe
+    modellablage.py): Koeffizienten, Kovarianz, Log-Likelihood, Konvergenzdiagnose (mle_retvals) und
+    Bauplan des Designs. summary() liefert Kopf- und Koeffiziententabelle im Format von statsmodels.
+    """
+
+    def __init__(self, model_name, yname, params, cov, llf, nobs, mle_retvals, design_info, cov_type='nonrobust',
+                 infl_columns=None, method='Newton (dünn)'):
+        self.model_name = model_name
+        self.method = method
+        self.yname = yname
+        self.params = params
+        self.cov_params_default = cov
+        self.llf = llf
+        self.nobs = nobs
+        self.mle_retvals = mle_retvals
+        self.design_info = design_info
+        self.cov_type = cov_type
+        self.infl_columns = infl_columns or []
+        # nur bei geladenen Modellartefakten: Normierungskonstanten und Schlüssel
+        self.constants = None
+        self.key = None
+
+    def cov_params(self):
+        return self.cov_params_default
+
+    @property
+    def bse(self):
+        return pd.Series(np.sqrt(np.diag(self.cov_params_default)), index=self.params.index)
+
+    @property
+    def tvalues(self):
+        return self.params / self.bse
+
+    @property
+    def pvalues(self):
+        return pd.Series(2 * stats.norm.sf(np.abs(self.tvalues)), index=self.params.index)
+
+    def conf_int(self, alpha=0.05):
+        q = stats.norm.ppf(1 - alpha / 2)
+        return pd.DataFrame({0: self.params - q * self.bse, 1: self.params + q * self.bse})
+
+    def predict(self, data):
+        """Erwartungswert für neue Daten (DataFrame); das Design entsteht aus dem Bauplan der Schätzung."""
+        X = np.asarray(patsy.build_design_matrices([self.design_info], data)[0])
+        k_infl = len(self.infl_columns)
+        if not k_infl:
+            return expit(X @ self.params.to_numpy())
+        gamma, beta = self.params.to_numpy()[:k_infl], self.params.to_numpy()[k_infl:-1]
+        w = expit(data[self.infl_columns].to_numpy(dtype='float64') @ gamma)
+        return (1 - w) * np.exp(X @ beta)
+
+    def summary(self, alpha=0.05):
+        df_model = len(self.params) - len(self.infl_columns) - (2 if self.infl_columns else 1)
+        smry = Summary()
+        left = [('Dep. Variable:', [self.yname]), ('Model:', [self.model_name]), ('Method:', [self.method]),
+                ('Date:', None), ('Time:', None), ('converged:', [str(self.mle_retvals['converged'])])]
+        right = [('No. Observations:', [str(self.nobs)]), ('Df Residuals:', [str(self.nobs - df_model - 1)]),
+                 ('Df Model:', [str(df_model)]), ('Log-Likelihood:', ['%#8.5g' % self.llf]),
+                 ('No. Iterations:', [str(self.mle_retvals['iterations'])]), ('Covariance Type:', [self.cov_type])]
+        smry.add_table_2cols(self, gleft=left, gright=right, yname=self.yname, xname=list(self.params.index),
+                             title=f'{self.model_name} Regression Results')
+        smry.tables.append(summary_params((self, self.params, self.bse, self.tvalues, self.pvalues,
+                                           self.conf_int(alpha)), yname=self.yname,
+                                          xname=list(self.params.index), alpha=alpha, use_t=False))
+        return smry
+
+
+def robust_cov(cov, cov_type, cov_kwds, chunk_derivatives, nobs, k_params, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Kovarianz nach cov_type: 'nonrobust' (cov), 'HC0' oder 'cluster' (cov_kwds['groups']), blockweise."""
+    if cov_type == 'nonrobust':
+        return cov
+    if cov_type == 'HC0':
+        return sandwich_cov(chunk_derivatives, nobs, k_params, chunk_rows=chunk_rows)
+    if cov_type == 'cluster':
+        return sandwich_cov(chunk_derivatives, nobs, k_params, groups=cov_kwds['groups'], chunk_rows=chunk_rows)
+    raise ValueError(f"Unbekannter cov_type: {cov_type}")
+
+
+def set_cov(result, cov, cov_type, cov_kwds=None):
+    """
+    Setzt eine blockweise berechnete Kovarianz in ein statsmodels-Ergebnis: cov_params(), bse, pvalues
+    und summary() verwenden danach sie; zwischengespeicherte abgeleitete Größen werden verworfen.
+    """
+    results = getattr(result, '_results', result)
+    results.cov_params_default = cov
+    results.cov_type = cov_type
+    groups = (cov_kwds or {}).get('groups')
+    results.cov_kwds = {'description': f"Standardfehler {cov_description(cov_type, groups)}, blockweise berechnet "
+                                       f"(kovarianz.py)"}
+    results._cache = {}
+
+
+def robust_glm_cov(result, cov_type, cov_kwds=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Ersetzt die modellbasierte Kovarianz eines statsmodels-GLM (Binomial, Link logit, mit cov_type
+    'nonrobust' geschätzt) durch die nach cov_type, blockweise wie in fit_glm_sparse. statsmodels
+    bildet für 'HC0' und 'cluster' die volle N x K-Matrix der Scores.
+    """
+    if cov_type == 'nonrobust':
+        return result
+    params = np.asarray(result.params, dtype='float64')
+    y, X = result.model.endog, result.model.exog
+
+    def chunk_derivatives(rows):
+        _, scores, hess_chunk = binomial_derivatives(params, y[rows], X[rows], score_obs=True)
+        return hess_chunk, scores
+
+    set_cov(result, robust_cov(None, cov_type, cov_kwds, chunk_derivatives, len(y), len(params), chunk_rows),
+            cov_type, cov_kwds)
+    return result
+
+
+def statsmodels_cov(result, cov_type, cov_kwds=None):
+    """
+    Kovarianz nach cov_type, wie statsmodels sie für ein statsmodels-Ergebnis (fit_newton, GLM)
+    berechnet; nur zur Kontrolle von set_cov/robust_glm_cov (bildet die volle N x K-Matrix der Scores).
+    """
+    check = copy.copy(getattr(result, '_results', result))
+    check._cache = {}
+    check._get_robustcov_results(cov_type=cov_type, use_self=True, use_t=None, **(cov_kwds or {}))
+    return np.asarray(check.cov_params())
+
+
+def fit_zinb_sparse(y, X, Z, design_info, yname='total_bids', infl_columns=('const',), start_params=None,
+                    start_name='vorgegeben', cov_type='nonrobust', cov_kwds=None, maxiter=DEFAULT_MAXITER,
+                    tol=DEFAULT_TOL):
+    """
+    ZINB (NB2, Inflation logit) auf dünn besetztem (aus sparse_dmatrices) oder dichtem Design X und dichtem
+    Inflations-Design Z. Startwerte, Newton-Verfahren und Kovarianz wie fit_newton; start_name benennt
+    vorgegebene Startwerte in der Diagnose (z. B. 'Hauptmodell'). cov_type 'HC0' oder 'cluster' (mit
+    cov_kwds={'groups': ...}) berechnet die Sandwich-Kovarianz blockweise (kovarianz.py).
+    """
+    start_time = time.time()
+    start = 'NB2' if start_params is None else start_name
+    if start_params is None:
+        start_params = nb2_start_params(y, X, Z, maxiter=maxiter)
+    start_seconds = time.time() - start_time
+
+    def derivatives(params):
+        return zinb_derivatives(params, y, X, Z)
+
+    params, info = newton(derivatives, np.asarray(start_params, dtype='float64'), maxiter=maxiter, tol=tol)
+    llf, score, hess = derivatives(params)
+
+    def chunk_derivatives(rows):
+        _, scores, hess_chunk = zinb_derivatives(params, y[rows], X[rows], Z[rows], score_obs=True)
+        return hess_chunk, scores
+
+    cov = robust_cov(inverse_neg_hessian(hess), cov_type, cov_kwds, chunk_derivatives, len(y), len(params))
+    names = [f'inflate_{column}' for column in infl_columns] + design_info.column_names + ['alpha']
+    return ModelResults('ZeroInflatedNegativeBinomialP', yname, pd.Series(params, index=names), cov, llf, len(y),
+                        fit_info(llf, score, hess, info, start, start_seconds, start_time, len(y)),
+                        design_info, cov_type=cov_type, infl_columns=list(infl_columns))
+
+
+def fit_glm_sparse(y, X, design_info, yname='sme_share_safe', cov_type='nonrobust', start_params=None,
+                   start_name='vorgegeben', cov_kwds=None, maxiter=DEFAULT_MAXITER, tol=DEFAULT_TOL):
+    """
+    Fractional Logit (GLM Binomial, Link logit) auf dünn besetztem oder dichtem Design; cov_type 'nonrobust',
+    'HC0' oder 'cluster' (cov_kwds={'groups': ...}), siehe fit_zinb_sparse. Ohne start_params ab dem Nullvektor.
+    """
+    start_time = time.time()
+    start = 'Nullvektor' if start_params is None else start_name
+    if start_params is None:
+        start_params = np.zeros(X.shape[1])
+
+    def derivatives(params):
+        return binomial_derivatives(params, y, X)
+
+    params, info = newton(derivatives, np.asarray(start_params, dtype='float64'), maxiter=maxiter, tol=tol)
+    llf, score, hess = derivatives(params)
+
+    def chunk_derivatives(rows):
+        _, scores, hess_chunk = binomial_derivatives(params, y[rows], X[rows], score_obs=True)
+        return hess_chunk, scores
+
+    cov = robust_cov(inverse_neg_hessian(hess), cov_type, cov_kwds, chunk_derivatives, len(y), len(params))
+    return ModelResults('GLM', yname, pd.Series(params, index=design_info.column_names), cov, llf, len(y),
+                        fit_info(llf, score, hess, info, start, 0.0, start_time, len(y)), design_info,
+                        cov_type=cov_type)
+
+
+def diagnostics(result):
+    """Einzeilige Konvergenzdiagnose eines mit fit_newton, fit_zinb_sparse oder fit_glm_sparse geschätzten Modells."""
+    info = result.mle_retvals
+    return (f"Konvergenz: {'ja' if info['converged'] else 'NEIN'} nach {info['iterations']} Newton-Schritten "
+            f"(max. |Score| = {info['score_max']:.1e}, Newton-Dekrement = {info['newton_decrement']:.1e}, "
+            f"Startwerte: {info['start']}, {info['seconds']:.2f} Sekunden)")